@@ -1,16 +1,56 @@
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify
 from flask_cors import CORS
+from functools import wraps
+import hmac
 import json
+import logging
+import math
 import os
+import time
 from dotenv import load_dotenv
+import metrics
+from service_recommender import ServiceRecommender
+from snapshot import is_snapshot
+from result_cache import RecommendationCache
+from event_log import EventLog, InteractionIngestor, event_error
 
 app = Flask(__name__)
-# Enable CORS with more explicit settings
-CORS(app, resources={r"/api/*": {"origins": "*"}})
 
 # Load environment variables
 load_dotenv()
 
+# Model rebuilds and the profiler toggle change what every client is served.
+# They need ADMIN_TOKEN (sent as "Authorization: Bearer <token>"), are not
+# served at all without one, and get no CORS headers so browsers on other
+# origins cannot call them.
+admin_token = os.getenv('ADMIN_TOKEN') or None
+
+# Enable CORS for every public route
+CORS(app, resources={r"/api/(?!model/|metrics/profiler)": {"origins": "*"}})
+
+# Leveled logging; per-request messages are DEBUG so they cost nothing at the default level
+logging.basicConfig(
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Stage timers and request histograms (METRICS_ENABLED=false turns them off)
+metrics.enable(os.getenv('METRICS_ENABLED', 'true').lower() == 'true')
+REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    'http_request_duration_seconds', 'Request latency by route', ('route', 'method', 'status'))
+REQUESTS = metrics.REGISTRY.counter('http_requests_total', 'Requests by route', ('route', 'method', 'status'))
+
+# Set by wsgi.py: a prefork server (gunicorn) imports the app once in its
+# master and forks the workers from it, so threads are started per worker by
+# start_worker() and the workers share the interaction log
+prefork = os.getenv('PREFORK', 'false').lower() == 'true'
+
+# Sampling profiler, off unless PROFILER_ENABLED=true or toggled through /api/metrics/profiler
+profiler = metrics.SamplingProfiler(float(os.getenv('PROFILER_INTERVAL', metrics.PROFILER_INTERVAL)))
+if os.getenv('PROFILER_ENABLED', 'false').lower() == 'true' and not prefork:
+    profiler.start()
+
 # Create mock data for testing
 mock_data = {
     "cards": [
@@ -26,67 +66,510 @@ mock_data = {
     ]
 }
 
-# Mock user profiles for testing
-user_profiles = {}
+# Shared recommender backing every endpoint, started from the model
+# snapshot when there is one
+model_snapshot_dir = os.getenv('MODEL_SNAPSHOT_DIR')
+recommender = ServiceRecommender()
+if not (model_snapshot_dir and is_snapshot(model_snapshot_dir) and recommender.load_model(model_snapshot_dir)):
+    recommender.load_data(mock_data["cards"], [], mock_data["gigs"])
+
+# Serialized recommendation responses, validated by profile version
+recommendation_cache = RecommendationCache(
+    max_entries=int(os.getenv('RECOMMENDATION_CACHE_ENTRIES', 50000)),
+    max_bytes=int(os.getenv('RECOMMENDATION_CACHE_BYTES', 32 * 1024 * 1024)),
+    ttl=float(os.getenv('RECOMMENDATION_CACHE_TTL', 300))
+)
+recommender.add_catalog_listener(recommendation_cache.invalidate_gigs)
+
+def invalidate_users(user_ids):
+    """Drop cached responses for users whose profiles changed"""
+    for user_id in user_ids:
+        recommendation_cache.invalidate_user(user_id)
+
+# Profile and interaction writes go through an append-only log, replayed
+# here so profiles survive restarts. Prefork workers all append to it and
+# fold it back in log order, so a write to any worker reaches every worker.
+interaction_log = EventLog(
+    os.getenv('INTERACTION_LOG_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'interactions')),
+    segment_bytes=int(os.getenv('INTERACTION_LOG_SEGMENT_BYTES', 64 * 1024 * 1024)),
+    fsync=os.getenv('INTERACTION_LOG_FSYNC', 'false').lower() == 'true',
+    shared=prefork
+)
+ingestor = InteractionIngestor(recommender, interaction_log, on_apply=invalidate_users)
+# A snapshot already contains the events logged before it was taken
+logger.info("Replayed %d logged events", ingestor.replay(recommender.snapshot_metadata.get('event_log_position')))
+recommender.prepare_for_serving()
+
+# Per-user top-N precomputed offline (python service_recommender.py precompute),
+# mapped read-only so prefork workers share its pages. Loaded after every
+# startup step that changes the scoring fingerprint; the precompute job runs
+# the same steps, so a table it built from MODEL_SNAPSHOT_DIR matches.
+recommendation_table_dir = os.getenv('RECOMMENDATION_TABLE_DIR')
+if recommendation_table_dir and is_snapshot(recommendation_table_dir):
+    recommender.load_recommendation_table(recommendation_table_dir)
+if not prefork:
+    ingestor.start()
+
+def start_worker():
+    """Start the background threads of a forked worker (threads do not survive fork)"""
+    ingestor.start()
+    if os.getenv('PROFILER_ENABLED', 'false').lower() == 'true':
+        profiler.start()
+
+def log_default_profiles(user_ids):
+    """
+    Create default profiles for unknown users through the interaction log
+    
+    Recommendation requests create a profile for users they do not know. In
+    prefork mode that has to go through the log too, or only the worker that
+    served the request would have the profile and later interactions would
+    change it there alone.
+    """
+    unknown = list(dict.fromkeys(user_id for user_id in user_ids if user_id not in recommender.user_profiles))
+    if unknown:
+        ingestor.apply([{"type": "profile", "user_id": user_id, "name": f"User {user_id}"} for user_id in unknown])
+
+def admin_only(route):
+    """Serve a route only to requests carrying ADMIN_TOKEN (404 when it is not set)"""
+    @wraps(route)
+    def checked(*args, **kwargs):
+        if admin_token is None:
+            return jsonify({"error": "Not found"}), 404
+        credentials = request.headers.get('Authorization', '').encode()
+        if not hmac.compare_digest(credentials, f"Bearer {admin_token}".encode()):
+            return jsonify({"error": "Admin token required"}), 401
+        return route(*args, **kwargs)
+    return checked
+
+def gigs_body(key, gigs, **fields):
+    """
+    Serialize {"status": "success", key: gigs} for a gig list returned by the
+    recommender, splicing each gig's cached JSON instead of encoding it again
+    (see ColumnTable.to_json). Keyword arguments are per-gig fields to add.
+    """
+    return f'{{"status":"success",{json.dumps(key)}:{gigs.to_json(**fields)}}}'
+
+def json_response(body):
+    """Wrap serialized JSON in a response, as jsonify would"""
+    return app.response_class(body + "\n", mimetype=app.json.mimetype)
+
+metrics.REGISTRY.gauge('recommender_users', 'User profiles', lambda: len(recommender.user_profiles))
+metrics.REGISTRY.gauge('recommender_gigs', 'Loaded gig rows', lambda: len(recommender.gigs))
+metrics.REGISTRY.gauge('interaction_events_pending', 'Logged events not yet folded', ingestor.pending)
+metrics.REGISTRY.gauge('recommendation_cache_entries', 'Cached responses',
+                       lambda: recommendation_cache.stats()['entries'])
+metrics.REGISTRY.gauge('recommendation_cache_bytes', 'Bytes of cached responses',
+                       lambda: recommendation_cache.stats()['bytes'])
+metrics.REGISTRY.gauge('recommendation_cache_hit_ratio', 'Share of cache lookups that hit',
+                       lambda: recommendation_cache.stats()['hit_ratio'])
+metrics.REGISTRY.gauge('profiler_samples', 'Samples taken by the sampling profiler', lambda: profiler.samples)
+
+@app.before_request
+def start_request_timer():
+    if metrics.enabled():
+        g.request_start = time.perf_counter()
+
+@app.before_request
+def catch_up_with_other_workers():
+    # Fold what other workers logged, so every request sees all acknowledged writes
+    if prefork:
+        ingestor.catch_up()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        # The route template, not the path, keeps label cardinality bounded
+        labels = (request.url_rule.rule if request.url_rule else 'unmatched', request.method, str(response.status_code))
+        REQUEST_SECONDS.observe(time.perf_counter() - start, labels)
+        REQUESTS.inc(labels)
+    return response
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Simple health check endpoint"""
-    print("Health check endpoint accessed")
+    logger.debug("Health check endpoint accessed")
     return jsonify({"status": "ok"})
 
 @app.route('/api/recommendations/<user_id>', methods=['GET'])
 def get_recommendations(user_id):
-    """Get recommendations for a user"""
-    print(f"Recommendations requested for user: {user_id}")
+    """
+    Get recommendations for a user
+    
+    Optional filters, applied before scoring: category (repeatable),
+    min_price, max_price, min_star and exclude_seller (repeatable).
+    """
+    logger.debug("Recommendations requested for user: %s", user_id)
+    
+    n = request.args.get('n', 5, type=int)
+    price_sensitivity = request.args.get('price_sensitivity', 0.5, type=float)
+    include_history = request.args.get('include_history', 'false').lower() == 'true'
+    cf_weight = request.args.get('cf_weight', 0.0, type=float)
+    scoring = request.args.get('scoring', 'content')
+    if scoring not in ('content', 'als'):
+        return jsonify({"error": "scoring must be 'content' or 'als'"}), 400
+    filters = {
+        "categories": tuple(sorted(set(request.args.getlist('category')))) or None,
+        "min_price": request.args.get('min_price', type=float),
+        "max_price": request.args.get('max_price', type=float),
+        "min_star": request.args.get('min_star', type=float),
+        "exclude_sellers": tuple(sorted(set(request.args.getlist('exclude_seller')))) or None
+    }
+    
+    if prefork:
+        log_default_profiles([user_id])
+    
+    # Serve repeat requests straight from the cache. Both versions are read
+    # before scoring, so a write landing meanwhile keeps the result out of it
+    cache_key = (user_id, n, price_sensitivity, include_history, cf_weight, scoring) + tuple(filters.values())
+    catalog_generation = recommendation_cache.catalog_generation
+    version = recommender.profile_version(user_id)
+    body = recommendation_cache.get(cache_key, version)
+    if body is None:
+        recommendations = recommender.get_user_recommendations(
+            user_id,
+            n=n,
+            include_history=include_history,
+            price_sensitivity=price_sensitivity,
+            cf_weight=cf_weight,
+            scoring=scoring,
+            **filters
+        )
+        explanations = [recommender.explain_recommendation(user_id, gig["id"]) for gig in recommendations]
+        
+        with metrics.stage('response_serialization'):
+            body = gigs_body("recommendations", recommendations, explanation=explanations)
+        # Unknown users (version 0) get a profile created by this request;
+        # their next request caches under its version
+        if version:
+            recommendation_cache.put(
+                cache_key,
+                version,
+                body,
+                gig_ids=[gig["id"] for gig in recommendations],
+                catalog_generation=catalog_generation
+            )
+    
+    return json_response(body)
+
+@app.route('/api/recommendations/cache', methods=['GET'])
+def get_recommendation_cache_stats():
+    """Report recommendation cache hit ratio, evictions and size"""
+    return jsonify(recommendation_cache.stats())
+
+@app.route('/api/recommendations/batch', methods=['POST'])
+def get_recommendations_batch():
+    """Get recommendations for many users in one request"""
+    data = request.get_json()
+    
+    if not isinstance(data, dict) or not isinstance(data.get('user_ids'), list):
+        return jsonify({"error": "Missing user_ids"}), 400
+    
+    user_ids = data['user_ids']
+    if not all(isinstance(user_id, (str, int)) and not isinstance(user_id, bool) for user_id in user_ids):
+        return jsonify({"error": "user_ids must be strings or integers"}), 400
+    n = data.get('n', 5)
+    if not isinstance(n, int) or isinstance(n, bool):
+        return jsonify({"error": "n must be an integer"}), 400
+    weights = {name: data.get(name, default) for name, default in (('price_sensitivity', 0.5), ('cf_weight', 0.0))}
+    for name, value in weights.items():
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or not math.isfinite(value):
+            return jsonify({"error": f"{name} must be a finite number"}), 400
+    scoring = data.get('scoring', 'content')
+    if scoring not in ('content', 'als'):
+        return jsonify({"error": "scoring must be 'content' or 'als'"}), 400
+    logger.debug("Batch recommendations requested for %d users", len(user_ids))
+    if prefork:
+        log_default_profiles(user_ids)
+    
+    results = recommender.get_recommendations_batch(
+        user_ids,
+        n=n,
+        include_history=bool(data.get('include_history', False)),
+        price_sensitivity=float(weights['price_sensitivity']),
+        cf_weight=float(weights['cf_weight']),
+        scoring=scoring
+    )
+    
+    users = ','.join(f'{{"user_id":{json.dumps(user_id)},"recommendations":{recommendations.to_json()}}}'
+                     for user_id, recommendations in zip(user_ids, results))
+    return json_response(f'{{"status":"success","recommendations":[{users}]}}')
+
+@app.route('/api/trending', methods=['GET'])
+def get_trending_gigs():
+    """Get the gigs with the most recent interactions"""
+    trending = recommender.get_trending_gigs(
+        n=request.args.get('n', 5, type=int),
+        category=request.args.get('category')
+    )
+    
+    return json_response(gigs_body("trending", trending))
+
+@app.route('/api/gigs/<gig_id>/similar', methods=['GET'])
+def get_similar_gigs(gig_id):
+    """Get gigs with descriptions similar to a gig"""
+    logger.debug("Similar gigs requested for gig: %s", gig_id)
     
-    # Add mock explanations to gigs
-    recommendations = []
-    for gig in mock_data["gigs"]:
-        gig_copy = gig.copy()
-        gig_copy["explanation"] = "This matches your interests."
-        recommendations.append(gig_copy)
+    # Gig ids in the catalog are numeric; fall back to the raw string
+    try:
+        gig_id = int(gig_id)
+    except ValueError:
+        pass
+    
+    similar = recommender.similar_gigs(gig_id, k=request.args.get('k', 5, type=int))
+    if similar is None:
+        return jsonify({"error": "Gig not found"}), 404
+    
+    return json_response(gigs_body("similar", similar))
+
+@app.route('/api/search', methods=['GET'])
+def search_gigs():
+    """
+    Full-text gig search ranked by BM25
+    
+    Query parameters: q (required), n, user_id (re-rank by the user's
+    category preferences), personalization and prefix (treat the last word
+    as incomplete, default true).
+    """
+    query = request.args.get('q', '')
+    if not query.strip():
+        return jsonify({"error": "Missing q"}), 400
+    logger.debug("Search requested: %s", query)
+    
+    results = recommender.search_gigs(
+        query,
+        n=request.args.get('n', 10, type=int),
+        user_id=request.args.get('user_id'),
+        personalization=request.args.get('personalization', 0.5, type=float),
+        prefix=request.args.get('prefix', 'true').lower() == 'true'
+    )
+    
+    return json_response(gigs_body("results", results))
+
+@app.route('/api/search/autocomplete', methods=['GET'])
+def autocomplete():
+    """Suggest search words starting with q"""
+    suggestions = recommender.autocomplete(request.args.get('q', ''), k=request.args.get('k', 8, type=int))
     
     return jsonify({
         "status": "success",
-        "recommendations": recommendations
+        "suggestions": suggestions
     })
 
 @app.route('/api/user_profile', methods=['POST'])
 def create_user_profile():
-    """Create or update a user profile"""
+    """
+    Create or update a user profile
+    
+    Preferences are keyed by category name; a request naming a category the
+    catalog does not have is rejected with 400 and the unknown names, rather
+    than stored without them.
+    """
     data = request.get_json()
-    print(f"User profile creation request: {data}")
+    logger.debug("User profile creation request: %s", data)
     
-    if not data or 'user_id' not in data:
+    if not isinstance(data, dict) or 'user_id' not in data:
         return jsonify({"error": "Missing user_id"}), 400
     
     user_id = data['user_id']
-    user_profiles[user_id] = {
+    event = {
+        "type": "profile",
+        "user_id": user_id,
         "name": data.get('name', f"User {user_id}"),
         "preferences": data.get('preferences', {}),
         "history": data.get('history', [])
     }
+    # Checked before logging: a logged event is replayed at every start
+    error = event_error(event)
+    if error is None and not isinstance(event['preferences'], dict):
+        # The log accepts null preferences (no change); a request must send an object
+        error = "preferences must map category names to numbers"
+    if error is not None:
+        return jsonify({"error": error}), 400
+    unknown = [category for category in event['preferences'] if category not in recommender.category_mapping]
+    if unknown:
+        return jsonify({"error": "Unknown categories", "categories": unknown}), 400
+    ingestor.apply([event])
+    profile = recommender.user_profiles[user_id]
     
     return jsonify({
         "status": "success",
-        "profile": user_profiles[user_id]
+        "profile": {
+            "name": profile['name'],
+            "preferences": profile['preferences'],
+            "history": profile['history']
+        }
     })
 
 @app.route('/api/track_interaction', methods=['POST'])
 def track_interaction():
     """Track a user interaction with a gig"""
     data = request.get_json()
-    print(f"Interaction tracking request: {data}")
+    logger.debug("Interaction tracking request: %s", data)
     
     if not data or 'user_id' not in data or 'gig_id' not in data:
         return jsonify({"error": "Missing required fields"}), 400
     
+    event = {
+        "user_id": data['user_id'],
+        "gig_id": data['gig_id'],
+        "interaction_type": data.get('interaction_type', 'view'),
+        "value": data.get('value', 1),
+        "timestamp": time.time()
+    }
+    error = event_error(event)
+    if error is not None:
+        return jsonify({"error": error}), 400
+    ingestor.apply([event])
+    
     return jsonify({
         "status": "success",
         "message": f"Interaction recorded for user {data['user_id']} with gig {data['gig_id']}"
     })
 
+@app.route('/api/track_interaction/bulk', methods=['POST'])
+def track_interaction_bulk():
+    """Log a batch of interactions and fold them in the background"""
+    data = request.get_json()
+    
+    if not data or not isinstance(data.get('events'), list):
+        return jsonify({"error": "Missing events"}), 400
+    
+    # Events are stamped on arrival, so replaying the log decays them correctly
+    now = time.time()
+    events = []
+    for position, event in enumerate(data['events']):
+        if not isinstance(event, dict) or 'user_id' not in event or 'gig_id' not in event:
+            return jsonify({"error": f"Event {position} is missing required fields"}), 400
+        event = {
+            "user_id": event['user_id'],
+            "gig_id": event['gig_id'],
+            "interaction_type": event.get('interaction_type', 'view'),
+            "value": event.get('value', 1),
+            "timestamp": now
+        }
+        error = event_error(event)
+        if error is not None:
+            return jsonify({"error": f"Event {position}: {error}"}), 400
+        events.append(event)
+    
+    ingestor.submit(events)
+    logger.debug("Bulk interaction request: %d events queued", len(events))
+    
+    return jsonify({
+        "status": "accepted",
+        "count": len(events)
+    }), 202
+
+@app.route('/api/model/snapshot', methods=['POST'])
+@admin_only
+def save_model_snapshot():
+    """Save a model snapshot for fast restarts"""
+    if not model_snapshot_dir:
+        return jsonify({"error": "MODEL_SNAPSHOT_DIR is not set"}), 400
+    
+    ingestor.checkpoint(model_snapshot_dir)
+    
+    return jsonify({
+        "status": "success",
+        "path": model_snapshot_dir
+    })
+
+@app.route('/api/model/item_similarity', methods=['POST'])
+@admin_only
+def build_item_similarity():
+    """Rebuild the collaborative filtering model from the recorded interactions"""
+    if prefork:
+        return model_build_unavailable()
+    data = request.get_json(silent=True) or {}
+    
+    model = ingestor.exclusive(
+        recommender.build_item_similarity,
+        n_neighbors=int(data.get('n_neighbors', 50))
+    )
+    
+    return jsonify({
+        "status": "success",
+        "gigs": len(model)
+    })
+
+@app.route('/api/model/als', methods=['POST'])
+@admin_only
+def build_als():
+    """Train user and gig embeddings from the recorded interactions"""
+    if prefork:
+        return model_build_unavailable()
+    data = request.get_json(silent=True) or {}
+    
+    model = ingestor.exclusive(
+        recommender.build_als,
+        factors=int(data.get('factors', 32)),
+        iterations=int(data.get('iterations', 10)),
+        checkpoint_path=os.getenv('ALS_CHECKPOINT_DIR') or None,
+        warm_start=bool(data.get('warm_start', True))
+    )
+    
+    return jsonify({
+        "status": "success",
+        "users": len(model.user_ids),
+        "gigs": len(model.gig_ids),
+        "epochs": model.epochs
+    })
+
+@app.route('/api/model/recommendation_table', methods=['POST'])
+@admin_only
+def load_recommendation_table():
+    """Answer recommendations from the table in RECOMMENDATION_TABLE_DIR, after the offline job rewrote it"""
+    if prefork:
+        return model_build_unavailable()
+    if not (recommendation_table_dir and is_snapshot(recommendation_table_dir)):
+        return jsonify({"error": "RECOMMENDATION_TABLE_DIR does not hold a recommendation table"}), 400
+    
+    if not ingestor.exclusive(recommender.load_recommendation_table, recommendation_table_dir):
+        return jsonify({"error": "The table was built for another catalog or model"}), 409
+    
+    return jsonify({
+        "status": "success",
+        "path": recommendation_table_dir
+    })
+
+def model_build_unavailable():
+    """Refuse a model build in a prefork worker, where it would only change that worker's copy"""
+    return jsonify({
+        "error": "Models cannot be rebuilt in a prefork worker; build them offline, "
+                 "save a snapshot to MODEL_SNAPSHOT_DIR and restart the server"
+    }), 409
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Export counters, gauges and histograms in the Prometheus text format"""
+    return app.response_class(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/metrics/profiler', methods=['POST'])
+@admin_only
+def toggle_profiler():
+    """Start or stop the sampling profiler ({"enabled": bool, "reset": bool})"""
+    data = request.get_json(silent=True) or {}
+    
+    if data.get('reset'):
+        profiler.reset()
+    if 'enabled' in data:
+        if data['enabled']:
+            profiler.start()
+        else:
+            profiler.stop()
+    
+    return jsonify({
+        "status": "success",
+        "running": profiler.running,
+        "samples": profiler.samples
+    })
+
+@app.route('/api/metrics/profile', methods=['GET'])
+def get_profile():
+    """Sampled stacks in collapsed format (one 'frame;frame count' line each, for flame graphs)"""
+    return app.response_class(profiler.collapsed(), mimetype='text/plain')
+
 # Add a test route that returns all available endpoints
 @app.route('/api/routes', methods=['GET'])
 def list_routes():
@@ -104,11 +587,21 @@ if __name__ == "__main__":
     # Get port from environment variable or use 5001 as default
     port = int(os.getenv('PORT', 5001))
     
-    print(f"Starting server on port {port}")
-    print(f"API will be available at http://localhost:{port}/api/")
-    print("Available endpoints:")
-    print(f" - Health check: http://localhost:{port}/api/health")
-    print(f" - Recommendations: http://localhost:{port}/api/recommendations/<user_id>")
-    print(f" - List routes: http://localhost:{port}/api/routes")
+    logger.info(f"Starting server on port {port}")
+    logger.info(f"API will be available at http://localhost:{port}/api/")
+    logger.info("Available endpoints:")
+    logger.info(f" - Health check: http://localhost:{port}/api/health")
+    logger.info(f" - Recommendations: http://localhost:{port}/api/recommendations/<user_id>")
+    logger.info(f" - Batch recommendations (POST): http://localhost:{port}/api/recommendations/batch")
+    logger.info(f" - Similar gigs: http://localhost:{port}/api/gigs/<gig_id>/similar")
+    logger.info(f" - Trending gigs: http://localhost:{port}/api/trending?category=<name>")
+    logger.info(f" - Search: http://localhost:{port}/api/search?q=<text>&user_id=<user_id>")
+    logger.info(f" - Bulk interactions (POST): http://localhost:{port}/api/track_interaction/bulk")
+    logger.info(f" - Train embeddings (POST, admin): http://localhost:{port}/api/model/als")
+    logger.info(f" - Metrics: http://localhost:{port}/api/metrics")
+    logger.info(f" - Save model snapshot (POST, admin): http://localhost:{port}/api/model/snapshot")
+    logger.info(f" - List routes: http://localhost:{port}/api/routes")
+    logger.info("For multi-worker serving run: gunicorn -c gunicorn.conf.py")
     
-    app.run(debug=True, host='127.0.0.1', port=port)
\ No newline at end of file
+    # FLASK_DEBUG=false serves from one process, without the reloader
+    app.run(debug=os.getenv('FLASK_DEBUG', 'true').lower() == 'true', host='127.0.0.1', port=port)
\ No newline at end of file
@@ -0,0 +1,49 @@
+"""Small NumPy helpers shared by the recommender modules"""
+import numpy as np
+
+
+def grow(buffer, size):
+    """Return buffer, or a geometrically grown copy with room for size rows"""
+    if size <= len(buffer):
+        return buffer
+    grown = np.empty((max(size, 2 * len(buffer), 16),) + buffer.shape[1:], dtype=buffer.dtype)
+    grown[:len(buffer)] = buffer
+    return grown
+
+
+def top_k(scores, k):
+    """
+    Return the row positions of the k highest scores, best first
+
+    Ties are broken by row position (lowest first) so the ordering matches a
+    stable descending sort of the whole array. Rows scored -inf are treated as
+    excluded and never returned.
+    """
+    eligible = int(np.count_nonzero(scores != -np.inf))
+    k = min(k, eligible)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    if k < len(scores):
+        # Partial selection: O(n) to find the k-th best score
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[:k - len(above)]
+        candidates = np.concatenate([above, ties])
+    else:
+        candidates = np.flatnonzero(scores != -np.inf)
+
+    # candidates are in row order, so a stable sort keeps ties in row order
+    order = np.argsort(-scores[candidates], kind='stable')
+    return candidates[order]
+
+
+def concat_ranges(starts, ends):
+    """Return np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])"""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.intp)
+    # Offset of each range's first element within the output
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(total)
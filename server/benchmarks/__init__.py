@@ -0,0 +1 @@
+"""Benchmarks for the recommender and its Flask API (see benchmarks.run and benchmarks.serving)"""
\ No newline at end of file
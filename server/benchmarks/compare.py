@@ -0,0 +1,98 @@
+"""
+Compare two benchmark result files
+
+    python -m benchmarks.compare before.json after.json [--threshold 0.1]
+
+Runs are matched by configuration label and size, and every numeric metric
+present in both files is listed with its relative change. Times, latencies
+and memory are better when lower; rates (*_per_second) and cache hit ratios
+are better when higher. Counters that only describe the workload (requests,
+events, errors, ...) are listed without a verdict. The exit status is 1
+when any metric regressed by more than the threshold, so the comparison can
+gate a CI job.
+"""
+import argparse
+import json
+import sys
+
+from benchmarks.run import RESULTS_FORMAT
+
+# Default relative change counted as a regression
+DEFAULT_THRESHOLD = 0.10
+
+# Metric fields where a higher value is better
+HIGHER_IS_BETTER_SUFFIXES = ('_per_second', 'hit_ratio')
+
+# Metric fields where a lower value is better
+LOWER_IS_BETTER_SUFFIXES = ('seconds', '_ms', '_mb', 'bytes')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Relative change counted as a regression (default: 0.1)')
+    args = parser.parse_args(argv)
+
+    before, after = load_results(args.before), load_results(args.after)
+    print(f"before: {before.get('commit')}  after: {after.get('commit')}")
+    regressions = 0
+    for key, metrics in flatten(after).items():
+        previous = flatten(before).get(key)
+        if previous is None:
+            continue
+        print(f"\n{key}")
+        for name in sorted(set(previous) & set(metrics)):
+            old, new = previous[name], metrics[name]
+            change = (new - old) / old if old else 0.0
+            verdict = judge(name, change, args.threshold)
+            regressions += verdict == 'REGRESSION'
+            print(f"  {name:<55} {old:>14.4f} {new:>14.4f} {change:>+8.1%}  {verdict}")
+
+    print(f"\n{regressions} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def load_results(path):
+    """Read a results file written by benchmarks.run"""
+    with open(path) as f:
+        results = json.load(f)
+    if results.get('format') != RESULTS_FORMAT:
+        raise ValueError(f"{path} is not a benchmark results file")
+    return results
+
+
+def flatten(results):
+    """Return {run key: {metric.field: value}} with only numeric fields"""
+    runs = {}
+    for run in results['runs']:
+        config = run['config']
+        key = f"{config['label']} ({config['gigs']} gigs, {config['users']} users, {config['events']} events)"
+        values = {}
+        for metric, entry in run['metrics'].items():
+            if isinstance(entry, dict):
+                for field, value in entry.items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        values[f"{metric}.{field}"] = value
+            elif isinstance(entry, (int, float)):
+                values[metric] = entry
+        runs[key] = values
+    return runs
+
+
+def judge(name, change, threshold):
+    """Return 'REGRESSION', 'improved' or '' for a relative change of a metric"""
+    if name.endswith(HIGHER_IS_BETTER_SUFFIXES):
+        change = -change
+    elif not name.endswith(LOWER_IS_BETTER_SUFFIXES):
+        return ''
+    if change > threshold:
+        return 'REGRESSION'
+    if change < -threshold:
+        return 'improved'
+    return ''
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,512 @@
+"""
+Recommender and API benchmarks on synthetic data
+
+Run from the server directory:
+
+    python -m benchmarks.run --preset small
+    python -m benchmarks.run --gigs 200000 --users 50000 --events 1000000 --suite recommender
+    python -m benchmarks.run --preset small,medium --output results.json
+    python -m benchmarks.compare before.json after.json
+
+The loader suite writes the gigs as a mongoexport JSONL dump and times
+streaming it into columns with catalog_loader (read and memory-mapped),
+then load_data on those columns. It runs first, so the peak memory it
+records is the loader's own. The recommender suite times load_data,
+create_user_profile, track_interaction (one by one and bulk),
+get_user_recommendations latency (p50/p99, unfiltered and with category,
+price and rating filters), batch recommendations, search_gigs and
+autocomplete against a linear case-insensitive regex scan of the
+descriptions (what the storefront's getAllGigs runs), trending,
+build_item_similarity, save_model/load_model and the offline top-N table
+(full and incremental builds, then recommendations answered from it). The
+api suite loads the same model into server/app.py through a snapshot and
+drives its routes with Flask's test client. Every stage records the peak
+resident memory of the process so far.
+
+Results are written as JSON with the commit they were measured on. Each
+configuration runs in its own process when several are requested, so peak
+memory is per configuration.
+"""
+import argparse
+import contextlib
+import datetime
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks import synthetic
+
+RESULTS_FORMAT = 'service-recommender-benchmark'
+RESULTS_VERSION = 1
+
+# Named sizes: gigs, users, interaction events
+PRESETS = {
+    'small': {'gigs': 10000, 'users': 10000, 'events': 100000},
+    'medium': {'gigs': 100000, 'users': 100000, 'events': 1000000},
+    'large': {'gigs': 1000000, 'users': 500000, 'events': 5000000},
+    'xlarge': {'gigs': 5000000, 'users': 1000000, 'events': 10000000},
+}
+
+# Events applied one at a time with track_interaction (the rest go through track_interactions)
+SINGLE_EVENTS = 50000
+
+# Events per track_interactions call, as folded by the background ingestor
+BULK_BATCH_EVENTS = 5000
+
+# Timed requests per latency measurement, after a short warm-up
+LATENCY_REQUESTS = 2000
+WARMUP_REQUESTS = 20
+
+# Queries timed for the linear regex scan search is compared against
+REGEX_SCAN_REQUESTS = 200
+
+# Users per get_recommendations_batch call
+BATCH_USERS = 100
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--preset', help=f"Comma-separated sizes: {', '.join(PRESETS)}")
+    parser.add_argument('--gigs', type=int, help='Number of gigs (overrides the preset)')
+    parser.add_argument('--users', type=int, help='Number of user profiles (overrides the preset)')
+    parser.add_argument('--events', type=int, help='Number of interaction events (overrides the preset)')
+    parser.add_argument('--suite', choices=['all', 'loader', 'recommender', 'api'], default='all')
+    parser.add_argument('--requests', type=int, default=LATENCY_REQUESTS, help='Timed requests per latency metric')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/<commit>-<label>.json)')
+    args = parser.parse_args(argv)
+
+    configs = []
+    for name in (args.preset or 'small').split(','):
+        if name not in PRESETS:
+            parser.error(f"Unknown preset {name}")
+        config = dict(PRESETS[name], label=name)
+        for field in ('gigs', 'users', 'events'):
+            if getattr(args, field) is not None:
+                config[field] = getattr(args, field)
+                config['label'] = 'custom'
+        config.update(suite=args.suite, requests=args.requests, seed=args.seed)
+        configs.append(config)
+
+    if len(configs) == 1:
+        runs = [run_config(configs[0])]
+    else:
+        runs = [run_in_subprocess(config) for config in configs]
+
+    results = {
+        'format': RESULTS_FORMAT,
+        'version': RESULTS_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'commit': _git(['rev-parse', 'HEAD']),
+        'dirty': bool(_git(['status', '--porcelain', '--untracked-files=no'])),
+        'environment': _environment(),
+        'runs': runs
+    }
+
+    output = args.output
+    if output is None:
+        commit = (results['commit'] or 'unknown')[:10]
+        labels = '+'.join(config['label'] for config in configs)
+        output = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', f"{commit}-{labels}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+def run_in_subprocess(config):
+    """Run one configuration in a fresh interpreter and return its run entry"""
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, 'run.json')
+        command = [sys.executable, '-m', 'benchmarks.run', '--gigs', str(config['gigs']),
+                   '--users', str(config['users']), '--events', str(config['events']),
+                   '--suite', config['suite'], '--requests', str(config['requests']),
+                   '--seed', str(config['seed']), '--output', output]
+        subprocess.run(command, check=True, cwd=_server_dir())
+        with open(output) as f:
+            run = json.load(f)['runs'][0]
+    run['config']['label'] = config['label']
+    return run
+
+
+def run_config(config):
+    """Run the selected suites for one configuration and return {'config', 'metrics'}"""
+    print(f"Benchmarking {config['gigs']} gigs, {config['users']} users, {config['events']} events "
+          f"(suite: {config['suite']})")
+    metrics = {}
+    workdir = tempfile.mkdtemp(prefix='recommender-bench-')
+    try:
+        snapshot_dir = os.path.join(workdir, 'snapshot')
+        if config['suite'] in ('all', 'loader'):
+            bench_loader(config, metrics, os.path.join(workdir, 'gigs.jsonl'))
+        if config['suite'] in ('all', 'recommender'):
+            bench_recommender(config, metrics, snapshot_dir)
+        elif config['suite'] == 'api':
+            # The api suite serves a model built from the same data
+            with _quiet():
+                recommender = _build_model(config)
+                recommender.save_model(snapshot_dir)
+            del recommender
+            gc.collect()
+        if config['suite'] in ('all', 'api'):
+            bench_api(config, metrics, snapshot_dir, os.path.join(workdir, 'interactions'))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    metrics['peak_rss_mb'] = _peak_rss_mb()
+    return {'config': config, 'metrics': metrics}
+
+
+def bench_loader(config, metrics, dump_path):
+    """Time loading a mongoexport dump of the gigs into columns and into the recommender"""
+    import catalog_loader
+    from service_recommender import ServiceRecommender
+
+    start = time.perf_counter()
+    synthetic.write_gig_dump(dump_path, config['gigs'], seed=config['seed'])
+    megabytes = os.path.getsize(dump_path) / (1024 * 1024)
+    metrics['write_gig_dump'] = _stage(time.perf_counter() - start, dump_mb=megabytes)
+
+    with _quiet():
+        for name, use_mmap in (('load_gigs_jsonl', False), ('load_gigs_jsonl_mmap', True)):
+            start = time.perf_counter()
+            columns = catalog_loader.load_catalog(dump_path, use_mmap=use_mmap)
+            seconds = time.perf_counter() - start
+            rows = len(columns[2]['id'])
+            metrics[name] = _stage(seconds, rows=rows, rows_per_second=rows / seconds,
+                                   megabytes_per_second=megabytes / seconds)
+        os.remove(dump_path)
+
+        recommender = ServiceRecommender()
+        seconds = _timed(recommender.load_data, *columns)
+    metrics['load_data_columns'] = _stage(seconds, gigs_per_second=rows / seconds)
+    del recommender, columns
+    gc.collect()
+
+
+def bench_recommender(config, metrics, snapshot_dir):
+    """Time the ServiceRecommender methods; leaves a snapshot of the model in snapshot_dir"""
+    import precompute
+    from service_recommender import ServiceRecommender
+
+    seed = config['seed']
+    start = time.perf_counter()
+    cards, projects, gigs = synthetic.make_catalog(config['gigs'], seed=seed)
+    profiles = synthetic.make_profiles(config['users'], config['gigs'], seed=seed)
+    metrics['generate'] = _stage(time.perf_counter() - start)
+
+    recommender = ServiceRecommender()
+    with _quiet():
+        seconds = _timed(recommender.load_data, cards, projects, gigs)
+    metrics['load_data'] = _stage(seconds, gigs_per_second=len(gigs) / seconds)
+    del cards, projects, gigs
+
+    start = time.perf_counter()
+    for profile in profiles:
+        recommender.create_user_profile(profile['user_id'], profile['name'], profile['preferences'], profile['history'])
+    seconds = time.perf_counter() - start
+    metrics['create_user_profile'] = _stage(seconds, profiles_per_second=len(profiles) / seconds)
+    del profiles
+
+    # Interactions: the first events one at a time, the rest in ingestor-sized batches
+    n_single = min(SINGLE_EVENTS, config['events'])
+    batches = synthetic.interaction_batches(config['events'], config['users'], config['gigs'],
+                                            batch_size=BULK_BATCH_EVENTS, seed=seed)
+    single_seconds = bulk_seconds = 0.0
+    n_bulk = applied = 0
+    for batch in batches:
+        if applied < n_single:
+            single = batch[:n_single - applied]
+            start = time.perf_counter()
+            for event in single:
+                recommender.track_interaction(event['user_id'], event['gig_id'], event['interaction_type'],
+                                              event['value'], event['timestamp'])
+            single_seconds += time.perf_counter() - start
+            applied += len(single)
+            batch = batch[len(single):]
+        if batch:
+            start = time.perf_counter()
+            recommender.track_interactions(batch)
+            bulk_seconds += time.perf_counter() - start
+            n_bulk += len(batch)
+    if n_single:
+        metrics['track_interaction'] = _stage(single_seconds, events=n_single,
+                                              events_per_second=n_single / single_seconds)
+    if n_bulk:
+        metrics['track_interactions_bulk'] = _stage(bulk_seconds, events=n_bulk,
+                                                    events_per_second=n_bulk / bulk_seconds)
+
+    rng = random.Random(seed)
+    users = [synthetic.user_id(rng.randrange(config['users'])) for _ in range(config['requests'])]
+    metrics['get_user_recommendations'] = _latencies(
+        lambda user_id: recommender.get_user_recommendations(user_id, n=10), users)
+    metrics['get_user_recommendations_history'] = _latencies(
+        lambda user_id: recommender.get_user_recommendations(user_id, n=10, include_history=True), users)
+
+    # Filtered requests score only the gigs passing the filters
+    categories = synthetic.category_titles(len(recommender.category_mapping))
+    metrics['get_user_recommendations_category'] = _latencies(
+        lambda position: recommender.get_user_recommendations(
+            users[position], n=10, categories=[categories[position % len(categories)]]),
+        range(len(users)))
+    metrics['get_user_recommendations_price'] = _latencies(
+        lambda user_id: recommender.get_user_recommendations(user_id, n=10, min_price=50, max_price=59), users)
+    metrics['get_user_recommendations_filtered'] = _latencies(
+        lambda position: recommender.get_user_recommendations(
+            users[position], n=10, categories=[categories[position % len(categories)]], max_price=100, min_star=4.5),
+        range(len(users)))
+
+    chunks = [users[i:i + BATCH_USERS] for i in range(0, len(users), BATCH_USERS)]
+    start = time.perf_counter()
+    for chunk in chunks:
+        recommender.get_recommendations_batch(chunk, n=10)
+    seconds = time.perf_counter() - start
+    metrics['get_recommendations_batch'] = _stage(seconds, users_per_second=len(users) / seconds)
+
+    metrics['get_trending_gigs'] = _latencies(lambda _: recommender.get_trending_gigs(n=10), users)
+    metrics['get_trending_gigs_category'] = _latencies(
+        lambda position: recommender.get_trending_gigs(n=10, category=categories[position % len(categories)]),
+        range(len(users)))
+
+    # Search: the BM25 index against scanning every description with a regex
+    queries = synthetic.search_queries(config['requests'], len(recommender.category_mapping), seed=seed)
+    descriptions = recommender.gigs['desc'].tolist()
+    metrics['search_gigs'] = _latencies(lambda query: recommender.search_gigs(query, n=10, prefix=False), queries)
+    metrics['search_gigs_prefix'] = _latencies(lambda query: recommender.search_gigs(query[:-2], n=10), queries)
+    metrics['search_gigs_personalized'] = _latencies(
+        lambda position: recommender.search_gigs(queries[position], n=10, user_id=users[position]),
+        range(len(queries)))
+    metrics['autocomplete'] = _latencies(lambda query: recommender.autocomplete(query[:2]), queries)
+    metrics['search_regex_scan'] = _latencies(
+        lambda query: _regex_scan(descriptions, query, 10), queries[:REGEX_SCAN_REQUESTS])
+
+    with _quiet():
+        seconds = _timed(recommender.build_item_similarity)
+    metrics['build_item_similarity'] = _stage(seconds, gigs=len(recommender.item_similarity))
+
+    with _quiet():
+        seconds = _timed(recommender.save_model, snapshot_dir)
+    metrics['save_model'] = _stage(seconds, bytes=_directory_bytes(snapshot_dir))
+    del recommender
+    gc.collect()
+
+    loaded = ServiceRecommender()
+    with _quiet():
+        seconds = _timed(loaded.load_model, snapshot_dir)
+    metrics['load_model'] = _stage(seconds)
+    # Mapped pages are read on first use
+    start = time.perf_counter()
+    loaded.get_user_recommendations(users[0], n=10)
+    metrics['first_recommendation_after_load'] = _stage(time.perf_counter() - start)
+
+    # Offline top-N table, then requests answered from it
+    table_dir = os.path.join(os.path.dirname(snapshot_dir), 'table')
+    with _quiet():
+        stats = precompute.build_table(loaded, table_dir, n=10)
+        loaded.load_recommendation_table(table_dir)
+    metrics['precompute_table'] = _stage(stats['seconds'], users_per_second=stats['users'] / stats['seconds'],
+                                         bytes=_directory_bytes(table_dir))
+    metrics['get_user_recommendations_table'] = _latencies(
+        lambda user_id: loaded.get_user_recommendations(user_id, n=10), users)
+    # One interaction per changed user bumps their profile version
+    for user_id in users[:max(1, len(users) // 10)]:
+        loaded.track_interaction(user_id, 1, 'view')
+    with _quiet():
+        stats = precompute.build_table(loaded, table_dir, n=10, incremental=True)
+    metrics['precompute_table_incremental'] = _stage(stats['seconds'], users=stats['computed'])
+    del loaded
+    gc.collect()
+
+
+def bench_api(config, metrics, snapshot_dir, log_dir):
+    """Serve the snapshot through server/app.py and time its routes with the test client"""
+    os.environ['MODEL_SNAPSHOT_DIR'] = snapshot_dir
+    os.environ['INTERACTION_LOG_DIR'] = log_dir
+
+    with _quiet():
+        start = time.perf_counter()
+        import app as server
+        metrics['api_startup'] = _stage(time.perf_counter() - start)
+    client = server.app.test_client()
+
+    rng = random.Random(config['seed'] + 1)
+    n_requests = config['requests']
+    users = [synthetic.user_id(rng.randrange(config['users'])) for _ in range(n_requests)]
+    gig_ids = [rng.randrange(config['gigs']) + 1 for _ in range(n_requests)]
+    queries = synthetic.search_queries(n_requests, seed=config['seed'] + 1)
+
+    def get(url):
+        return client.get(url)
+
+    def post(url, body):
+        return client.post(url, json=body)
+
+    routes = {
+        'api_health': lambda i: get('/api/health'),
+        # Distinct users: mostly cache misses
+        'api_recommendations': lambda i: get(f"/api/recommendations/{users[i]}?n=10"),
+        # The same few users again: cache hits
+        'api_recommendations_cached': lambda i: get(f"/api/recommendations/{users[i % 10]}?n=10"),
+        'api_recommendations_filtered': lambda i: get(
+            f"/api/recommendations/{users[i]}?n=10&category=Logo+Design&max_price=100&min_star=4.5"),
+        'api_recommendations_batch': lambda i: post('/api/recommendations/batch', {
+            'user_ids': [users[(i + j) % n_requests] for j in range(BATCH_USERS // 2)], 'n': 10}),
+        'api_trending': lambda i: get('/api/trending?n=10'),
+        'api_search': lambda i: get(f"/api/search?q={queries[i]}&user_id={users[i]}"),
+        'api_similar_gigs': lambda i: get(f"/api/gigs/{gig_ids[i]}/similar?k=5"),
+        'api_track_interaction': lambda i: post('/api/track_interaction', {
+            'user_id': users[i], 'gig_id': gig_ids[i], 'interaction_type': 'click'}),
+        'api_track_interaction_bulk': lambda i: post('/api/track_interaction/bulk', {'events': [
+            {'user_id': users[(i + j) % n_requests], 'gig_id': gig_ids[(i + j) % n_requests]}
+            for j in range(BULK_BATCH_EVENTS // 10)]}),
+    }
+    # Batch routes do BATCH_USERS / 2 users or BULK_BATCH_EVENTS / 10 events per request
+    batched = {'api_recommendations_batch', 'api_track_interaction_bulk'}
+    try:
+        with _quiet():
+            for name, route in routes.items():
+                count = max(WARMUP_REQUESTS, n_requests // 10) if name in batched else n_requests
+                metrics[name] = _latencies(route, range(count), expect_ok=True)
+            server.ingestor.flush()
+
+            # Mixed traffic: 90% reads, 10% single interaction writes
+            start = time.perf_counter()
+            for i in range(n_requests):
+                if i % 10 == 9:
+                    routes['api_track_interaction'](i)
+                else:
+                    routes['api_recommendations'](i)
+            seconds = time.perf_counter() - start
+            metrics['api_mixed'] = _stage(seconds, requests_per_second=n_requests / seconds)
+    finally:
+        server.ingestor.stop()
+        server.interaction_log.close()
+    metrics['api_recommendation_cache'] = server.recommendation_cache.stats()
+
+
+def _regex_scan(texts, query, n):
+    """Return the first n rows whose text contains query, ignoring case, checking every row"""
+    pattern = re.compile(re.escape(query), re.IGNORECASE)
+    return [row for row, text in enumerate(texts) if pattern.search(text)][:n]
+
+
+def _timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def _stage(seconds, **values):
+    """Metric entry for a timed stage"""
+    return dict(seconds=seconds, peak_rss_mb=_peak_rss_mb(), **values)
+
+
+def _latencies(function, arguments, expect_ok=False):
+    """Call function once per argument and return latency percentiles in milliseconds"""
+    arguments = list(arguments)
+    for argument in arguments[:WARMUP_REQUESTS]:
+        function(argument)
+
+    samples = np.empty(len(arguments))
+    errors = 0
+    start = time.perf_counter()
+    for i, argument in enumerate(arguments):
+        call_start = time.perf_counter()
+        result = function(argument)
+        samples[i] = time.perf_counter() - call_start
+        if expect_ok and result.status_code >= 400:
+            errors += 1
+    seconds = time.perf_counter() - start
+
+    samples *= 1000
+    entry = _stage(
+        seconds,
+        requests=len(arguments),
+        requests_per_second=len(arguments) / seconds if seconds else None,
+        mean_ms=float(samples.mean()) if len(samples) else None,
+        p50_ms=float(np.percentile(samples, 50)) if len(samples) else None,
+        p99_ms=float(np.percentile(samples, 99)) if len(samples) else None,
+        max_ms=float(samples.max()) if len(samples) else None
+    )
+    if expect_ok:
+        entry['errors'] = errors
+    return entry
+
+
+def _peak_rss_mb():
+    """Peak resident memory of this process so far, in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def _build_model(config):
+    """Build a recommender with the configured catalog, profiles and interactions"""
+    from service_recommender import ServiceRecommender
+
+    recommender = ServiceRecommender()
+    recommender.load_data(*synthetic.make_catalog(config['gigs'], seed=config['seed']))
+    events = [dict(profile, type='profile')
+              for profile in synthetic.make_profiles(config['users'], config['gigs'], seed=config['seed'])]
+    recommender.track_interactions(events)
+    del events
+    for batch in synthetic.interaction_batches(config['events'], config['users'], config['gigs'],
+                                               batch_size=BULK_BATCH_EVENTS, seed=config['seed']):
+        recommender.track_interactions(batch)
+    recommender.build_item_similarity()
+    return recommender
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Silence per-call log messages while measuring"""
+    previous = logging.root.manager.disable
+    logging.disable(logging.INFO)
+    try:
+        yield
+    finally:
+        logging.disable(previous)
+
+
+def _environment():
+    import pandas
+    import scipy
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pandas.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def _git(args):
+    try:
+        result = subprocess.run(['git'] + args, cwd=_server_dir(), capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def _server_dir():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+if __name__ == '__main__':
+    main()
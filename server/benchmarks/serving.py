@@ -0,0 +1,283 @@
+"""
+Multi-worker serving benchmark: the single-process server against gunicorn
+
+Run from the server directory (gunicorn must be installed):
+
+    python -m benchmarks.serving --preset small --workers 4
+    python -m benchmarks.compare before.json after.json
+
+The synthetic model of the preset is built once and saved as a snapshot,
+then served over HTTP in each configuration:
+
+- single: python app.py (Werkzeug, one threaded process, debug off)
+- gunicorn: gunicorn -c gunicorn.conf.py with --workers, model preloaded
+  in the master and shared copy-on-write
+- gunicorn_no_preload: the same with PRELOAD_APP=false, every worker
+  loading the model itself
+
+Concurrent clients send mixed traffic (90% recommendation reads for
+distinct users, 10% track_interaction writes) for --duration seconds. Then
+the resident (RSS), proportional (PSS) and private memory of every server
+process is read from /proc/<pid>/smaps_rollup. PSS divides each shared page
+between the processes mapping it, so total_pss_mb is what the server really
+costs. Linux only.
+
+Results are written in the benchmarks.run format, one run per
+configuration, so they can be compared with benchmarks.compare.
+"""
+import argparse
+import datetime
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from benchmarks import synthetic
+from benchmarks.run import (PRESETS, RESULTS_FORMAT, RESULTS_VERSION, _build_model, _environment, _git,
+                            _quiet, _server_dir)
+
+# Server configurations, in the order they are measured
+SERVERS = ('single', 'gunicorn', 'gunicorn_no_preload')
+
+# Seconds of traffic per configuration, after the warm-up
+DURATION = 20.0
+WARMUP_SECONDS = 2.0
+
+# Concurrent client threads
+CLIENTS = 8
+
+# Share of requests that are track_interaction writes
+WRITE_SHARE = 0.1
+
+# Seconds to wait for a server to answer /api/health
+STARTUP_TIMEOUT = 600.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--preset', default='small', choices=sorted(PRESETS))
+    parser.add_argument('--gigs', type=int, help='Number of gigs (overrides the preset)')
+    parser.add_argument('--users', type=int, help='Number of user profiles (overrides the preset)')
+    parser.add_argument('--events', type=int, help='Number of interaction events (overrides the preset)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='gunicorn worker processes')
+    parser.add_argument('--servers', default=','.join(SERVERS), help=f"Comma-separated: {', '.join(SERVERS)}")
+    parser.add_argument('--duration', type=float, default=DURATION, help='Seconds of traffic per server')
+    parser.add_argument('--clients', type=int, default=CLIENTS, help='Concurrent client threads')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/<commit>-serving-<preset>.json)')
+    args = parser.parse_args(argv)
+
+    servers = args.servers.split(',')
+    for server in servers:
+        if server not in SERVERS:
+            parser.error(f"Unknown server {server}")
+    config = dict(PRESETS[args.preset], label=args.preset, seed=args.seed)
+    for field in ('gigs', 'users', 'events'):
+        if getattr(args, field) is not None:
+            config[field] = getattr(args, field)
+            config['label'] = 'custom'
+
+    workdir = tempfile.mkdtemp(prefix='recommender-serving-')
+    try:
+        snapshot_dir = os.path.join(workdir, 'snapshot')
+        print(f"Building the model: {config['gigs']} gigs, {config['users']} users, {config['events']} events")
+        with _quiet():
+            recommender = _build_model(config)
+            recommender.save_model(snapshot_dir)
+        del recommender
+
+        runs = []
+        for server in servers:
+            workers = 1 if server == 'single' else args.workers
+            run_config = dict(config, label=f"{config['label']}-{server}-{workers}", server=server, workers=workers,
+                              clients=args.clients, duration=args.duration)
+            print(f"Serving with {server} ({workers} worker(s))")
+            runs.append({'config': run_config,
+                         'metrics': bench_server(run_config, snapshot_dir, os.path.join(workdir, server))})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'format': RESULTS_FORMAT,
+        'version': RESULTS_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'commit': _git(['rev-parse', 'HEAD']),
+        'dirty': bool(_git(['status', '--porcelain', '--untracked-files=no'])),
+        'environment': _environment(),
+        'runs': runs
+    }
+    for run in runs:
+        throughput, memory = run['metrics']['throughput'], run['metrics']['memory']
+        print(f"{run['config']['label']:<40} {throughput['requests_per_second']:>8.1f} req/s  "
+              f"p50 {throughput['p50_ms']:>7.2f} ms  p99 {throughput['p99_ms']:>8.2f} ms  "
+              f"RSS/worker {memory['worker_rss_mb']:>7.1f} MB  PSS/worker {memory['worker_pss_mb']:>7.1f} MB  "
+              f"total PSS {memory['total_pss_mb']:>7.1f} MB")
+
+    output = args.output
+    if output is None:
+        commit = (results['commit'] or 'unknown')[:10]
+        output = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results',
+                              f"{commit}-serving-{config['label']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+def bench_server(config, snapshot_dir, log_dir):
+    """Start one server configuration, drive it with mixed traffic and measure its processes"""
+    port = _free_port()
+    env = dict(os.environ, MODEL_SNAPSHOT_DIR=snapshot_dir, INTERACTION_LOG_DIR=log_dir, PORT=str(port),
+               LOG_LEVEL='WARNING', FLASK_DEBUG='false', WEB_CONCURRENCY=str(config['workers']),
+               PRELOAD_APP='false' if config['server'] == 'gunicorn_no_preload' else 'true')
+    if config['server'] == 'single':
+        command = [sys.executable, 'app.py']
+    else:
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--log-level', 'warning']
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=_server_dir(), env=env, stdout=subprocess.DEVNULL)
+    try:
+        _wait_until_healthy(port, process)
+        metrics = {'startup': {'seconds': time.perf_counter() - start}}
+
+        rng = random.Random(config['seed'] + 1)
+        _drive(port, config, rng, WARMUP_SECONDS)
+        metrics['throughput'] = _drive(port, config, rng, config['duration'])
+        metrics['memory'] = _memory(process.pid)
+    finally:
+        process.terminate()
+        process.wait()
+    return metrics
+
+
+def _drive(port, config, rng, duration):
+    """Send mixed traffic from config['clients'] threads for duration seconds; returns throughput and latency"""
+    deadline = time.perf_counter() + duration
+    samples = []
+    errors = [0]
+    lock = threading.Lock()
+    seeds = [rng.randrange(2 ** 32) for _ in range(config['clients'])]
+
+    def client(seed):
+        client_rng = random.Random(seed)
+        latencies = []
+        failed = 0
+        while time.perf_counter() < deadline:
+            user_id = synthetic.user_id(client_rng.randrange(config['users']))
+            call_start = time.perf_counter()
+            if client_rng.random() < WRITE_SHARE:
+                status = _request(port, 'POST', '/api/track_interaction', {
+                    'user_id': user_id, 'gig_id': client_rng.randrange(config['gigs']) + 1,
+                    'interaction_type': 'click'})
+            else:
+                status = _request(port, 'GET', f"/api/recommendations/{user_id}?n=10")
+            latencies.append(time.perf_counter() - call_start)
+            failed += status != 200
+        with lock:
+            samples.extend(latencies)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(seed,)) for seed in seeds]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    latencies = np.array(samples) * 1000
+    return {
+        'seconds': seconds,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'requests_per_second': len(latencies) / seconds,
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+    }
+
+
+def _request(port, method, path, body=None):
+    """Send one request on a new connection (gunicorn's sync workers close them anyway); returns the status"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    except OSError:
+        return 0
+    finally:
+        connection.close()
+
+
+def _memory(pid):
+    """RSS, PSS and private memory of a server process and its children, in MiB"""
+    children = _children(pid)
+    workers = children or [pid]
+    usage = {process: _smaps_rollup(process) for process in [pid] + children}
+    entry = {
+        'processes': len(usage),
+        'total_rss_mb': sum(values['Rss'] for values in usage.values()),
+        'total_pss_mb': sum(values['Pss'] for values in usage.values()),
+    }
+    for field, key in (('rss', 'Rss'), ('pss', 'Pss'), ('private', 'Private')):
+        entry[f"worker_{field}_mb"] = float(np.mean([usage[worker][key] for worker in workers]))
+    if children:
+        entry['master_rss_mb'] = usage[pid]['Rss']
+    return entry
+
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def _smaps_rollup(pid):
+    """Return {'Rss', 'Pss', 'Private'} of a process in MiB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'Rss': values.get('Rss', 0.0),
+        'Pss': values.get('Pss', 0.0),
+        'Private': values.get('Private_Clean', 0.0) + values.get('Private_Dirty', 0.0),
+    }
+
+
+def _wait_until_healthy(port, process):
+    deadline = time.perf_counter() + STARTUP_TIMEOUT
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode} during startup")
+        if _request(port, 'GET', '/api/health') == 200:
+            return
+        time.sleep(0.2)
+    raise RuntimeError(f"Server did not become healthy within {STARTUP_TIMEOUT:.0f}s")
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,412 @@
+"""
+Multi-threaded stress test of the recommender's concurrency layer
+
+Run from the server directory:
+
+    python -m benchmarks.stress --preset small --threads 1,2,4,8
+    python -m benchmarks.compare before.json after.json
+
+The synthetic model of the preset is built once and saved as a snapshot.
+One fixed list of operations is generated from the seed: recommendation
+reads, explanations, searches and profile snapshot checks, mixed with
+track_interaction, bulk track_interactions and create_user_profile writes,
+a share of them on a few hot users so that threads contend for the same
+lock stripes. For every thread count the snapshot is loaded again and the
+operations are dealt round-robin to the threads, while one more thread
+keeps changing the catalog (update_gig, add_gigs and full load_data
+reloads).
+
+Correctness is checked three ways:
+
+- no operation raises, and every recommendation list is full and sorted
+- every profile snapshot read is internally consistent: its feature
+  vector is the one computed from its own preferences and history
+- after the run, every profile (name, preferences, history, features),
+  every user's interactions and the trending scores equal those of the
+  same writes applied one by one in a single thread (up to float
+  rounding, since preference weights are summed in another order)
+
+Throughput is reported per thread count. Threads share one interpreter, so
+CPU-bound scoring does not scale past one core under the GIL; the numbers
+show that the locking adds no serialization of its own (readers never
+wait for writers, writers of different users never wait for each other).
+
+Results are written in the benchmarks.run format, one run per thread
+count, so they can be compared with benchmarks.compare.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from benchmarks import synthetic
+from benchmarks.run import PRESETS, RESULTS_FORMAT, RESULTS_VERSION, _build_model, _environment, _git, _quiet
+
+# Thread counts measured by default
+THREAD_COUNTS = (1, 2, 4, 8)
+
+# Operations per thread count
+OPERATIONS = 10000
+
+# Share of each operation kind, in the order they are drawn
+OPERATION_MIX = (
+    ('recommend', 0.50),
+    ('explain', 0.10),
+    ('search', 0.05),
+    ('snapshot', 0.10),
+    ('interaction', 0.15),
+    ('bulk', 0.05),
+    ('profile', 0.05),
+)
+
+# Users receiving a share of all writes, so threads contend for their stripes
+HOT_USERS = 8
+HOT_WRITE_SHARE = 0.2
+
+# Events per bulk write
+BULK_EVENTS = 20
+
+# Recommendations requested per read
+RECOMMENDATIONS = 10
+
+# Seconds the catalog thread waits between changes
+CATALOG_PAUSE = 0.05
+
+# Catalog changes between full reloads
+RELOAD_EVERY = 20
+
+# Timestamp of the first generated event (one event per second after it)
+START_TIME = 1700000000.0
+
+# Relative tolerance of preference, feature and trending comparisons
+TOLERANCE = 1e-6
+
+# Operations that change profiles or interactions
+WRITES = ('interaction', 'bulk', 'profile')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--preset', default='small', choices=sorted(PRESETS))
+    parser.add_argument('--gigs', type=int, help='Number of gigs (overrides the preset)')
+    parser.add_argument('--users', type=int, help='Number of user profiles (overrides the preset)')
+    parser.add_argument('--events', type=int, help='Number of interaction events (overrides the preset)')
+    parser.add_argument('--threads', default=','.join(map(str, THREAD_COUNTS)), help='Comma-separated thread counts')
+    parser.add_argument('--operations', type=int, default=OPERATIONS, help='Operations per thread count')
+    parser.add_argument('--no-catalog-writer', action='store_true', help='Leave the catalog unchanged during runs')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/<commit>-stress-<preset>.json)')
+    args = parser.parse_args(argv)
+
+    thread_counts = [int(count) for count in args.threads.split(',')]
+    config = dict(PRESETS[args.preset], label=args.preset, seed=args.seed)
+    for field in ('gigs', 'users', 'events'):
+        if getattr(args, field) is not None:
+            config[field] = getattr(args, field)
+            config['label'] = 'custom'
+
+    workdir = tempfile.mkdtemp(prefix='recommender-stress-')
+    try:
+        snapshot_dir = os.path.join(workdir, 'snapshot')
+        print(f"Building the model: {config['gigs']} gigs, {config['users']} users, {config['events']} events")
+        with _quiet():
+            recommender = _build_model(config)
+            recommender.save_model(snapshot_dir)
+        del recommender
+
+        operations = make_operations(config, args.operations, random.Random(config['seed']))
+        print(f"Applying the {sum(op[0] in WRITES for op in operations)} writes serially for reference")
+        with _quiet():
+            expected = final_state(replay_writes(snapshot_dir, operations))
+
+        runs = []
+        for threads in thread_counts:
+            run_config = dict(config, label=f"{config['label']}-threads-{threads}", threads=threads,
+                              operations=len(operations), catalog_writer=not args.no_catalog_writer)
+            print(f"Running {len(operations)} operations on {threads} thread(s)")
+            with _quiet():
+                metrics = run_threads(snapshot_dir, operations, threads, config, not args.no_catalog_writer, expected)
+            runs.append({'config': run_config, 'metrics': metrics})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'format': RESULTS_FORMAT,
+        'version': RESULTS_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'commit': _git(['rev-parse', 'HEAD']),
+        'dirty': bool(_git(['status', '--porcelain', '--untracked-files=no'])),
+        'environment': _environment(),
+        'runs': runs
+    }
+    failed = False
+    for run in runs:
+        throughput, correctness = run['metrics']['throughput'], run['metrics']['correctness']
+        problems = (correctness['errors'] + correctness['invalid_results'] + correctness['snapshot_mismatches']
+                    + correctness['state_mismatches'])
+        failed |= problems > 0
+        print(f"{run['config']['label']:<24} {throughput['operations_per_second']:>8.1f} ops/s  "
+              f"read p50 {throughput['read_p50_ms']:>7.2f} ms  p99 {throughput['read_p99_ms']:>8.2f} ms  "
+              f"write p50 {throughput['write_p50_ms']:>7.2f} ms  catalog changes {correctness['catalog_changes']:>4}  "
+              f"{'FAILED: ' + json.dumps(correctness) if problems else 'consistent'}")
+
+    output = args.output
+    if output is None:
+        commit = (results['commit'] or 'unknown')[:10]
+        output = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results',
+                              f"{commit}-stress-{config['label']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+    return 1 if failed else 0
+
+
+def make_operations(config, n_operations, rng):
+    """
+    Return the operation list: (kind, arguments) tuples in a fixed order
+
+    Interaction values are all 1, so the final interactions do not depend on
+    the order writes to the same user and gig land in; new profiles get
+    fresh user ids for the same reason.
+    """
+    kinds = [kind for kind, share in OPERATION_MIX]
+    shares = [share for kind, share in OPERATION_MIX]
+    profiles = synthetic.make_profiles(n_operations, config['gigs'], seed=config['seed'] + 1)
+    interaction_types = list(synthetic.INTERACTION_TYPES)
+
+    def write_user():
+        index = rng.randrange(HOT_USERS) if rng.random() < HOT_WRITE_SHARE else rng.randrange(config['users'])
+        return synthetic.user_id(index)
+
+    def event(i):
+        return {'user_id': write_user(), 'gig_id': rng.randrange(config['gigs']) + 1,
+                'interaction_type': rng.choice(interaction_types), 'value': 1, 'timestamp': START_TIME + i}
+
+    def new_profile(i):
+        profile = profiles[i]
+        return dict(profile, user_id=f"stress{i}")
+
+    operations = []
+    for i, kind in enumerate(rng.choices(kinds, shares, k=n_operations)):
+        read_user = synthetic.user_id(rng.randrange(config['users']))
+        if kind == 'recommend':
+            arguments = (read_user,)
+        elif kind == 'explain':
+            arguments = (read_user, rng.randrange(config['gigs']) + 1)
+        elif kind == 'search':
+            arguments = (rng.choice(SEARCH_WORDS), read_user)
+        elif kind == 'snapshot':
+            arguments = (read_user,)
+        elif kind == 'interaction':
+            arguments = (event(i),)
+        elif kind == 'bulk':
+            events = [event(i) for _ in range(BULK_EVENTS)]
+            # A new user's interactions before their profile event leave
+            # their preferences alone
+            profile = new_profile(i)
+            events.insert(BULK_EVENTS // 2, dict(profile, type='profile'))
+            events.insert(BULK_EVENTS // 4, {'user_id': profile['user_id'], 'gig_id': 1, 'value': 1,
+                                             'interaction_type': 'click', 'timestamp': START_TIME + i})
+            arguments = (events,)
+        else:
+            arguments = (new_profile(i),)
+        operations.append((kind, arguments))
+    return operations
+
+
+# Words searched for by search operations
+SEARCH_WORDS = ('logo', 'design', 'art', 'web', 'video', 'music', 'writing', 'ai')
+
+
+def apply_operation(recommender, kind, arguments):
+    """
+    Run one operation
+
+    Returns:
+    - (is the result valid, snapshot checked) where the snapshot flag is
+      None for operations that do not check one
+    """
+    if kind == 'recommend':
+        results = recommender.get_user_recommendations(arguments[0], n=RECOMMENDATIONS)
+        scores = [result['recommendation_score'] for result in results]
+        return len(results) == RECOMMENDATIONS and scores == sorted(scores, reverse=True), None
+    if kind == 'explain':
+        return isinstance(recommender.explain_recommendation(*arguments), str), None
+    if kind == 'search':
+        query, user_id = arguments
+        return isinstance(recommender.search_gigs(query, 10, user_id=user_id), list), None
+    if kind == 'snapshot':
+        return True, snapshot_consistent(recommender, arguments[0])
+    if kind == 'interaction':
+        event = dict(arguments[0])
+        recommender.track_interaction(event.pop('user_id'), event.pop('gig_id'), **event)
+    elif kind == 'bulk':
+        recommender.track_interactions(arguments[0])
+    else:
+        profile = arguments[0]
+        recommender.create_user_profile(profile['user_id'], profile['name'], profile['preferences'],
+                                        profile['history'])
+    return True, None
+
+
+def snapshot_consistent(recommender, user_id):
+    """Whether a profile snapshot's feature vector is the one its own preferences and history give"""
+    snapshot = recommender.user_profiles.snapshot(user_id)
+    features = np.array(snapshot.preferences, dtype=np.float64)
+    for gig_id in snapshot.history:
+        category_id = recommender._gig_category_id(gig_id)
+        if category_id is not None:
+            features[category_id] += 0.5
+    if features.sum() > 0:
+        features /= features.sum()
+    return np.allclose(snapshot.features, features, rtol=TOLERANCE, atol=TOLERANCE)
+
+
+def replay_writes(snapshot_dir, operations):
+    """Load the snapshot and apply the write operations one by one on this thread"""
+    from service_recommender import ServiceRecommender
+
+    recommender = ServiceRecommender()
+    recommender.load_model(snapshot_dir)
+    for kind, arguments in operations:
+        if kind in WRITES:
+            apply_operation(recommender, kind, arguments)
+    return recommender
+
+
+def run_threads(snapshot_dir, operations, threads, config, catalog_writer, expected):
+    """Run the operations on threads (round-robin) next to a catalog writer; returns throughput and correctness"""
+    from service_recommender import ServiceRecommender
+
+    recommender = ServiceRecommender()
+    recommender.load_model(snapshot_dir)
+    catalog = list(synthetic.make_catalog(config['gigs'], seed=config['seed']))
+    lanes = [operations[lane::threads] for lane in range(threads)]
+    read_samples, write_samples = [], []
+    counts = {'errors': 0, 'invalid_results': 0, 'snapshot_checks': 0, 'snapshot_mismatches': 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+    catalog_changes = [0]
+
+    def worker(lane):
+        reads, writes = [], []
+        local = dict.fromkeys(counts, 0)
+        for kind, arguments in lane:
+            start = time.perf_counter()
+            try:
+                valid, consistent = apply_operation(recommender, kind, arguments)
+            except Exception:
+                local['errors'] += 1
+                continue
+            (writes if kind in WRITES else reads).append(time.perf_counter() - start)
+            local['invalid_results'] += not valid
+            if consistent is not None:
+                local['snapshot_checks'] += 1
+                local['snapshot_mismatches'] += not consistent
+        with lock:
+            read_samples.extend(reads)
+            write_samples.extend(writes)
+            for name, value in local.items():
+                counts[name] += value
+
+    def change_catalog():
+        rng = random.Random(config['seed'] + 2)
+        gigs = catalog[2]
+        while not stop.wait(CATALOG_PAUSE):
+            try:
+                step = catalog_changes[0] + 1
+                if step % RELOAD_EVERY == 0:
+                    recommender.load_data(catalog[0], catalog[1], gigs)
+                elif step % 2:
+                    row = rng.randrange(config['gigs'])
+                    change = {'price': rng.randrange(5, 500), 'star': rng.choice((3.5, 4.0, 4.5, 5.0))}
+                    gigs[row] = dict(gigs[row], **change)
+                    recommender.update_gig(gigs[row]['id'], change)
+                else:
+                    # Added gigs never appear in the generated writes
+                    gig = dict(gigs[rng.randrange(config['gigs'])], id=config['gigs'] + step)
+                    gigs.append(gig)
+                    recommender.add_gigs([gig])
+            except Exception:
+                with lock:
+                    counts['errors'] += 1
+            catalog_changes[0] += 1
+
+    workers = [threading.Thread(target=worker, args=(lane,)) for lane in lanes]
+    changer = threading.Thread(target=change_catalog) if catalog_writer else None
+    start = time.perf_counter()
+    if changer:
+        changer.start()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    seconds = time.perf_counter() - start
+    stop.set()
+    if changer:
+        changer.join()
+
+    reads = np.array(read_samples) * 1000
+    writes = np.array(write_samples) * 1000
+    mismatches = compare_states(final_state(recommender), expected)
+    return {
+        'throughput': {
+            'seconds': seconds,
+            'operations': len(operations),
+            'operations_per_second': len(operations) / seconds,
+            'reads_per_second': len(reads) / seconds,
+            'writes_per_second': len(writes) / seconds,
+            'read_p50_ms': float(np.percentile(reads, 50)) if len(reads) else None,
+            'read_p99_ms': float(np.percentile(reads, 99)) if len(reads) else None,
+            'write_p50_ms': float(np.percentile(writes, 50)) if len(writes) else None,
+            'write_p99_ms': float(np.percentile(writes, 99)) if len(writes) else None,
+        },
+        'correctness': dict(counts, state_mismatches=mismatches, catalog_changes=catalog_changes[0])
+    }
+
+
+def final_state(recommender):
+    """Return the profile, interaction and trending state compared after a run"""
+    store = recommender.user_profiles
+    profiles = {}
+    for user_id in store.user_ids:
+        snapshot = store.snapshot(user_id)
+        profiles[user_id] = (snapshot.name, snapshot.history, snapshot.preferences, snapshot.features)
+    trending = recommender.trending
+    return {
+        'profiles': profiles,
+        'interactions': dict(recommender.user_interactions),
+        'trending': {gig_id: trending.score(gig_id, START_TIME) for gig_id in trending.state()[0]}
+    }
+
+
+def compare_states(actual, expected):
+    """Count users, interaction lists and trending scores that differ"""
+    mismatches = len(set(actual['profiles']) ^ set(expected['profiles']))
+    for user_id, (name, history, preferences, features) in expected['profiles'].items():
+        found = actual['profiles'].get(user_id)
+        if found is None:
+            continue
+        mismatches += not (found[0] == name and found[1] == history
+                           and np.allclose(found[2], preferences, rtol=TOLERANCE, atol=TOLERANCE)
+                           and np.allclose(found[3], features, rtol=TOLERANCE, atol=TOLERANCE))
+    mismatches += sum(actual['interactions'].get(user_id) != interactions
+                      for user_id, interactions in expected['interactions'].items())
+    mismatches += len(set(actual['interactions']) - set(expected['interactions']))
+    for gig_id in set(actual['trending']) | set(expected['trending']):
+        mismatches += not np.isclose(actual['trending'].get(gig_id, 0.0), expected['trending'].get(gig_id, 0.0),
+                                     rtol=TOLERANCE, atol=0.0)
+    return mismatches
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,275 @@
+"""
+Seeded synthetic marketplace data for benchmarks
+
+Generates cards (categories), projects, gigs, user profiles and interaction
+streams in the shapes ServiceRecommender.load_data, create_user_profile and
+track_interactions expect. The same seed always produces the same data, so
+results from different commits are measured on identical inputs.
+
+Gig descriptions mention their category title the way real listings do
+("I will design a modern logo design for your brand"), a small share mention
+none, and gig and user popularity follow power laws, so category matching,
+trending and collaborative filtering see realistic skew.
+"""
+import json
+
+import numpy as np
+
+# Category titles, in the order they are assigned category ids
+CATEGORY_TITLES = [
+    'AI Artists', 'Logo Design', 'WordPress', 'Voice Over', 'Video Explainer',
+    'Social Media', 'SEO', 'Illustration', 'Data Entry', 'Web Development',
+    'Mobile Apps', 'Translation', 'Music Production', 'Copywriting',
+    'Product Photography', 'Animation', 'Game Development', 'Podcast Editing',
+    'Email Marketing', 'Resume Writing', 'Business Plans', 'UX Design',
+    'Data Science', 'Chatbots'
+]
+
+VERBS = ['create', 'design', 'build', 'write', 'edit', 'produce', 'deliver', 'craft']
+ADJECTIVES = ['professional', 'modern', 'custom', 'unique', 'high quality', 'fast', 'creative', 'minimalist']
+FILLERS = [
+    'for your brand', 'in 24 hours', 'with unlimited revisions', 'for your business',
+    'from your images and prompts', 'that converts', 'for small businesses', 'with source files'
+]
+# Descriptions that mention no category title (matched to the default category)
+GENERIC_DESCRIPTIONS = [
+    'I will help with your project', 'I will do any task you need',
+    'I will support your startup', 'I will be your virtual assistant'
+]
+
+PRICES = [5, 10, 15, 20, 25, 30, 40, 50, 59, 75, 79, 99, 110, 150, 200, 300, 500]
+STARS = [1, 2, 3, 3.5, 4, 4.5, 4.8, 5]
+STAR_WEIGHTS = [0.01, 0.02, 0.05, 0.07, 0.2, 0.3, 0.2, 0.15]
+
+INTERACTION_TYPES = ['view', 'click', 'favorite', 'purchase']
+INTERACTION_TYPE_WEIGHTS = [0.7, 0.2, 0.07, 0.03]
+
+# Share of gig descriptions that mention no category title
+GENERIC_SHARE = 0.05
+
+# Power-law exponents of gig and user popularity in interaction streams:
+# the k-th most popular gig is drawn with probability proportional to k ** -1.0
+GIG_POPULARITY_EXPONENT = 1.0
+USER_POPULARITY_EXPONENT = 0.5
+
+
+def category_titles(n_categories):
+    """Return n_categories distinct category titles"""
+    titles = CATEGORY_TITLES[:n_categories]
+    titles += [f"Niche Service {i}" for i in range(len(titles), n_categories)]
+    return titles
+
+
+def make_cards(n_categories=len(CATEGORY_TITLES)):
+    """Return card dicts (id, title, desc), one per category"""
+    return [{"id": i + 1, "title": title, "desc": f"Hire {title.lower()} experts"}
+            for i, title in enumerate(category_titles(n_categories))]
+
+
+def make_projects(n_projects, n_categories=len(CATEGORY_TITLES), seed=0):
+    """Return project dicts (id, cat, username)"""
+    rng = np.random.default_rng([seed, 1])
+    titles = category_titles(n_categories)
+    categories = rng.integers(0, len(titles), n_projects).tolist()
+    return [{"id": i + 1, "cat": titles[category], "username": f"creator{i % 997}"}
+            for i, category in enumerate(categories)]
+
+
+def make_gigs(n_gigs, n_categories=len(CATEGORY_TITLES), n_sellers=None, seed=0):
+    """
+    Return gig dicts (id, desc, price, star, username)
+
+    Parameters:
+    - n_gigs: Number of gigs; ids are 1..n_gigs
+    - n_categories: Number of category titles used in descriptions
+    - n_sellers: Distinct seller usernames (default: one per 20 gigs)
+    - seed: Random seed
+    """
+    rng = np.random.default_rng([seed, 2])
+    titles = [title.lower() for title in category_titles(n_categories)]
+    n_sellers = n_sellers or max(1, n_gigs // 20)
+
+    categories = rng.integers(0, len(titles), n_gigs).tolist()
+    generic = (rng.random(n_gigs) < GENERIC_SHARE).tolist()
+    verbs = rng.integers(0, len(VERBS), n_gigs).tolist()
+    adjectives = rng.integers(0, len(ADJECTIVES), n_gigs).tolist()
+    fillers = rng.integers(0, len(FILLERS), n_gigs).tolist()
+    prices = rng.choice(PRICES, n_gigs).tolist()
+    stars = rng.choice(STARS, n_gigs, p=STAR_WEIGHTS).tolist()
+    sellers = rng.integers(0, n_sellers, n_gigs).tolist()
+
+    gigs = []
+    for i in range(n_gigs):
+        if generic[i]:
+            desc = GENERIC_DESCRIPTIONS[fillers[i] % len(GENERIC_DESCRIPTIONS)]
+        else:
+            desc = f"I will {VERBS[verbs[i]]} {ADJECTIVES[adjectives[i]]} {titles[categories[i]]} {FILLERS[fillers[i]]}"
+        gigs.append({
+            "id": i + 1,
+            "desc": desc,
+            "price": prices[i],
+            "star": stars[i],
+            "username": f"seller{sellers[i]}"
+        })
+    return gigs
+
+
+def make_catalog(n_gigs, n_categories=len(CATEGORY_TITLES), seed=0):
+    """Return (cards, projects, gigs) for load_data"""
+    return (
+        make_cards(n_categories),
+        make_projects(max(1, n_gigs // 100), n_categories, seed),
+        make_gigs(n_gigs, n_categories, seed=seed)
+    )
+
+
+def make_profiles(n_users, n_gigs, n_categories=len(CATEGORY_TITLES), seed=0):
+    """
+    Return profile dicts (user_id, name, preferences, history) for create_user_profile
+
+    Each user prefers one to three categories and has bought up to five gigs.
+    """
+    rng = np.random.default_rng([seed, 3])
+    titles = category_titles(n_categories)
+    n_preferences = rng.integers(1, 4, n_users).tolist()
+    categories = rng.integers(0, len(titles), (n_users, 3)).tolist()
+    weights = np.round(rng.random((n_users, 3)), 2).tolist()
+    history_offsets = np.concatenate([[0], np.cumsum(rng.integers(0, 6, n_users))]).tolist()
+    history_gigs = (rng.integers(0, n_gigs, history_offsets[-1]) + 1).tolist()
+
+    profiles = []
+    for i in range(n_users):
+        count = n_preferences[i]
+        profiles.append({
+            "user_id": user_id(i),
+            "name": f"User {i}",
+            # A category drawn twice keeps its last weight
+            "preferences": {titles[category]: weight for category, weight in zip(categories[i][:count], weights[i][:count])},
+            "history": history_gigs[history_offsets[i]:history_offsets[i + 1]]
+        })
+    return profiles
+
+
+def user_id(index):
+    """Return the synthetic user id of a user index"""
+    return f"user{index}"
+
+
+def _power_law_indices(rng, permutation, size, exponent):
+    """
+    Draw entries of permutation with power-law popularity over their position
+
+    Uses the continuous inverse CDF of rank ** -exponent on [1, n + 1), so the
+    draw is bounded by n and costs O(size) for any n. The permutation spreads
+    the popular entries over the id space.
+    """
+    n = len(permutation)
+    uniform = rng.random(size)
+    if exponent == 1.0:
+        ranks = np.exp(uniform * np.log(n + 1))
+    else:
+        power = 1.0 - exponent
+        ranks = (uniform * ((n + 1) ** power - 1) + 1) ** (1.0 / power)
+    return permutation[np.minimum(ranks.astype(np.int64) - 1, n - 1)]
+
+
+def interaction_batches(n_events, n_users, n_gigs, batch_size=10000, start_time=1700000000.0,
+                        events_per_second=100.0, seed=0):
+    """
+    Yield lists of interaction event dicts for track_interactions
+
+    Events carry user_id, gig_id, interaction_type, value and timestamp, with
+    timestamps increasing at events_per_second. Users and gigs are drawn with
+    power-law popularity.
+
+    Parameters:
+    - n_events: Total number of events
+    - n_users: Number of distinct users (ids from user_id)
+    - n_gigs: Number of gigs (ids 1..n_gigs)
+    - batch_size: Events per yielded list
+    - start_time: Timestamp of the first event
+    - events_per_second: Event rate used for timestamps
+    - seed: Random seed
+    """
+    rng = np.random.default_rng([seed, 4])
+    user_order = rng.permutation(n_users)
+    gig_order = rng.permutation(n_gigs) + 1
+    for start in range(0, n_events, batch_size):
+        size = min(batch_size, n_events - start)
+        users = _power_law_indices(rng, user_order, size, USER_POPULARITY_EXPONENT).tolist()
+        gigs = _power_law_indices(rng, gig_order, size, GIG_POPULARITY_EXPONENT).tolist()
+        types = rng.choice(len(INTERACTION_TYPES), size, p=INTERACTION_TYPE_WEIGHTS).tolist()
+        timestamps = (start_time + (start + np.arange(size)) / events_per_second).tolist()
+        yield [
+            {
+                "user_id": user_id(user),
+                "gig_id": gig,
+                "interaction_type": INTERACTION_TYPES[interaction_type],
+                "value": 1,
+                "timestamp": timestamp
+            }
+            for user, gig, interaction_type, timestamp in zip(users, gigs, types, timestamps)
+        ]
+
+
+def search_queries(n_queries, n_categories=len(CATEGORY_TITLES), seed=0):
+    """
+    Return search strings typed by storefront users
+
+    Mostly a category title ("logo design"), sometimes with an adjective
+    ("modern logo design") or a single word of it ("logo").
+    """
+    rng = np.random.default_rng([seed, 6])
+    titles = [title.lower() for title in category_titles(n_categories)]
+    categories = rng.integers(0, len(titles), n_queries).tolist()
+    adjectives = rng.integers(0, len(ADJECTIVES), n_queries).tolist()
+    kinds = rng.choice(3, n_queries, p=[0.6, 0.2, 0.2]).tolist()
+    queries = []
+    for category, adjective, kind in zip(categories, adjectives, kinds):
+        title = titles[category]
+        if kind == 1:
+            title = f"{ADJECTIVES[adjective]} {title}"
+        elif kind == 2:
+            title = title.split()[0]
+        queries.append(title)
+    return queries
+
+
+def write_gig_dump(path, n_gigs, n_categories=len(CATEGORY_TITLES), seed=0):
+    """
+    Write gigs as a mongoexport JSONL dump of models/gig.model.js documents
+
+    Documents carry every schema field in Extended JSON ($oid ids, $date
+    timestamps), with the make_gigs description as the title and a longer
+    description, so parsing sees realistic line sizes.
+    """
+    rng = np.random.default_rng([seed, 5])
+    titles = category_titles(n_categories)
+    lowered = [title.lower() for title in titles]
+    star_numbers = rng.integers(0, 200, n_gigs).tolist()
+    sales = rng.integers(0, 1000, n_gigs).tolist()
+    with open(path, 'w') as f:
+        for i, gig in enumerate(make_gigs(n_gigs, n_categories, seed=seed)):
+            category = next((titles[c] for c, title in enumerate(lowered) if title in gig['desc']), titles[0])
+            document = {
+                "_id": {"$oid": f"{i + 1:024x}"},
+                "userId": {"$oid": f"{int(gig['username'][len('seller'):]):024x}"},
+                "title": gig['desc'],
+                "description": f"{gig['desc']}. " * 8 + "Message me before ordering!\nThanks, \"the team\"",
+                "totalStars": gig['star'] * star_numbers[i],
+                "starNumber": star_numbers[i],
+                "cat": category,
+                "price": gig['price'],
+                "cover": f"https://images.example.com/gigs/{i + 1}/cover.jpeg",
+                "images": [f"https://images.example.com/gigs/{i + 1}/{k}.jpeg" for k in range(3)],
+                "shortTitle": gig['desc'][:40],
+                "shortDesc": gig['desc'][:80],
+                "deliveryTime": 1 + i % 7,
+                "revisionNumber": i % 5,
+                "features": ["Source file", "High resolution", "Commercial use"],
+                "sales": sales[i],
+                "createdAt": {"$date": "2024-01-01T00:00:00Z"},
+                "updatedAt": {"$date": "2024-01-01T00:00:00Z"},
+                "__v": 0
+            }
+            f.write(json.dumps(document, separators=(',', ':')) + '\n')
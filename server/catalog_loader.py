@@ -0,0 +1,354 @@
+"""
+Streaming loader for mongoexport JSONL dumps
+
+mongoexport writes one document per line in MongoDB Extended JSON, e.g.
+{"_id":{"$oid":"..."},"title":"I will ...","price":59,...}. read_chunks()
+yields a dump in fixed-size chunks of whole lines, read from the file or
+sliced out of a memory map. load_collection() parses each chunk as a byte
+array: every '":' ends a JSON key (quotes inside string values are
+escaped), so the requested keys are located with vectorized comparisons
+and only their values are decoded, straight into typed NumPy columns
+(float64, int64, or object for strings and ids). No document is decoded
+into a dict, and only one chunk plus the columns are held at a time, so
+peak memory stays close to the size of the output.
+
+Unescaped strings, bare numbers and ObjectIds are cut out with vectorized
+searches; other values (escaped strings, booleans, null, the Extended JSON
+wrappers $numberInt, $numberLong, $numberDouble and $numberDecimal) go
+through a regular expression. A nested document with a key named like a
+requested field would match too; the first occurrence in a line wins. Gig,
+card and project documents have no such nesting.
+
+load_catalog() returns (cards, projects, gigs) as dicts of columns, which
+ServiceRecommender.load_data accepts in place of lists of row dicts.
+"""
+import gzip
+import json
+import logging
+import mmap
+import re
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bytes per chunk; a line cut by the chunk boundary moves to the next chunk
+CHUNK_BYTES = 8 * 1024 * 1024
+
+# Document field -> (column, kind, default) for gigs (models/gig.model.js).
+# The "I will ..." title is the text the recommender matches categories on.
+GIG_FIELDS = {
+    '_id': ('id', 'id', None),
+    'title': ('desc', 'str', ''),
+    'cat': ('cat', 'str', ''),
+    'price': ('price', 'float', 0.0),
+    'totalStars': ('total_stars', 'float', 0.0),
+    'starNumber': ('star_number', 'float', 0.0),
+    'sales': ('sales', 'int', 0),
+    'userId': ('seller_id', 'id', None),
+}
+GIG_REQUIRED = ('_id', 'title', 'price')
+
+CARD_FIELDS = {
+    '_id': ('id', 'id', None),
+    'title': ('title', 'str', ''),
+    'desc': ('desc', 'str', ''),
+}
+CARD_REQUIRED = ('_id', 'title')
+
+PROJECT_FIELDS = {
+    '_id': ('id', 'id', None),
+    'cat': ('cat', 'str', ''),
+    'username': ('username', 'str', ''),
+}
+PROJECT_REQUIRED = ('_id',)
+
+# Column dtype per field kind
+KIND_DTYPES = {'str': object, 'id': object, 'float': np.float64, 'int': np.int64}
+
+# A JSON value, with one group per form: string, number, Extended JSON
+# wrapper (type, quoted or bare payload), literal
+VALUE_PATTERN = (
+    rb'"([^"\\]*(?:\\.[^"\\]*)*)"'
+    rb'|(-?\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)'
+    rb'|\{\s*"\$(oid|numberInt|numberLong|numberDouble|numberDecimal)"\s*:\s*(?:"([^"]*)"|(-?[\d.eE+-]+))\s*\}'
+    rb'|(true|false|null)'
+)
+
+VALUE = re.compile(rb'\s*(?:' + VALUE_PATTERN + rb')')
+
+LITERALS = {b'true': 1, b'false': 0, b'null': None}
+
+NEWLINE, QUOTE, COLON, MINUS, BACKSLASH = b'\n":-\\'
+OPEN_BRACE, DIGIT_0, DIGIT_9 = b'{09'
+OBJECT_ID = np.frombuffer(b'{"$oid":"', dtype=np.uint8)
+
+# Bytes that can be part of a bare number, as a lookup table over byte values
+NUMBER_BYTES = np.zeros(256, dtype=bool)
+NUMBER_BYTES[list(b'0123456789.eE+-')] = True
+
+# Longest bare number decoded without the regular expression
+NUMBER_WIDTH = 32
+
+
+def read_chunks(path, chunk_bytes=CHUNK_BYTES, use_mmap=False):
+    """
+    Yield a JSONL file in chunks of whole lines
+
+    Parameters:
+    - path: JSONL file (.gz files are decompressed on the fly)
+    - chunk_bytes: Approximate bytes per chunk (a longer line is yielded whole)
+    - use_mmap: Slice chunks out of a read-only memory map instead of
+      reading them (yields memoryviews; not for .gz files)
+
+    Every chunk ends with a newline.
+    """
+    if use_mmap and not path.endswith('.gz'):
+        yield from _mapped_chunks(path, chunk_bytes)
+        return
+
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        carry = b''
+        while True:
+            data = f.read(chunk_bytes)
+            if not data:
+                break
+            end = data.rfind(b'\n') + 1
+            if not end:
+                carry += data
+                continue
+            yield carry + data[:end]
+            carry = data[end:]
+        if carry.strip():
+            yield carry + b'\n'
+
+
+def _mapped_chunks(path, chunk_bytes):
+    with open(path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            return
+    view = memoryview(mapped)
+    try:
+        start = 0
+        while start < len(mapped):
+            end = mapped.find(b'\n', min(start + chunk_bytes, len(mapped)) - 1) + 1 or len(mapped)
+            if end == len(mapped) and mapped[end - 1:end] != b'\n':
+                yield bytes(view[start:end]) + b'\n'
+            else:
+                yield view[start:end]
+            # Parsed pages are dropped from the resident set (they are clean
+            # page cache pages, read back in if touched again)
+            if hasattr(mapped, 'madvise'):
+                page_start = start - start % mmap.PAGESIZE
+                mapped.madvise(mmap.MADV_DONTNEED, page_start, end - end % mmap.PAGESIZE - page_start)
+            start = end
+    finally:
+        view.release()
+        try:
+            mapped.close()
+        except BufferError:
+            # The caller still holds a chunk; the map closes when it is collected
+            pass
+
+
+def load_collection(path, fields, required=(), chunk_bytes=CHUNK_BYTES, use_mmap=False):
+    """
+    Load selected fields of a mongoexport JSONL dump into NumPy columns
+
+    Parameters:
+    - path: JSONL file, one document per line
+    - fields: Dict of document field -> (column name, kind, default), kind one
+      of 'str', 'id', 'float' or 'int'
+    - required: Document fields a row must have; rows without them are skipped
+    - chunk_bytes: Bytes parsed at a time
+    - use_mmap: Parse chunks straight out of a memory map
+
+    Returns:
+    - Dict of column name -> NumPy array, in the order of fields
+    """
+    start_time = time.perf_counter()
+    keys = list(fields)
+    chunks = {key: [] for key in keys}  # Field -> typed column arrays, one per chunk
+    rows = skipped = 0
+    for chunk in read_chunks(path, chunk_bytes, use_mmap):
+        columns, found = _parse_chunk(chunk, fields)
+        del chunk  # Releases a memory-mapped chunk
+        documents = np.any(found, axis=0)  # Blank lines have no fields
+        keep = documents.copy()
+        for key in required:
+            keep &= found[keys.index(key)]
+        for key in keys:
+            chunks[key].append(columns[key][keep])
+        rows += int(np.count_nonzero(keep))
+        skipped += int(np.count_nonzero(documents)) - int(np.count_nonzero(keep))
+
+    seconds = time.perf_counter() - start_time
+    logger.info("Loaded %d documents from %s in %.2fs (%.0f rows/s, %d skipped)",
+                rows, path, seconds, rows / seconds if seconds else 0.0, skipped)
+    return {fields[key][0]: np.concatenate(chunks[key]) if chunks[key] else _typed([], fields[key][1])
+            for key in keys}
+
+
+def _parse_chunk(chunk, fields):
+    """
+    Extract fields from a chunk of whole lines
+
+    Returns:
+    - (dict of field -> column with one entry per line, bool array of
+      field x line that is True where the line has the field)
+    """
+    data = np.frombuffer(chunk, dtype=np.uint8)
+    line_ends = np.flatnonzero(data == NEWLINE)
+    quotes = np.flatnonzero(data == QUOTE)
+    # A chunk ends with a newline, so a quote is never its last byte
+    key_ends = quotes[data[quotes + 1] == COLON]
+
+    columns = {}
+    found = np.zeros((len(fields), len(line_ends)), dtype=bool)
+    for i, (key, (_, kind, default)) in enumerate(fields.items()):
+        name = np.frombuffer(b'"' + key.encode('utf-8'), dtype=np.uint8)
+        starts = key_ends[key_ends >= len(name)] - len(name)
+        # Cheap filter on the first letter, then the whole key
+        starts = starts[data[starts + 1] == name[1]]
+        starts = starts[np.all(data[starts[:, None] + np.arange(len(name))] == name, axis=1)]
+
+        # The first occurrence in a line wins
+        lines = np.searchsorted(line_ends, starts)
+        first = np.ones(len(lines), dtype=bool)
+        first[1:] = lines[1:] != lines[:-1]
+        starts, lines = starts[first], lines[first]
+
+        column = np.full(len(line_ends), default, dtype=KIND_DTYPES[kind])
+        column[lines] = _decode_values(chunk, data, starts + len(name) + 2, kind, default, quotes)
+        columns[key] = column
+        found[i, lines] = True
+    return columns, found
+
+
+def _decode_values(chunk, data, starts, kind, default, quotes):
+    """
+    Decode the JSON values beginning at byte offsets of a chunk
+
+    Strings without escapes, bare numbers and ObjectIds (the bulk of a
+    mongoexport dump) are cut out with vectorized searches; anything else
+    goes through the VALUE regular expression.
+    """
+    values = np.full(len(starts), default, dtype=KIND_DTYPES[kind])
+    first = data[starts]
+    pending = np.ones(len(starts), dtype=bool)
+
+    # "text": the closing quote is the next quote unless it is escaped
+    strings = np.flatnonzero(first == QUOTE)
+    ends = quotes[np.searchsorted(quotes, starts[strings] + 1)]
+    plain = data[ends - 1] != BACKSLASH
+    strings, ends = strings[plain], ends[plain]
+    if len(strings):
+        texts = [str(chunk[start + 1:end], 'utf-8') for start, end in zip(starts[strings].tolist(), ends.tolist())]
+        if kind in ('str', 'id'):
+            values[strings] = _typed(texts, kind)
+            pending[strings] = False
+
+    # Bare numbers run to the first byte that cannot be part of one
+    numbers = np.flatnonzero(((first >= DIGIT_0) & (first <= DIGIT_9)) | (first == MINUS))
+    if len(numbers) and kind in ('float', 'int'):
+        # Fixed-width windows, NUL-padded after the number, parse as an S array
+        window = data[np.minimum(starts[numbers][:, None] + np.arange(NUMBER_WIDTH), len(data) - 1)]
+        lengths = np.argmin(NUMBER_BYTES[window], axis=1)
+        window[np.arange(NUMBER_WIDTH) >= lengths[:, None]] = 0
+        texts = window.view(f'S{NUMBER_WIDTH}').ravel()
+        try:
+            values[numbers] = texts.astype(KIND_DTYPES[kind])
+            pending[numbers] = False
+        except ValueError:
+            pass  # e.g. 2.5 for an int column: decoded one by one below
+
+    # {"$oid":"<24 hex digits>"}
+    objects = np.flatnonzero(first == OPEN_BRACE)
+    objects = objects[starts[objects] + len(OBJECT_ID) + 26 <= len(data)]
+    objects = objects[np.all(data[starts[objects][:, None] + np.arange(len(OBJECT_ID))] == OBJECT_ID, axis=1)]
+    if len(objects) and kind in ('str', 'id'):
+        offsets = (starts[objects] + len(OBJECT_ID)).tolist()
+        values[objects] = _typed([str(chunk[offset:offset + 24], 'ascii') for offset in offsets], kind)
+        pending[objects] = False
+
+    for index in np.flatnonzero(pending).tolist():
+        values[index] = _decode(VALUE.match(chunk, int(starts[index])), kind, default)
+    return values
+
+
+def load_gigs(path, **kwargs):
+    """
+    Load a gig collection dump as load_data columns
+
+    Adds star (totalStars / starNumber, 0 for unrated gigs, as the client
+    shows it before rounding). Keyword arguments go to load_collection.
+    """
+    gigs = load_collection(path, GIG_FIELDS, GIG_REQUIRED, **kwargs)
+    total_stars, star_number = gigs.pop('total_stars'), gigs.pop('star_number')
+    gigs['star'] = np.divide(total_stars, star_number, out=np.zeros_like(total_stars), where=star_number > 0)
+    return gigs
+
+
+def load_catalog(gigs_path, cards_path=None, projects_path=None, **kwargs):
+    """
+    Load the catalog collections for ServiceRecommender.load_data
+
+    Parameters:
+    - gigs_path: Gig collection dump
+    - cards_path: Category card dump (default: one card per distinct gig cat)
+    - projects_path: Project dump (default: no projects)
+    - kwargs: Passed to load_collection (chunk_bytes, use_mmap)
+
+    Returns:
+    - (cards, projects, gigs) as dicts of columns
+
+    Usage: recommender.load_data(*load_catalog('gigs.jsonl'))
+    """
+    gigs = load_gigs(gigs_path, **kwargs)
+    if cards_path:
+        cards = load_collection(cards_path, CARD_FIELDS, CARD_REQUIRED, **kwargs)
+    else:
+        titles = np.array(sorted(set(gigs['cat'].tolist()) - {''}), dtype=object)
+        cards = {'id': np.arange(1, len(titles) + 1), 'title': titles, 'desc': np.full(len(titles), '', dtype=object)}
+    if projects_path:
+        projects = load_collection(projects_path, PROJECT_FIELDS, PROJECT_REQUIRED, **kwargs)
+    else:
+        projects = {column: _typed([], kind) for column, kind, _ in PROJECT_FIELDS.values()}
+    return cards, projects, gigs
+
+
+def _decode(match, kind, default):
+    """Convert a matched value to the Python value of a column kind"""
+    if match is None:
+        return default
+    string, number, wrapper, payload, bare, literal = match.groups()
+    if string is not None:
+        if b'\\' in string:
+            return json.loads(b'"' + string + b'"')
+        return string.decode('utf-8')
+    if wrapper is not None:
+        if wrapper == b'oid':
+            return payload.decode('ascii')
+        number = payload if payload is not None else bare
+    if number is not None:
+        if kind == 'int':
+            return int(float(number)) if b'.' in number or b'e' in number.lower() else int(number)
+        if kind == 'float':
+            return float(number)
+        # Numeric ids and strings keep their JSON type
+        return int(number) if number.lstrip(b'-').isdigit() else float(number)
+    value = LITERALS[literal]
+    return default if value is None else value
+
+
+def _typed(values, kind):
+    dtype = KIND_DTYPES[kind]
+    if dtype is object:
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+    return np.array(values, dtype=dtype)
@@ -0,0 +1,146 @@
+"""
+Multi-pattern category matching for gig descriptions
+
+For every description, finds the first category title (in category order)
+that occurs in it as a case-insensitive substring. Titles are compiled once
+into a byte-level Aho-Corasick automaton stored as a dense DFA table, and
+descriptions are fed through it in blocks with one vectorized transition per
+character position. The cost is O(total description length) no matter how
+many categories there are.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import numpy as np
+
+# Priority stored for automaton states where no title ends
+NO_MATCH = np.iinfo(np.int32).max
+
+# Upper bound on the padded rows x width byte block matched at once
+MATCH_BLOCK_BYTES = 16 * 1024 * 1024
+
+# Catalogs at least this large are matched in chunks across a process pool
+PARALLEL_MIN_ROWS = 200000
+
+# Descriptions sent to a worker per task
+PARALLEL_CHUNK_ROWS = 50000
+
+
+class CategoryMatcher:
+    def __init__(self, titles, category_ids, default_category_id):
+        """
+        Compile the category titles into a matching automaton
+
+        Parameters:
+        - titles: Category titles in priority order (earlier titles win)
+        - category_ids: Category id for each title
+        - default_category_id: Category assigned when no title matches
+        """
+        self.category_ids = np.append(np.asarray(category_ids, dtype=np.int64), default_category_id)
+        self._goto, self._output = self._compile([title.lower().encode('utf-8') for title in titles])
+
+    @staticmethod
+    def _compile(patterns):
+        """Build the DFA transition table and per-state best priority"""
+        # Trie of the patterns
+        children = [{}]
+        own = [NO_MATCH]
+        for priority, pattern in enumerate(patterns):
+            node = 0
+            for byte in pattern:
+                child = children[node].get(byte)
+                if child is None:
+                    child = len(children)
+                    children[node][byte] = child
+                    children.append({})
+                    own.append(NO_MATCH)
+                node = child
+            own[node] = min(own[node], priority)
+
+        n_states = len(children)
+        goto = np.zeros((n_states, 256), dtype=np.int32)
+        output = np.array(own, dtype=np.int32)
+        fail = np.zeros(n_states, dtype=np.int32)
+
+        # Breadth-first over the trie, so every failure state is finished
+        # before the states that fall back to it
+        queue = deque()
+        for byte, child in children[0].items():
+            goto[0, byte] = child
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            output[node] = min(output[node], output[fail[node]])
+            goto[node] = goto[fail[node]]
+            for byte, child in children[node].items():
+                if node:
+                    fail[child] = goto[fail[node], byte]
+                goto[node, byte] = child
+                queue.append(child)
+
+        return goto.ravel(), output
+
+    def match(self, descriptions, n_workers=None):
+        """
+        Return the category id for each description
+
+        Parameters:
+        - descriptions: Sequence of description strings
+        - n_workers: Worker processes for large inputs (default: CPU count;
+          1 disables the pool)
+        """
+        descriptions = list(descriptions)
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+
+        if n_workers > 1 and len(descriptions) >= PARALLEL_MIN_ROWS:
+            chunks = [descriptions[start:start + PARALLEL_CHUNK_ROWS]
+                      for start in range(0, len(descriptions), PARALLEL_CHUNK_ROWS)]
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                priorities = np.concatenate(list(pool.map(self._match_priorities, chunks)))
+        else:
+            priorities = self._match_priorities(descriptions)
+
+        # NO_MATCH maps to the trailing default category id
+        return self.category_ids[np.minimum(priorities, len(self.category_ids) - 1)]
+
+    def _match_priorities(self, descriptions):
+        """Return the best matching title priority for each description"""
+        encoded = [desc.lower().encode('utf-8') for desc in descriptions]
+        n_rows = len(encoded)
+        lengths = np.fromiter(map(len, encoded), dtype=np.intp, count=n_rows)
+
+        # Longest first, so each block pads to its own width and each step
+        # only touches the prefix of rows that are still long enough
+        order = np.argsort(-lengths, kind='stable')
+        priorities = np.empty(n_rows, dtype=np.int32)
+
+        start = 0
+        while start < n_rows:
+            width = max(int(lengths[order[start]]), 1)
+            end = min(n_rows, start + max(1, MATCH_BLOCK_BYTES // width))
+            rows = order[start:end]
+            priorities[rows] = self._match_block([encoded[row] for row in rows], lengths[rows], width)
+            start = end
+
+        return priorities
+
+    def _match_block(self, encoded, lengths, width):
+        """Run one block of descriptions (sorted longest first) through the DFA"""
+        n_rows = len(encoded)
+        block = np.array(encoded, dtype=f'S{width}').view(np.uint8).reshape(n_rows, width)
+
+        state = np.zeros(n_rows, dtype=np.int32)
+        best = np.full(n_rows, self._output[0], dtype=np.int32)
+        active = n_rows
+        for position in range(width):
+            while active and lengths[active - 1] <= position:
+                active -= 1
+            if not active:
+                break
+            current = self._goto[state[:active] * 256 + block[:active, position]]
+            state[:active] = current
+            np.minimum(best[:active], self._output[current], out=best[:active])
+
+        return best
@@ -0,0 +1,262 @@
+"""
+Lean columnar tables for the serving path
+
+The catalog (gigs, category cards, projects) is held as ColumnTables: one
+NumPy array per column (object arrays for strings and ids), in column
+order. Requests need row lookups and JSON, not a dataframe, so this module
+imports NumPy only. to_frame() builds a pandas DataFrame for offline
+tooling and imports pandas on first use.
+
+Tables are immutable: every change returns a new table sharing the
+untouched columns, so a request holding the old table keeps reading
+consistent rows. Each table caches the JSON text of the rows it has served
+(compact, keys in column order, without the closing brace). Responses are
+assembled by appending the per-request fields (scores, explanations) to
+that text, so a gig is encoded once per catalog version instead of once
+per response. The cache is shared with tables that only append rows and
+starts empty after any other change.
+"""
+import json
+
+import numpy as np
+
+# Serialized rows cached per table before the cache is emptied
+JSON_CACHE_ROWS = 200000
+
+# Separators of the cached JSON, as Flask's jsonify writes it
+JSON_SEPARATORS = (',', ':')
+
+
+class ColumnTable:
+    def __init__(self, columns, n_rows=0):
+        """
+        Wrap columns as a table
+
+        Parameters:
+        - columns: Dict of column name -> NumPy array or list, all of one
+          length, in column order. Lists become object arrays as they are;
+          from_data() infers numeric types the way pandas does.
+        - n_rows: Row count of a table without columns
+        """
+        self._columns = {name: _array(values) for name, values in columns.items()}
+        self.names = list(self._columns)
+        self.n_rows = len(next(iter(self._columns.values()))) if self._columns else n_rows
+        self._json_rows = {}  # Row -> cached JSON text (see the module docstring)
+        self._frame = None  # DataFrame built by to_frame()
+
+    @classmethod
+    def from_data(cls, data):
+        """
+        Build a table from JSON rows (a list of dicts) or columns (a dict of arrays or lists)
+
+        Columns of bools, ints or numbers become bool, int64 or float64
+        arrays; other columns become object arrays. Missing and None cells
+        are NaN in number columns and None elsewhere.
+        """
+        if isinstance(data, dict):
+            return cls({name: values if isinstance(values, np.ndarray) else _infer(list(values))
+                        for name, values in data.items()})
+        # Columns in order of first appearance
+        names = {}
+        for row in data:
+            names.update(dict.fromkeys(row))
+        return cls({name: _infer([row.get(name) for row in data]) for name in names}, len(data))
+
+    def __len__(self):
+        return self.n_rows
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __getitem__(self, name):
+        """Return a column as a NumPy array (shared; do not change it)"""
+        return self._columns[name]
+
+    def record(self, row):
+        """Return a row as a dict of Python values"""
+        return {name: column.item(row) for name, column in self._columns.items()}
+
+    def json_row(self, row):
+        """Return the JSON object of a row without its closing brace, cached per table"""
+        text = self._json_rows.get(row)
+        if text is None:
+            if len(self._json_rows) >= JSON_CACHE_ROWS:
+                self._json_rows.clear()
+            text = json.dumps(self.record(row), separators=JSON_SEPARATORS, default=_json_default)[:-1]
+            self._json_rows[row] = text
+        return text
+
+    def to_json(self, rows, fields=None):
+        """
+        Return rows as a JSON array of objects, spliced from the cached row text
+
+        Parameters:
+        - rows: Row positions
+        - fields: Dict of field name -> list of values, one per row,
+          appended to each object after the columns (e.g. scores)
+        """
+        fields = fields or {}
+        names = [json.dumps(name) + ':' for name in fields]
+        objects = []
+        for i, row in enumerate(rows):
+            parts = [self.json_row(row)]
+            for name, values in zip(names, fields.values()):
+                parts.append(name if parts[-1] == '{' else ',' + name)
+                parts.append(json.dumps(values[i], default=_json_default))
+            parts.append('}')
+            objects.append(''.join(parts))
+        return '[' + ','.join(objects) + ']'
+
+    def with_columns(self, columns):
+        """Return a copy with columns added or replaced (dict of name -> array)"""
+        return ColumnTable({**self._columns, **columns}, self.n_rows)
+
+    def with_values(self, row, values):
+        """
+        Return a copy with cells of one row changed
+
+        Parameters:
+        - row: Row position
+        - values: Dict of column name -> value. A new column is None in
+          the other rows; a typed column that cannot hold its new value
+          exactly becomes an object column.
+        """
+        columns = dict(self._columns)
+        for name, value in values.items():
+            column = columns.get(name)
+            if column is None:
+                column = np.full(self.n_rows, None, dtype=object)
+            elif _fits(column, value):
+                column = column.copy()
+            else:
+                column = column.astype(object)
+            column[row] = value
+            columns[name] = column
+        return ColumnTable(columns, self.n_rows)
+
+    def append(self, other):
+        """
+        Return a table with the rows of other after these
+
+        Columns are matched by name. Cells of columns one side lacks are
+        missing (NaN in number columns, None elsewhere), and int columns
+        meeting float columns become float.
+        """
+        names = self.names + [name for name in other.names if name not in self._columns]
+        columns = {name: _concatenate(self._column(name, other), other._column(name, self)) for name in names}
+        table = ColumnTable(columns, self.n_rows + other.n_rows)
+        if names == self.names and all(columns[name].dtype == self._columns[name].dtype for name in names):
+            # Existing rows serialize as before
+            table._json_rows = self._json_rows
+        return table
+
+    def take(self, rows):
+        """Return a table of the given rows, in that order"""
+        return ColumnTable({name: column[rows] for name, column in self._columns.items()}, len(rows))
+
+    def to_frame(self):
+        """Return the table as a pandas DataFrame, for offline tooling (imports pandas)"""
+        if self._frame is None:
+            import pandas as pd
+            self._frame = pd.DataFrame(self._columns, columns=self.names, index=pd.RangeIndex(self.n_rows), copy=False)
+        return self._frame
+
+    def _column(self, name, other):
+        """Return a column, or missing cells typed after other's column of that name"""
+        column = self._columns.get(name)
+        if column is not None:
+            return column
+        if other[name].dtype.kind in 'iuf':
+            return np.full(self.n_rows, np.nan)
+        return np.full(self.n_rows, None, dtype=object)
+
+
+class RecordList(list):
+    def __init__(self, table, rows, fields=None):
+        """
+        Row dicts of a table, as returned to Python callers, that can also
+        be written as JSON straight from the table's cached rows
+
+        Parameters:
+        - table: ColumnTable the rows belong to
+        - rows: Row positions
+        - fields: Dict of field name -> list of values, one per row, added
+          to every dict (e.g. scores)
+        """
+        self.table = table
+        self.rows = list(rows)
+        self.fields = fields or {}
+        records = []
+        for i, row in enumerate(self.rows):
+            record = table.record(row)
+            for name, values in self.fields.items():
+                record[name] = values[i]
+            records.append(record)
+        super().__init__(records)
+
+    def to_json(self, **fields):
+        """
+        Return the records as a JSON array, with more per-record fields
+        given as lists (e.g. explanation=[...])
+
+        The text comes from the table, so changes made to the dicts after
+        they were returned are not included.
+        """
+        return self.table.to_json(self.rows, {**self.fields, **fields})
+
+
+def _array(values):
+    """Return a column as an array, keeping arrays and wrapping lists as object arrays"""
+    if isinstance(values, np.ndarray):
+        return values
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def _infer(values):
+    """Type a column of Python values: bool, int64 or float64 when every value fits, else object"""
+    present = [value for value in values if value is not None]
+    if present and all(isinstance(value, (bool, np.bool_)) for value in present):
+        if len(present) == len(values):
+            return np.array(values, dtype=bool)
+    elif present and all(isinstance(value, (int, float, np.integer, np.floating)) for value in present):
+        if len(present) == len(values) and all(isinstance(value, (int, np.integer)) for value in values):
+            try:
+                return np.array(values, dtype=np.int64)
+            except OverflowError:
+                return _array(values)
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    return _array(values)
+
+
+def _fits(column, value):
+    """Whether a typed column can hold a value exactly"""
+    kind = column.dtype.kind
+    if kind == 'O':
+        return True
+    if isinstance(value, (bool, np.bool_)):
+        return kind == 'b'
+    if kind == 'b' or not isinstance(value, (int, float, np.integer, np.floating)):
+        return False
+    if value != value:
+        return kind == 'f'
+    try:
+        return column.dtype.type(value) == value
+    except OverflowError:
+        return False
+
+
+def _concatenate(first, second):
+    """Concatenate two columns, as object arrays unless both hold numbers or both bools"""
+    kinds = first.dtype.kind + second.dtype.kind
+    if all(kind in 'iuf' for kind in kinds) or kinds == 'bb':
+        return np.concatenate([first, second])
+    return np.concatenate([first.astype(object), second.astype(object)])
+
+
+def _json_default(value):
+    # NumPy scalars inside object columns
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
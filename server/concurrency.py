@@ -0,0 +1,141 @@
+"""
+Locking and state swapping for concurrent requests
+
+Writers to different users should not wait for each other, and readers
+should not wait at all. StripedLock maps keys (user ids) onto a fixed set
+of locks: writers hold the stripes of the users they change, so writes to
+users in different stripes run in parallel, and multi-user writes take
+their stripes in ascending order so they cannot deadlock. StripedTurns
+orders work the same way without holding a lock while queueing it: work on
+keys of one stripe runs in the order it was queued, work on other stripes
+in parallel.
+
+SwappableState is an attribute bag holding state that is replaced as a
+whole. An owner exposes its fields with state_property and reads them
+through its _state_view() method, which returns the state the calling
+thread is bound to. A writer changes a private copy and publishes it with
+one reference assignment, so a reader bound to the old state keeps seeing
+all of it until it finishes.
+"""
+from contextlib import contextmanager
+import threading
+
+# Lock stripes per StripedLock
+DEFAULT_STRIPES = 64
+
+
+class StripedLock:
+    def __init__(self, n_stripes=DEFAULT_STRIPES):
+        """
+        Create a set of lock stripes
+
+        Parameters:
+        - n_stripes: Number of locks keys are spread over
+        """
+        self._locks = [threading.Lock() for _ in range(n_stripes)]
+
+    def __len__(self):
+        return len(self._locks)
+
+    def stripe(self, key):
+        """Return the stripe of a key"""
+        return hash(key) % len(self._locks)
+
+    @contextmanager
+    def hold(self, key):
+        """Hold the stripe of one key"""
+        with self._locks[hash(key) % len(self._locks)]:
+            yield
+
+    @contextmanager
+    def hold_stripes(self, stripes):
+        """Hold stripes by number, taken in ascending order"""
+        locks = [self._locks[stripe] for stripe in sorted(set(stripes))]
+        held = 0
+        try:
+            for lock in locks:
+                lock.acquire()
+                held += 1
+            yield
+        finally:
+            for lock in reversed(locks[:held]):
+                lock.release()
+
+    def hold_many(self, keys):
+        """Hold the stripes of several keys"""
+        return self.hold_stripes(self.stripe(key) for key in keys)
+
+    def hold_all(self):
+        """Hold every stripe"""
+        return self.hold_stripes(range(len(self._locks)))
+
+
+class StripedTurns:
+    def __init__(self, n_stripes=DEFAULT_STRIPES):
+        """
+        Per-stripe turns for work that must run in the order it was queued
+
+        take() hands out a turn in every stripe of the keys, in the order it
+        is called (callers serialize it, e.g. under the lock that orders
+        their log); turn() waits until every earlier turn in those stripes
+        has finished. Turns only wait for earlier turns, so they cannot
+        deadlock.
+
+        Parameters:
+        - n_stripes: Number of stripes keys are spread over
+        """
+        self._n_stripes = n_stripes
+        self._next = [0] * n_stripes  # Stripe -> next turn handed out
+        self._done = [0] * n_stripes  # Stripe -> turns finished
+        self._running = 0  # Turns taken and not finished
+        self._changed = threading.Condition()
+
+    def take(self, keys):
+        """Return this caller's turn (stripe -> position) in the stripes of keys"""
+        stripes = {hash(key) % self._n_stripes for key in keys}
+        with self._changed:
+            turns = {stripe: self._next[stripe] for stripe in stripes}
+            for stripe in stripes:
+                self._next[stripe] += 1
+            self._running += 1
+        return turns
+
+    @contextmanager
+    def turn(self, turns):
+        """Wait for a take() result's turn, hold it for the block and finish it"""
+        try:
+            with self._changed:
+                self._changed.wait_for(lambda: all(self._done[stripe] == turn for stripe, turn in turns.items()))
+            yield
+        finally:
+            with self._changed:
+                for stripe in turns:
+                    self._done[stripe] += 1
+                self._running -= 1
+                self._changed.notify_all()
+
+    def wait_idle(self):
+        """Wait until every turn taken so far has finished"""
+        with self._changed:
+            self._changed.wait_for(lambda: not self._running)
+
+
+class SwappableState:
+    """Attribute bag for state replaced as a whole (see state_property)"""
+
+    def copy(self):
+        """Return a shallow copy"""
+        state = SwappableState()
+        state.__dict__.update(self.__dict__)
+        return state
+
+
+def state_property(name):
+    """Return a property reading and writing a field of the owner's _state_view()"""
+    def get(self):
+        return getattr(self._state_view(), name)
+
+    def set(self, value):
+        setattr(self._state_view(), name, value)
+
+    return property(get, set, doc=f"{name} of the current state")
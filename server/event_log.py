@@ -0,0 +1,551 @@
+"""
+Append-only interaction event log and background ingestion
+
+Events are appended as JSON lines to numbered segment files, and a new
+segment is started once the current one reaches the size limit. Segments are
+never rewritten, so replaying them in order at startup rebuilds every
+profile. The ingestor appends each submitted batch to the log before
+queueing it. A background thread then folds queued events into the
+recommender in micro-batches, so a burst of events for one user costs a
+single feature vector recompute.
+
+A log can also be shared by several processes (prefork server workers).
+Appends then take an exclusive file lock and follow rotations made by other
+processes, and each process folds events by reading them back from the log
+rather than from memory. Every process therefore applies every event in the
+same order, however the writes were spread over them.
+"""
+import json
+import logging
+import math
+import os
+import threading
+
+from concurrency import StripedTurns
+
+try:
+    import fcntl
+except ImportError:  # Windows: shared logs are unavailable
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Segment size at which the log rotates to a new file
+SEGMENT_BYTES = 64 * 1024 * 1024
+
+# Events handed to the recommender per fold
+FOLD_BATCH_EVENTS = 5000
+
+# Seconds the worker waits for more events before folding a partial batch
+FOLD_INTERVAL = 0.05
+
+# Bytes of a shared log read per catch-up step
+READ_BYTES = 4 * 1024 * 1024
+
+
+def event_error(event):
+    """
+    Return why an event cannot be folded, or None if it can
+
+    The ingestor refuses invalid events before logging them, since a logged
+    event is replayed at every start. Folding checks again and skips the
+    invalid events of logs written before these checks.
+
+    Parameters:
+    - event: Interaction or profile event (see ServiceRecommender.track_interactions)
+    """
+    if not isinstance(event, dict):
+        return "event must be an object"
+    if not _is_id(event.get('user_id')):
+        return "user_id must be a string or an integer"
+    if event.get('type') == 'profile':
+        if not isinstance(event.get('name', ''), str):
+            return "name must be a string"
+        preferences = event.get('preferences') or {}
+        if not isinstance(preferences, dict) or not all(map(_is_number, preferences.values())):
+            return "preferences must map category names to numbers"
+        history = event.get('history') or []
+        if not isinstance(history, list) or not all(map(_is_id, history)):
+            return "history must be a list of gig ids"
+        return None
+    if event.get('type') is not None:
+        return f"unknown event type {event['type']!r}"
+    if not _is_id(event.get('gig_id')):
+        return "gig_id must be a string or an integer"
+    if not isinstance(event.get('interaction_type', 'view'), str):
+        return "interaction_type must be a string"
+    # Trending scores and preference weights only ever grow
+    if not _is_number(event.get('value', 1)) or event.get('value', 1) < 0:
+        return "value must be a non-negative finite number"
+    if event.get('timestamp') is not None and not _is_number(event['timestamp']):
+        return "timestamp must be a finite number"
+    return None
+
+
+def _is_id(value):
+    # User and gig ids are JSON strings or integers
+    return isinstance(value, (str, int)) and not isinstance(value, bool)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+class FileLock:
+    def __init__(self, path):
+        """
+        Exclusive lock between processes (flock on a lock file)
+
+        The file is opened on first use in each process: flock locks belong to
+        an open file description, which a forked child would otherwise share
+        with its parent.
+
+        Parameters:
+        - path: Lock file, created if missing
+        """
+        if fcntl is None:
+            raise RuntimeError("File locks need fcntl (not available on this platform)")
+        self.path = path
+        self._file = None
+        self._pid = None
+
+    def __enter__(self):
+        if self._pid != os.getpid():
+            self._file = open(self.path, 'ab')
+            self._pid = os.getpid()
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        return False
+
+
+class EventLog:
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, fsync=False, shared=False):
+        """
+        Open (or create) an event log directory for appending
+
+        Parameters:
+        - directory: Directory holding the segment files
+        - segment_bytes: Size at which a new segment is started
+        - fsync: Whether to fsync after every append (durable across power loss)
+        - shared: Whether other processes append to the same directory
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.shared = shared
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._process_lock = FileLock(os.path.join(directory, 'append.lock')) if shared else None
+        self._pid = os.getpid()
+
+        # Keep appending to the newest segment; a torn final line from a
+        # crash is terminated so the next event starts on its own line
+        segments = self.segments()
+        self._segment_index = self._parse_index(segments[-1]) if segments else 1
+        self._file = open(self._segment_path(self._segment_index), 'ab')
+        if self._file.tell() and not self._ends_with_newline(self._file.name):
+            self._file.write(b'\n')
+            self._file.flush()
+
+    def segments(self):
+        """Return the segment file paths in append order"""
+        names = [name for name in os.listdir(self.directory)
+                 if name.startswith('segment-') and name.endswith('.jsonl')]
+        return [os.path.join(self.directory, name) for name in sorted(names)]
+
+    def append(self, events):
+        """
+        Append a batch of events
+
+        Parameters:
+        - events: List of JSON-serializable dicts
+        """
+        if not events:
+            return
+        data = ''.join(json.dumps(event, separators=(',', ':')) + '\n' for event in events).encode('utf-8')
+
+        with self._lock:
+            if self.shared:
+                with self._process_lock:
+                    self._follow()
+                    self._write(data)
+            else:
+                self._write(data)
+
+    def position(self):
+        """Return the current end of the log as [segment index, byte offset]"""
+        with self._lock:
+            self._file.flush()
+            if self.shared:
+                # Other processes may have appended or rotated since our last write
+                self._follow()
+                return [self._segment_index, os.path.getsize(self._file.name)]
+            return [self._segment_index, self._file.tell()]
+
+    def read(self, start=None, max_bytes=READ_BYTES):
+        """
+        Read the complete events logged after a position
+
+        Lets a process fold what other processes appended to a shared log. A
+        line still being written is left for the next call.
+
+        Parameters:
+        - start: Position from position() or a previous read() (default: the beginning)
+        - max_bytes: Bytes to read at most (a longer single event is still read whole)
+
+        Returns:
+        - (events, position after them); the position only equals start when
+          nothing new has been logged
+        """
+        if start is None:
+            segments = self.segments()
+            start = [self._parse_index(segments[0]) if segments else 1, 0]
+        index, offset = start
+        path = self._segment_path(index)
+
+        # Appends only rotate after a complete write, so once the next segment
+        # exists everything in this one is final. Checked before reading so a
+        # write in progress is never mistaken for a torn one.
+        finished = os.path.exists(self._segment_path(index + 1))
+        try:
+            with open(path, 'rb') as segment:
+                segment.seek(offset)
+                data = segment.read(max_bytes)
+                if len(data) == max_bytes and not data.endswith(b'\n'):
+                    data += segment.readline()
+        except FileNotFoundError:
+            data = b''
+
+        end = data.rfind(b'\n') + 1
+        if not end:
+            if not finished:
+                return [], [index, offset]
+            if data:
+                logger.warning("Skipping torn event at the end of %s", path)
+            return [], [index + 1, 0]
+
+        events = []
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                logger.warning("Skipping corrupt event in %s", path)
+        return events, [index, offset + end]
+
+    def replay(self, batch_size=FOLD_BATCH_EVENTS, start=None):
+        """
+        Yield logged events in append order, in lists of up to batch_size
+
+        Lines that cannot be decoded (a write torn by a crash) are skipped.
+
+        Parameters:
+        - batch_size: Maximum events per yielded list
+        - start: Position from position() to replay from (default: the beginning)
+        """
+        with self._lock:
+            self._file.flush()
+            segments = self.segments()
+
+        batch = []
+        for path in segments:
+            index = self._parse_index(path)
+            if start is not None and index < start[0]:
+                continue
+            with open(path, 'rb') as segment:
+                if start is not None and index == start[0]:
+                    segment.seek(start[1])
+                for line in segment:
+                    if not line.strip():
+                        continue
+                    try:
+                        batch.append(json.loads(line))
+                    except ValueError:
+                        logger.warning("Skipping corrupt event in %s", path)
+                        continue
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+        if batch:
+            yield batch
+
+    def close(self):
+        """Close the current segment"""
+        with self._lock:
+            self._file.close()
+
+    def _write(self, data):
+        """Write encoded events to the current segment, rotating when it is full (lock held)"""
+        self._file.write(data)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        if self._file.tell() >= self.segment_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        """Close the current segment and start the next one (lock held)"""
+        self._file.close()
+        self._segment_index += 1
+        self._file = open(self._segment_path(self._segment_index), 'ab')
+
+    def _follow(self):
+        """Move to the newest segment of a shared log, reopening it in a forked process (lock held)"""
+        index = self._segment_index
+        while os.path.exists(self._segment_path(index + 1)):
+            index += 1
+        if index != self._segment_index or self._pid != os.getpid():
+            self._file.close()
+            self._segment_index = index
+            self._file = open(self._segment_path(index), 'ab')
+            self._pid = os.getpid()
+
+    def _segment_path(self, index):
+        return os.path.join(self.directory, f"segment-{index:08d}.jsonl")
+
+    @staticmethod
+    def _parse_index(path):
+        return int(os.path.basename(path)[len('segment-'):-len('.jsonl')])
+
+    @staticmethod
+    def _ends_with_newline(path):
+        with open(path, 'rb') as segment:
+            segment.seek(-1, os.SEEK_END)
+            return segment.read(1) == b'\n'
+
+
+class InteractionIngestor:
+    def __init__(self, recommender, event_log, batch_size=FOLD_BATCH_EVENTS,
+                 interval=FOLD_INTERVAL, on_apply=None):
+        """
+        Fold logged events into a recommender from a background thread
+
+        Parameters:
+        - recommender: ServiceRecommender receiving the events
+        - event_log: EventLog every submitted event is appended to
+        - batch_size: Maximum events folded per recommender call
+        - interval: Seconds to wait for more events before folding
+        - on_apply: Optional callback receiving the set of user ids changed by a fold
+
+        With a shared event log, events are folded by reading the log back
+        from the last folded position, so events appended by other processes
+        are folded too, in log order. See catch_up().
+        """
+        self.recommender = recommender
+        self.event_log = event_log
+        self.batch_size = batch_size
+        self.interval = interval
+        self.on_apply = on_apply
+
+        # One lock orders log appends. Folds run after it, each waiting for
+        # its turn in the stripes of its users, so every user's events are
+        # applied in exactly the order they were logged (and will be
+        # replayed) while folds for other users run in parallel
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._turns = StripedTurns()
+        self._pending = []
+        self._position = None  # Shared log position folded up to
+        self._stopping = False
+        self._thread = None
+
+    def replay(self, start=None):
+        """
+        Fold logged events into the recommender; returns the event count
+
+        Parameters:
+        - start: Log position to replay from, e.g. the one recorded by checkpoint
+        """
+        count = 0
+        with self._lock:
+            if self.event_log.shared:
+                self._position = start
+                return self._catch_up()
+            for batch in self.event_log.replay(self.batch_size, start):
+                self._fold(batch)
+                count += len(batch)
+        return count
+
+    def catch_up(self):
+        """
+        Fold the events other processes appended to a shared log since the last fold
+
+        Costs two stat calls when nothing is new, so it can run before every
+        request; afterwards this process reflects every write acknowledged
+        by any process sharing the log.
+        """
+        if self._position is None or self.event_log.position() == self._position:
+            return
+        with self._lock:
+            self._catch_up()
+
+    def checkpoint(self, path):
+        """
+        Fold queued events and save a model snapshot
+
+        The snapshot records the log position it covers, so after loading it
+        only later events need replaying: replay(metadata['event_log_position']).
+        """
+        with self._lock:
+            self._drain()
+            if not self.event_log.shared:
+                self.recommender.save_model(path, metadata={'event_log_position': self.event_log.position()})
+                return
+            # Processes sharing the log take turns writing the snapshot
+            with FileLock(os.path.join(self.event_log.directory, 'checkpoint.lock')):
+                self.recommender.save_model(path, metadata={'event_log_position': self._position})
+
+    def exclusive(self, function, *args, **kwargs):
+        """Fold queued events, then call function while no events are folded"""
+        with self._lock:
+            self._drain()
+            return function(*args, **kwargs)
+
+    def submit(self, events):
+        """
+        Log events and queue them for the background worker
+
+        Parameters:
+        - events: List of event dicts (see ServiceRecommender.track_interactions)
+
+        Raises ValueError, logging nothing, if any event is invalid (see event_error).
+        """
+        self._check(events)
+        with self._lock:
+            self.event_log.append(events)
+            if self.event_log.shared:
+                return
+            self._pending.extend(events)
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.notify()
+
+    def apply(self, events):
+        """
+        Log events and fold them (with anything queued before them) before returning; see submit
+
+        Only the append holds the ingestor lock; the fold runs after it in
+        its users' turn (see __init__).
+        """
+        self._check(events)
+        with self._lock:
+            self.event_log.append(events)
+            if self.event_log.shared:
+                # Processes fold a shared log by reading it back in order
+                self._catch_up()
+                return
+            batch, turns = self._take(self._pending + events)
+        self._fold_in_turn(batch, turns)
+
+    def flush(self):
+        """Fold every queued event now"""
+        with self._lock:
+            self._drain()
+
+    def pending(self):
+        """Return the number of logged events not yet folded"""
+        with self._lock:
+            return len(self._pending)
+
+    def start(self):
+        """Start the background worker"""
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='interaction-ingestor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Fold remaining events and stop the background worker"""
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            batch = []
+            with self._lock:
+                if not self._stopping and len(self._pending) < self.batch_size:
+                    self._wakeup.wait(self.interval)
+                stopping = self._stopping
+                try:
+                    if self.event_log.shared:
+                        self._catch_up()
+                    elif self._pending:
+                        batch, turns = self._take(self._pending)
+                except Exception as e:
+                    logger.exception("Error folding interaction events: %s", e)
+            if batch:
+                self._fold_in_turn(batch, turns)
+            if stopping:
+                return
+
+    def _take(self, events):
+        """Empty the queue and take a turn for events (lock held); returns (events, turns)"""
+        self._pending = []
+        return events, self._turns.take(event.get('user_id') for event in events)
+
+    def _fold_in_turn(self, events, turns):
+        """Fold events in batches once every earlier fold for their users has finished"""
+        with self._turns.turn(turns):
+            for start in range(0, len(events), self.batch_size):
+                self._fold(events[start:start + self.batch_size])
+
+    def _drain(self):
+        """Fold queued events in batches (lock held), after every fold under way"""
+        if self.event_log.shared:
+            self._catch_up()
+            return
+        self._turns.wait_idle()
+        while self._pending:
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            self._fold(batch)
+
+    def _catch_up(self):
+        """Fold everything logged after the folded position (lock held); returns the event count"""
+        count = 0
+        while True:
+            events, position = self.event_log.read(self._position)
+            if position == self._position:
+                return count
+            self._position = position
+            for start in range(0, len(events), self.batch_size):
+                self._fold(events[start:start + self.batch_size])
+            count += len(events)
+
+    @staticmethod
+    def _check(events):
+        for position, event in enumerate(events):
+            error = event_error(event)
+            if error is not None:
+                raise ValueError(f"Event {position}: {error}")
+
+    def _fold(self, batch):
+        """
+        Apply a batch to the recommender, skipping invalid events
+
+        A failing batch is logged and dropped rather than raised, so one
+        bad event cannot stop replays at startup or the background worker.
+        """
+        events = []
+        for event in batch:
+            error = event_error(event)
+            if error is None:
+                events.append(event)
+            else:
+                logger.warning("Skipping invalid event (%s): %r", error, event)
+        if not events:
+            return
+        try:
+            changed = self.recommender.track_interactions(events)
+        except Exception as e:
+            logger.exception("Error folding %d interaction events: %s", len(events), e)
+            return
+        if self.on_apply is not None and changed:
+            self.on_apply(changed)
@@ -0,0 +1,119 @@
+"""
+Candidate filters over gig rows
+
+Recommendation requests can restrict the catalog to a set of categories, a
+price range and a minimum rating, and exclude sellers. Checking every gig
+would make a filtered request cost as much as an unfiltered one, so the
+index keeps the live rows grouped by category (CSR-style: rows sorted by
+category id plus offsets) and sorted by price and by rating. Each of those
+filters then selects its rows with an offset lookup or a binary search, the
+smallest selection is materialized, and the remaining filters are checked
+on it only. A request costs O(log n + size of the smallest selection).
+
+Rows are addressed by the caller's row positions (gig rows in
+ServiceRecommender). The index is immutable; the caller rebuilds it after
+the catalog changes.
+"""
+import numpy as np
+
+from array_utils import concat_ranges
+
+
+class FilterIndex:
+    def __init__(self, category_ids, n_categories, prices, ratings, sellers, live):
+        """
+        Index the live rows of a catalog
+
+        Parameters:
+        - category_ids: Category id per row
+        - n_categories: Number of category ids
+        - prices: Price per row
+        - ratings: Rating per row
+        - sellers: Seller identifier per row (any hashable values)
+        - live: Boolean mask of the rows that can be returned
+        """
+        self.n_categories = n_categories
+        self._category_ids = category_ids
+        self._prices = prices
+        self._ratings = ratings
+        self._live_rows = np.flatnonzero(live)
+
+        # Live rows grouped by category, in row order within each category
+        live_categories = category_ids[self._live_rows]
+        self._by_category = self._live_rows[np.argsort(live_categories, kind='stable')]
+        self._category_offsets = np.zeros(n_categories + 1, dtype=np.intp)
+        np.cumsum(np.bincount(live_categories, minlength=n_categories)[:n_categories],
+                  out=self._category_offsets[1:])
+
+        # Live rows in ascending price and rating order, next to the sorted values
+        self._by_price = self._live_rows[np.argsort(prices[self._live_rows], kind='stable')]
+        self._sorted_prices = prices[self._by_price]
+        self._by_rating = self._live_rows[np.argsort(ratings[self._live_rows], kind='stable')]
+        self._sorted_ratings = ratings[self._by_rating]
+
+        # Seller codes per row, so exclusions compare integers (-1: no seller)
+        lookup = self._seller_lookup = {}
+        self._seller_codes = np.fromiter(
+            (-1 if seller is None or seller != seller else lookup.setdefault(seller, len(lookup)) for seller in sellers),
+            dtype=np.intp, count=len(sellers))
+
+    def __len__(self):
+        return len(self._live_rows)
+
+    def rows(self, category_ids=None, min_price=None, max_price=None, min_rating=None, excluded_sellers=None):
+        """
+        Return the live rows passing every given filter, in ascending row order
+
+        Parameters:
+        - category_ids: Iterable of category ids to keep (None: any)
+        - min_price, max_price: Inclusive price bounds (None: unbounded)
+        - min_rating: Smallest rating kept (None: any)
+        - excluded_sellers: Iterable of seller identifiers to drop
+
+        Returns:
+        - Array of row positions
+        """
+        # Each narrowing filter as (selected row count, materialize, mask over rows)
+        selections = []
+        if category_ids is not None:
+            wanted = np.zeros(self.n_categories, dtype=bool)
+            ids = np.array([c for c in set(category_ids) if 0 <= c < self.n_categories], dtype=np.intp)
+            wanted[ids] = True
+            starts, ends = self._category_offsets[ids], self._category_offsets[ids + 1]
+            selections.append((
+                int((ends - starts).sum()),
+                lambda: self._by_category[concat_ranges(starts, ends)],
+                lambda rows: wanted[self._category_ids[rows]]
+            ))
+        if min_price is not None or max_price is not None:
+            low = -np.inf if min_price is None else min_price
+            high = np.inf if max_price is None else max_price
+            price_start = np.searchsorted(self._sorted_prices, low, side='left')
+            price_end = max(price_start, np.searchsorted(self._sorted_prices, high, side='right'))
+            selections.append((
+                price_end - price_start,
+                lambda: self._by_price[price_start:price_end],
+                lambda rows: (self._prices[rows] >= low) & (self._prices[rows] <= high)
+            ))
+        if min_rating is not None:
+            rating_start = np.searchsorted(self._sorted_ratings, min_rating, side='left')
+            selections.append((
+                len(self._by_rating) - rating_start,
+                lambda: self._by_rating[rating_start:],
+                lambda rows: self._ratings[rows] >= min_rating
+            ))
+
+        if selections:
+            # Materialize the smallest selection and check the others on it
+            selections.sort(key=lambda selection: selection[0])
+            rows = np.sort(selections[0][1]())
+            for _, _, mask in selections[1:]:
+                rows = rows[mask(rows)]
+        else:
+            rows = self._live_rows
+
+        if excluded_sellers:
+            codes = [self._seller_lookup[seller] for seller in set(excluded_sellers) if seller in self._seller_lookup]
+            if codes:
+                rows = rows[~np.isin(self._seller_codes[rows], codes)]
+        return rows
@@ -0,0 +1,36 @@
+"""
+gunicorn settings for multi-worker serving
+
+    cd server && gunicorn -c gunicorn.conf.py
+
+The app is preloaded in the master (see wsgi.py) and the workers are forked
+from it, sharing the read-only model. Every worker accepts writes: they are
+appended to the shared interaction log under a file lock, and each worker
+folds the log in order before serving a request, so all workers hold the
+same profiles.
+
+Environment:
+- HOST, PORT: Address to bind (default 127.0.0.1:5001)
+- WEB_CONCURRENCY: Worker processes (default: CPU count)
+- WORKER_THREADS: Threads per worker (default 1; scoring holds the GIL for
+  much of a request, so processes scale better than threads)
+- WORKER_TIMEOUT: Seconds before a silent worker is restarted
+- PRELOAD_APP: false loads the model in every worker instead (for comparison)
+"""
+import os
+
+wsgi_app = 'wsgi:app'
+bind = f"{os.getenv('HOST', '127.0.0.1')}:{os.getenv('PORT', 5001)}"
+workers = int(os.getenv('WEB_CONCURRENCY', os.cpu_count() or 1))
+threads = int(os.getenv('WORKER_THREADS', 1))
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.getenv('WORKER_TIMEOUT', 60))
+
+# Load the model once in the master; workers share its pages copy-on-write
+preload_app = os.getenv('PRELOAD_APP', 'true').lower() == 'true'
+
+
+def post_fork(server, worker):
+    # Background threads (interaction folding, profiler) are not inherited by forked workers
+    from app import start_worker
+    start_worker()
@@ -0,0 +1,242 @@
+"""
+Implicit-feedback matrix factorization (alternating least squares)
+
+Interaction weights r become confidences c = 1 + alpha * r on a binary
+"interacted" preference, as in Hu, Koren and Volinsky's implicit ALS. Each
+epoch solves for every user's factors with the gig factors fixed, then for
+every gig's factors with the user factors fixed. A user's system is
+
+    (Y^T Y + Y_u^T diag(alpha * r_u) Y_u + regularization * I) x_u = Y_u^T (1 + alpha * r_u)
+
+where Y_u holds the factors of the gigs the user interacted with. Y^T Y is
+shared by all users, so one solve costs O(n_u * f^2 + f^3). Rows are solved
+in chunks: the per-row systems are built with stacked matrix products over
+rows of similar length, then solved together with one batched
+np.linalg.solve. Chunks run on a thread pool, since NumPy releases the GIL
+in these kernels.
+
+Factors can be checkpointed to a snapshot directory after every epoch.
+Fitting again warm-starts from the current factors (or from the checkpoint)
+and maps them by id, so new users and gigs start from small random factors.
+Scoring needs NumPy only; fitting imports scipy on first use.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import numpy as np
+
+from array_utils import top_k
+from snapshot import is_snapshot, read_snapshot, write_snapshot
+
+DEFAULT_FACTORS = 32
+DEFAULT_REGULARIZATION = 0.01
+DEFAULT_ALPHA = 40.0
+DEFAULT_ITERATIONS = 10
+
+# Upper bound on the (zero-padded) factor rows gathered per chunk
+SOLVE_CHUNK_BYTES = 32 * 1024 * 1024
+
+
+class ImplicitALS:
+    def __init__(self, factors=DEFAULT_FACTORS, regularization=DEFAULT_REGULARIZATION, alpha=DEFAULT_ALPHA,
+                 n_threads=None, seed=0):
+        """
+        Initialize an untrained model
+
+        Parameters:
+        - factors: Embedding size
+        - regularization: L2 penalty on the factors
+        - alpha: Confidence gained per unit of interaction weight
+        - n_threads: Threads solving chunks of rows (default: CPU count)
+        - seed: Seed for the initial factors
+        """
+        self.factors = factors
+        self.regularization = regularization
+        self.alpha = alpha
+        self.n_threads = n_threads or os.cpu_count() or 1
+        self.seed = seed
+        self.epochs = 0  # Epochs trained so far, across warm starts
+
+        self.user_ids = []  # Row of user_factors -> user id
+        self.gig_ids = []  # Row of item_factors -> gig id
+        self._user_rows = {}
+        self._gig_rows = {}
+        self.user_factors = np.zeros((0, factors), dtype=np.float64)
+        self.item_factors = np.zeros((0, factors), dtype=np.float64)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def fit(self, user_ids, gig_ids, weights, iterations=DEFAULT_ITERATIONS, checkpoint_path=None):
+        """
+        Train on (user, gig, weight) interactions
+
+        Parameters:
+        - user_ids: User id per interaction
+        - gig_ids: Gig id per interaction
+        - weights: Interaction weight per interaction; repeated pairs add up
+        - iterations: Epochs to run
+        - checkpoint_path: Snapshot directory written after every epoch. An
+          untrained model resumes from it when it exists.
+
+        Returns:
+        - self
+        """
+        from scipy import sparse
+
+        if not self.user_ids and checkpoint_path and is_snapshot(checkpoint_path):
+            self._load_checkpoint(checkpoint_path)
+
+        new_user_ids = list(dict.fromkeys(user_ids))
+        new_gig_ids = list(dict.fromkeys(gig_ids))
+        user_rows = {user_id: row for row, user_id in enumerate(new_user_ids)}
+        gig_rows = {gig_id: row for row, gig_id in enumerate(new_gig_ids)}
+
+        ratings = sparse.csr_matrix(
+            (np.asarray(weights, dtype=np.float64),
+             (np.fromiter((user_rows[user_id] for user_id in user_ids), dtype=np.int64, count=len(user_ids)),
+              np.fromiter((gig_rows[gig_id] for gig_id in gig_ids), dtype=np.int64, count=len(gig_ids)))),
+            shape=(len(new_user_ids), len(new_gig_ids))
+        )
+        ratings.sum_duplicates()
+        ratings_t = ratings.T.tocsr()
+
+        # Warm start: keep the factors of known ids
+        rng = np.random.default_rng(self.seed + self.epochs)
+        self.user_factors = self._remap(self.user_factors, self._user_rows, new_user_ids, rng)
+        self.item_factors = self._remap(self.item_factors, self._gig_rows, new_gig_ids, rng)
+        self.user_ids, self.gig_ids = new_user_ids, new_gig_ids
+        self._user_rows, self._gig_rows = user_rows, gig_rows
+
+        with ThreadPoolExecutor(max_workers=self.n_threads) as pool:
+            for _ in range(iterations):
+                self.user_factors = self._solve(ratings, self.item_factors, pool)
+                self.item_factors = self._solve(ratings_t, self.user_factors, pool)
+                self.epochs += 1
+                if checkpoint_path:
+                    self.save_checkpoint(checkpoint_path)
+
+        return self
+
+    def user_factor(self, user_id):
+        """Return a user's embedding, or None if the user was not trained"""
+        row = self._user_rows.get(user_id)
+        return None if row is None else self.user_factors[row]
+
+    def user_rows(self, user_ids):
+        """Return the user factor row of each user id, -1 for untrained users"""
+        return np.fromiter((self._user_rows.get(user_id, -1) for user_id in user_ids), dtype=np.intp, count=len(user_ids))
+
+    def recommend(self, user_id, k=10):
+        """Return [(gig_id, score)] of the k best gigs for a user (one matrix-vector product)"""
+        user = self.user_factor(user_id)
+        if user is None:
+            return []
+        scores = self.item_factors @ user
+        return [(self.gig_ids[row], float(scores[row])) for row in top_k(scores, k)]
+
+    def save_checkpoint(self, path):
+        """Atomically write the factors and training state to a snapshot directory"""
+        arrays, scalars = self.state()
+        write_snapshot(path, arrays, scalars)
+
+    def state(self):
+        """Return (arrays, scalars) for snapshotting"""
+        arrays = {
+            'user_ids': self.user_ids,
+            'gig_ids': self.gig_ids,
+            'user_factors': self.user_factors,
+            'item_factors': self.item_factors,
+        }
+        scalars = {
+            'factors': self.factors,
+            'regularization': self.regularization,
+            'alpha': self.alpha,
+            'seed': self.seed,
+            'epochs': self.epochs,
+        }
+        return arrays, scalars
+
+    @classmethod
+    def from_state(cls, arrays, scalars, n_threads=None):
+        """Rebuild a model from state()"""
+        model = cls(scalars['factors'], scalars['regularization'], scalars['alpha'], n_threads, scalars['seed'])
+        model._set_state(arrays, scalars)
+        return model
+
+    def _load_checkpoint(self, path):
+        manifest, arrays = read_snapshot(path, mmap_mode=None)
+        if manifest['metadata']['factors'] != self.factors:
+            raise ValueError(f"Checkpoint has {manifest['metadata']['factors']} factors, model has {self.factors}")
+        self._set_state(arrays, manifest['metadata'])
+
+    def _set_state(self, arrays, scalars):
+        self.user_ids = list(arrays['user_ids'])
+        self.gig_ids = list(arrays['gig_ids'])
+        self._user_rows = {user_id: row for row, user_id in enumerate(self.user_ids)}
+        self._gig_rows = {gig_id: row for row, gig_id in enumerate(self.gig_ids)}
+        self.user_factors = arrays['user_factors']
+        self.item_factors = arrays['item_factors']
+        self.epochs = scalars['epochs']
+
+    def _remap(self, factors, old_rows, new_ids, rng):
+        """Factors for new_ids: copied for known ids, small random values otherwise"""
+        remapped = rng.normal(scale=0.01, size=(len(new_ids), self.factors))
+        if old_rows:
+            positions = np.fromiter((old_rows.get(item_id, -1) for item_id in new_ids), dtype=np.intp, count=len(new_ids))
+            known = positions >= 0
+            remapped[known] = factors[positions[known]]
+        return remapped
+
+    def _solve(self, ratings, fixed, pool):
+        """Solve every row of ratings against the fixed factors"""
+        n_rows = ratings.shape[0]
+        solved = np.zeros((n_rows, self.factors), dtype=np.float64)
+        gram = fixed.T @ fixed + self.regularization * np.eye(self.factors)
+
+        # Chunks of rows whose gathered factors fit in SOLVE_CHUNK_BYTES
+        max_entries = max(1, SOLVE_CHUNK_BYTES // (16 * self.factors))
+        bounds = []
+        start = 0
+        while start < n_rows:
+            end = int(np.searchsorted(ratings.indptr, ratings.indptr[start] + max_entries, side='right')) - 1
+            end = min(max(end, start + 1), n_rows)
+            bounds.append((start, end))
+            start = end
+
+        for _ in pool.map(lambda chunk: self._solve_chunk(ratings, fixed, gram, solved, *chunk), bounds):
+            pass
+        return solved
+
+    def _solve_chunk(self, ratings, fixed, gram, solved, start, end):
+        indptr = ratings.indptr[start:end + 1]
+        counts = np.diff(indptr)
+        rows = np.flatnonzero(counts)
+        if not len(rows):
+            return
+        systems = np.empty((len(rows), self.factors, self.factors), dtype=np.float64)
+        targets = np.empty((len(rows), self.factors), dtype=np.float64)
+
+        # Rows are grouped by their entry count rounded up to a power of two
+        # and zero-padded to it, so each group's Y_u^T diag(c) Y_u is one
+        # stacked matmul (BLAS) instead of per-entry outer products
+        lengths = counts[rows]
+        order = np.argsort(lengths, kind='stable')
+        group_start = 0
+        while group_start < len(order):
+            width = 1 << int(lengths[order[group_start]] - 1).bit_length()
+            group_end = int(np.searchsorted(lengths[order], width, side='right'))
+            group = order[group_start:group_end]
+            group_start = group_end
+
+            offsets = np.arange(width)
+            valid = offsets[None, :] < lengths[group][:, None]
+            entries = np.where(valid, indptr[rows[group]][:, None] + offsets[None, :], 0)
+            confidence = np.where(valid, self.alpha * ratings.data[entries], 0.0)
+            # Padding gathers row 0 of fixed, with zero confidence and target weight
+            gathered = fixed[ratings.indices[entries]]
+            systems[group] = np.matmul((gathered * confidence[..., None]).transpose(0, 2, 1), gathered)
+            targets[group] = np.einsum('gw,gwf->gf', np.where(valid, 1 + confidence, 0.0), gathered)
+
+        systems += gram
+        solved[start + rows] = np.linalg.solve(systems, targets[..., None])[..., 0]
@@ -0,0 +1,201 @@
+"""
+Item-item collaborative filtering
+
+Interactions become a sparse user x gig matrix of interaction weights. Gig
+columns are L2-normalized, so (gigs x users) @ (users x gigs) gives the
+cosine similarity of every pair of gigs that share a user. The product is
+computed in shards of gig rows, in a process pool for large inputs, and only
+the top n_neighbors similarities of each gig are kept. The result is a
+sparse gigs x gigs neighbour matrix, held as plain CSR arrays.
+
+A user is scored by summing the neighbour rows of the gigs in their history,
+weighted by their interaction with each one. That costs
+O(history length x n_neighbors) no matter how large the catalog is, and
+needs NumPy only; fitting imports scipy on first use.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import numpy as np
+
+from array_utils import concat_ranges
+
+# Similar gigs kept per gig
+DEFAULT_N_NEIGHBORS = 50
+
+# Gig rows multiplied per shard
+SHARD_GIGS = 2048
+
+# Inputs with at least this many (user, gig) pairs are built across a process pool
+PARALLEL_MIN_PAIRS = 1000000
+
+# Matrices shared with pool workers, set once per worker by _init_worker
+_worker_matrices = None
+
+
+class ItemSimilarity:
+    def __init__(self, n_neighbors=DEFAULT_N_NEIGHBORS):
+        """
+        Initialize an empty model
+
+        Parameters:
+        - n_neighbors: Similar gigs kept per gig
+        """
+        self.n_neighbors = n_neighbors
+        self.gig_ids = []  # Column -> gig id
+        self._columns = {}  # Gig id -> column
+        # Neighbour matrix in CSR form: column c's neighbours are
+        # neighbor_columns[neighbor_indptr[c]:neighbor_indptr[c + 1]]
+        self.neighbor_indptr = np.zeros(1, dtype=np.int32)
+        self.neighbor_columns = np.empty(0, dtype=np.int32)
+        self.neighbor_data = np.empty(0, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.gig_ids)
+
+    def fit(self, user_codes, gig_ids, weights, n_workers=None):
+        """
+        Build the neighbour matrix from (user, gig, weight) triples
+
+        Parameters:
+        - user_codes: Integer user code per interaction
+        - gig_ids: Gig id per interaction
+        - weights: Interaction weight per interaction; repeated pairs add up
+        - n_workers: Worker processes for large inputs (default: CPU count;
+          1 disables the pool)
+        """
+        from scipy import sparse
+
+        self.gig_ids = list(dict.fromkeys(gig_ids))
+        self._columns = {gig_id: column for column, gig_id in enumerate(self.gig_ids)}
+        columns = np.fromiter((self._columns[gig_id] for gig_id in gig_ids), dtype=np.int64, count=len(gig_ids))
+        user_codes = np.asarray(user_codes, dtype=np.int64)
+        n_users = int(user_codes.max()) + 1 if len(user_codes) else 0
+        n_gigs = len(self.gig_ids)
+
+        ratings = sparse.csr_matrix(
+            (np.asarray(weights, dtype=np.float64), (user_codes, columns)),
+            shape=(n_users, n_gigs)
+        )
+        ratings.sum_duplicates()
+
+        # Unit-length gig columns, so dot products are cosine similarities
+        norms = np.sqrt(np.asarray(ratings.multiply(ratings).sum(axis=0)).ravel())
+        inverse_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+        ratings = (ratings @ sparse.diags(inverse_norms)).tocsr()
+        ratings_t = ratings.T.tocsr()
+
+        shards = [(start, min(start + SHARD_GIGS, n_gigs)) for start in range(0, n_gigs, SHARD_GIGS)]
+        if n_workers is None:
+            n_workers = os.cpu_count() or 1
+        if n_workers > 1 and len(shards) > 1 and ratings.nnz >= PARALLEL_MIN_PAIRS:
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                     initargs=(ratings_t, ratings, self.n_neighbors)) as pool:
+                blocks = list(pool.map(_worker_shard, shards))
+        else:
+            blocks = [_shard_neighbors(ratings_t, ratings, self.n_neighbors, start, end) for start, end in shards]
+
+        neighbors = sparse.vstack(blocks, format='csr') if blocks else sparse.csr_matrix((0, 0), dtype=np.float32)
+        neighbors.resize((n_gigs, n_gigs))
+        self.neighbor_indptr, self.neighbor_columns, self.neighbor_data = (
+            neighbors.indptr, neighbors.indices, neighbors.data)
+        return self
+
+    def column(self, gig_id):
+        """Return the model column of a gig, or None if it has no interactions"""
+        return self._columns.get(gig_id)
+
+    def similar(self, gig_id, k=None):
+        """Return [(gig_id, similarity)] of a gig's neighbours, most similar first"""
+        column = self._columns.get(gig_id)
+        if column is None:
+            return []
+        start, end = self.neighbor_indptr[column], self.neighbor_indptr[column + 1]
+        indices, data = self.neighbor_columns[start:end], self.neighbor_data[start:end]
+        order = np.argsort(-data, kind='stable')[:k]
+        return [(self.gig_ids[i], float(data[j])) for i, j in zip(indices[order], order)]
+
+    def score(self, history):
+        """
+        Score the neighbours of a user's history
+
+        Parameters:
+        - history: Dict of gig id -> interaction weight
+
+        Returns:
+        - (columns, scores): model columns with a non-zero score
+        """
+        columns = []
+        weights = []
+        for gig_id, weight in history.items():
+            column = self._columns.get(gig_id)
+            if column is not None:
+                columns.append(column)
+                weights.append(weight)
+        if not columns:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        # Weighted sum of the history's neighbour rows
+        starts = self.neighbor_indptr[columns]
+        lengths = self.neighbor_indptr[np.asarray(columns) + 1] - starts
+        positions = concat_ranges(starts, starts + lengths)
+        weighted = self.neighbor_data[positions] * np.repeat(np.asarray(weights, dtype=np.float64), lengths)
+        neighbors, inverse = np.unique(self.neighbor_columns[positions], return_inverse=True)
+        return neighbors.astype(np.int64), np.bincount(inverse, weights=weighted, minlength=len(neighbors))
+
+    def state(self):
+        """Return (arrays, scalars) for snapshotting"""
+        arrays = {
+            'gig_ids': self.gig_ids,
+            'indptr': self.neighbor_indptr,
+            'indices': self.neighbor_columns,
+            'data': self.neighbor_data,
+        }
+        return arrays, {'n_neighbors': self.n_neighbors}
+
+    @classmethod
+    def from_state(cls, arrays, scalars):
+        """Rebuild a model from state()"""
+        model = cls(scalars['n_neighbors'])
+        model.gig_ids = list(arrays['gig_ids'])
+        model._columns = {gig_id: column for column, gig_id in enumerate(model.gig_ids)}
+        model.neighbor_indptr = arrays['indptr']
+        model.neighbor_columns = arrays['indices']
+        model.neighbor_data = arrays['data']
+        return model
+
+
+def _init_worker(ratings_t, ratings, n_neighbors):
+    global _worker_matrices
+    _worker_matrices = (ratings_t, ratings, n_neighbors)
+
+
+def _worker_shard(bounds):
+    ratings_t, ratings, n_neighbors = _worker_matrices
+    return _shard_neighbors(ratings_t, ratings, n_neighbors, *bounds)
+
+
+def _shard_neighbors(ratings_t, ratings, n_neighbors, start, end):
+    """Return the top n_neighbors similarities of gig rows [start, end) as a CSR block"""
+    from scipy import sparse
+
+    block = (ratings_t[start:end] @ ratings).tocsr()
+    rows = np.repeat(np.arange(end - start), np.diff(block.indptr))
+    columns = block.indices
+    data = block.data
+
+    # A gig is not its own neighbour
+    keep = (columns != rows + start) & (data > 0)
+    rows, columns, data = rows[keep], columns[keep], data[keep]
+
+    # Best first within each row, then keep the first n_neighbors of each
+    order = np.lexsort((columns, -data, rows))
+    rows, columns, data = rows[order], columns[order], data[order]
+    counts = np.bincount(rows, minlength=end - start)
+    row_starts = np.cumsum(counts) - counts
+    keep = np.arange(len(rows)) - row_starts[rows] < n_neighbors
+    rows, columns, data = rows[keep], columns[keep], data[keep]
+
+    indptr = np.zeros(end - start + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=end - start), out=indptr[1:])
+    return sparse.csr_matrix((data.astype(np.float32), columns, indptr), shape=(end - start, ratings.shape[1]))
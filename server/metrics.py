@@ -0,0 +1,314 @@
+"""
+Low-overhead instrumentation: counters, histograms, stage timers and a
+sampling profiler
+
+Metrics live in a process-wide registry and are rendered in the Prometheus
+text exposition format. Label values are kept per metric in a dict keyed by
+the label tuple, so recording costs a dict lookup, a bisect over the bucket
+bounds and a few additions under a lock.
+
+Stage timers (stage() as a context manager, timed() as a decorator) record
+into the stage_duration_seconds histogram. They check one module flag and
+do nothing else while instrumentation is disabled, so they can stay on hot
+paths.
+
+The sampling profiler is a daemon thread that snapshots the stacks of every
+other thread at a fixed interval and counts them in collapsed-stack form
+("outer;inner;leaf count"), which flame graph tools read directly. It costs
+nothing until started.
+"""
+import bisect
+import functools
+import math
+import os
+import sys
+import threading
+import time
+
+# Histogram buckets for latencies, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+
+# Seconds between profiler samples
+PROFILER_INTERVAL = 0.005
+
+# Deepest stack kept per profiler sample
+PROFILER_MAX_DEPTH = 64
+
+# Whether stage timers record; see enable()
+_enabled = True
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # Label values tuple -> count
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), value=1):
+        """Add value to the counter for a tuple of label values"""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # Label values tuple -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        """Record one observation for a tuple of label values"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, labels=()):
+        series = self._series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        names = self.labelnames + ('le',)
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), values[:-1]):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (le,))} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(values[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """A value read from a callback whenever metrics are rendered"""
+
+    def __init__(self, name, help_text, function):
+        self.name = name
+        self.help = help_text
+        self.function = function
+
+    def render(self):
+        try:
+            value = self.function()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge",
+                f"{self.name} {_format_value(value)}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}  # Name -> metric, in registration order
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text, labelnames=()):
+        """Return the counter registered under name, creating it if needed"""
+        return self._register(name, lambda: Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        """Return the histogram registered under name, creating it if needed"""
+        return self._register(name, lambda: Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, function):
+        """Register (or replace) a gauge read from function()"""
+        with self._lock:
+            self._metrics[name] = Gauge(name, help_text, function)
+            return self._metrics[name]
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, name, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+
+# Process-wide registry rendered by /api/metrics
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'stage_duration_seconds', 'Time spent in instrumented recommender stages', ('stage',))
+
+
+def enable(enabled=True):
+    """Turn stage timers on or off (they cost a flag check while off)"""
+    global _enabled
+    _enabled = enabled
+
+
+def enabled():
+    return _enabled
+
+
+class _StageTimer:
+    __slots__ = ('labels', 'start')
+
+    def __init__(self, name):
+        self.labels = (name,)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def stage(name):
+    """
+    Time a block into stage_duration_seconds{stage=name}
+
+    Usage: with metrics.stage('scoring'): ...
+    """
+    return _StageTimer(name) if _enabled else _NULL_TIMER
+
+
+def timed(name):
+    """Decorator timing every call of a function as stage name"""
+    def decorator(function):
+        labels = (name,)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - start, labels)
+        return wrapper
+    return decorator
+
+
+class SamplingProfiler:
+    def __init__(self, interval=PROFILER_INTERVAL, max_depth=PROFILER_MAX_DEPTH):
+        """
+        Statistical profiler over every thread of the process
+
+        Parameters:
+        - interval: Seconds between samples
+        - max_depth: Innermost frames kept per stack
+        """
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self._stacks = {}  # Collapsed stack -> sample count
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        """Start sampling (no-op if already running)"""
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop sampling; collected stacks are kept"""
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self._stacks = {}
+            self.samples = 0
+
+    def collapsed(self):
+        """Return the samples as collapsed stacks, one 'frame;frame;frame count' line each, most frequent first"""
+        with self._lock:
+            stacks = sorted(self._stacks.items(), key=lambda entry: -entry[1])
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stopping.wait(self.interval):
+            frames = sys._current_frames()
+            stacks = [self._collapse(frame) for thread_id, frame in frames.items() if thread_id != own_id]
+            del frames
+            with self._lock:
+                for stack in stacks:
+                    self._stacks[stack] = self._stacks.get(stack, 0) + 1
+                self.samples += 1
+
+    def _collapse(self, frame):
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
@@ -0,0 +1,258 @@
+"""
+Precomputed per-user recommendations
+
+A user's recommendations only change when their profile or the scoring
+model changes, so they can be computed offline. build_table() scores every
+user with the same rules as get_recommendations_batch, in shards across a
+process pool, and writes a snapshot directory (see snapshot.py) holding
+fixed-width users x n tables of gig rows and scores (-1 / NaN padded), the
+user ids in row order, the profile version each row was computed at and the
+gig id of every gig row. RecommendationTable maps it read-only and finds a
+user's row with one dict lookup.
+
+A row is valid only for the profile version it was computed at and the
+scoring state it was computed under. The table stores the recommender's
+scoring_fingerprint(); the server ignores a table with another fingerprint
+and scores users whose profile version differs live. Incremental runs keep
+the rows of an existing table with the same fingerprint and parameters and
+recompute only the users whose version changed or who are new.
+
+Run it against the model snapshot the server starts from:
+
+    python service_recommender.py precompute --snapshot DIR --output DIR
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+import time
+
+import numpy as np
+
+from snapshot import is_snapshot, read_snapshot, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Value of the 'table' metadata key identifying a recommendation table
+TABLE_KIND = 'recommendations'
+
+# Recommendations stored per user by default
+DEFAULT_N = 20
+
+# Users scored per pool task
+SHARD_USERS = 4096
+
+# Recommender shared with pool workers, set once per worker by _init_worker
+_worker_state = None
+
+
+def table_params(include_history=False, price_sensitivity=0.5, cf_weight=0.0, scoring='content'):
+    """Return the scoring parameters a table is computed for, as stored in its metadata"""
+    return {
+        'include_history': bool(include_history),
+        'price_sensitivity': float(price_sensitivity),
+        'cf_weight': float(cf_weight),
+        'scoring': scoring
+    }
+
+
+class RecommendationTable:
+    def __init__(self, path, mmap_mode='r'):
+        """
+        Open a table written by build_table
+
+        Parameters:
+        - path: Table directory
+        - mmap_mode: How the tables are mapped (see snapshot.read_snapshot)
+        """
+        manifest, values = read_snapshot(path, mmap_mode=mmap_mode)
+        metadata = manifest['metadata']
+        if metadata.get('table') != TABLE_KIND:
+            raise ValueError(f"{path} is not a recommendation table")
+
+        self.path = path
+        self.n = metadata['n']
+        self.params = metadata['params']
+        self.fingerprint = metadata['fingerprint']
+        self.created = metadata['created']
+        self.rows = values['rows']  # User row x rank -> gig row (-1 past the end)
+        self.scores = values['scores']  # User row x rank -> score (NaN past the end)
+        self.versions = values['versions']  # User row -> profile version
+        self.gig_ids = values['gig_ids']  # Gig row -> gig id
+        self.user_ids = values['user_ids']
+        self._user_rows = {user_id: row for row, user_id in enumerate(self.user_ids)}
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def row(self, user_id):
+        """Return the table row of a user, or None if the user is not in the table"""
+        return self._user_rows.get(user_id)
+
+    def lookup(self, user_id, version, n, params):
+        """
+        Return a user's precomputed top n
+
+        Parameters:
+        - user_id: User identifier
+        - version: The user's current profile version
+        - n: Number of recommendations wanted
+        - params: table_params() of the request
+
+        Returns:
+        - (gig rows, scores) best first, or None if the table cannot answer
+          (user missing, profile changed since, other parameters or n too large)
+        """
+        row = self._user_rows.get(user_id)
+        if row is None or n > self.n or self.versions[row] != version or params != self.params:
+            return None
+        rows = self.rows[row, :n]
+        kept = rows >= 0
+        return rows[kept], self.scores[row, :n][kept]
+
+
+def build_table(recommender, path, n=DEFAULT_N, include_history=False, price_sensitivity=0.5, cf_weight=0.0,
+                scoring='content', incremental=False, n_workers=None):
+    """
+    Compute every user's top n and write them as a table
+
+    Parameters:
+    - recommender: Loaded ServiceRecommender
+    - path: Table directory (an existing table is replaced atomically)
+    - n: Recommendations stored per user
+    - include_history, price_sensitivity, cf_weight, scoring: Scoring
+      parameters (see get_user_recommendations); the server answers from the
+      table only for requests with the same values
+    - incremental: Keep the rows of the table already at path when it was
+      built under the same fingerprint and parameters, recomputing only users
+      whose profile version changed or who are new
+    - n_workers: Worker processes (default: CPU count)
+
+    Returns:
+    - Dict with the number of users, users computed and seconds taken
+    """
+    start_time = time.perf_counter()
+    params = table_params(include_history, price_sensitivity, cf_weight, scoring)
+    fingerprint = recommender.scoring_fingerprint()
+    profiles = recommender.user_profiles
+    user_ids = list(profiles.user_ids)
+    versions = np.array(profiles.versions, dtype=np.int64)
+
+    rows = np.full((len(user_ids), n), -1, dtype=np.int32)
+    scores = np.full((len(user_ids), n), np.nan)
+    dirty = np.ones(len(user_ids), dtype=bool)
+    if incremental and is_snapshot(path):
+        previous = RecommendationTable(path)
+        if previous.fingerprint != fingerprint or previous.params != params or previous.n != n:
+            logger.info("Table at %s was built for another model or parameters; recomputing every user", path)
+        else:
+            previous_rows = np.fromiter((previous._user_rows.get(user_id, -1) for user_id in user_ids),
+                                        dtype=np.intp, count=len(user_ids))
+            found = previous_rows >= 0
+            clean = found.copy()
+            clean[found] = previous.versions[previous_rows[found]] == versions[found]
+            rows[clean] = previous.rows[previous_rows[clean]]
+            scores[clean] = previous.scores[previous_rows[clean]]
+            dirty = ~clean
+
+    dirty_rows = np.flatnonzero(dirty)
+    shards = [dirty_rows[start:start + SHARD_USERS] for start in range(0, len(dirty_rows), SHARD_USERS)]
+    shard_users = [[user_ids[row] for row in shard.tolist()] for shard in shards]
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if n_workers > 1 and len(shards) > 1:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker,
+                                 initargs=(recommender, n, params)) as pool:
+            blocks = pool.map(_worker_shard, shard_users)
+            for shard, (block_rows, block_scores) in zip(shards, blocks):
+                rows[shard], scores[shard] = block_rows, block_scores
+    else:
+        for shard, users in zip(shards, shard_users):
+            rows[shard], scores[shard] = _shard_top_rows(recommender, users, n, params)
+
+    arrays = {
+        'rows': rows,
+        'scores': scores,
+        'versions': versions,
+        'user_ids': user_ids,
+        'gig_ids': recommender.gigs['id'].tolist()
+    }
+    metadata = {
+        'table': TABLE_KIND,
+        'n': n,
+        'params': params,
+        'fingerprint': fingerprint,
+        'created': time.time()
+    }
+    write_snapshot(path, arrays, metadata)
+
+    stats = {
+        'users': len(user_ids),
+        'computed': len(dirty_rows),
+        'seconds': time.perf_counter() - start_time
+    }
+    logger.info("Wrote top %d for %d users to %s (%d computed) in %.1fs",
+                n, stats['users'], path, stats['computed'], stats['seconds'])
+    return stats
+
+
+def _init_worker(recommender, n, params):
+    global _worker_state
+    _worker_state = (recommender, n, params)
+
+
+def _worker_shard(user_ids):
+    recommender, n, params = _worker_state
+    return _shard_top_rows(recommender, user_ids, n, params)
+
+
+def _shard_top_rows(recommender, user_ids, n, params):
+    """Return (gig rows, scores) tables of the top n of users, padded with -1 / NaN"""
+    rows = np.full((len(user_ids), n), -1, dtype=np.int32)
+    scores = np.full((len(user_ids), n), np.nan)
+    for i, (top_rows, top_scores) in enumerate(recommender.iter_recommendation_rows(user_ids, n, **params)):
+        rows[i, :len(top_rows)] = top_rows
+        scores[i, :len(top_rows)] = top_scores
+    return rows, scores
+
+
+def main(argv=None):
+    """Command line entry point of the offline job (see the module docstring)"""
+    parser = argparse.ArgumentParser(
+        prog='service_recommender.py precompute',
+        description="Precompute every user's recommendations into a table the server answers from"
+    )
+    parser.add_argument('--snapshot', default=os.getenv('MODEL_SNAPSHOT_DIR'),
+                        help="Model snapshot to score (default: $MODEL_SNAPSHOT_DIR)")
+    parser.add_argument('--output', default=os.getenv('RECOMMENDATION_TABLE_DIR'),
+                        help="Table directory (default: $RECOMMENDATION_TABLE_DIR)")
+    parser.add_argument('--n', type=int, default=DEFAULT_N, help="Recommendations per user")
+    parser.add_argument('--price-sensitivity', type=float, default=0.5)
+    parser.add_argument('--cf-weight', type=float, default=0.0)
+    parser.add_argument('--scoring', choices=('content', 'als'), default='content')
+    parser.add_argument('--include-history', action='store_true')
+    parser.add_argument('--incremental', action='store_true',
+                        help="Recompute only users whose profile changed since the existing table")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+    if not args.snapshot or not args.output:
+        parser.error("--snapshot and --output are required (or set MODEL_SNAPSHOT_DIR and RECOMMENDATION_TABLE_DIR)")
+
+    from service_recommender import ServiceRecommender
+    recommender = ServiceRecommender()
+    if not recommender.load_model(args.snapshot):
+        return 1
+    # The models the server builds on top of the snapshot change the fingerprint
+    recommender.prepare_for_serving()
+    build_table(
+        recommender,
+        args.output,
+        n=args.n,
+        include_history=args.include_history,
+        price_sensitivity=args.price_sensitivity,
+        cf_weight=args.cf_weight,
+        scoring=args.scoring,
+        incremental=args.incremental,
+        n_workers=args.workers
+    )
+    return 0
@@ -0,0 +1,471 @@
+"""
+Columnar user profile store
+
+Every profile is a row in a few shared arrays instead of a dict per user:
+a float32 feature matrix, a dense preference matrix indexed by category id,
+a version counter and a CSR-style history (one flat array of gig id codes
+with a start/end per row). All arrays grow geometrically, so adding a user
+is amortized O(1) and a block of users is scored straight from a slice of
+the feature matrix.
+
+Writers hold the stripe of the user they change (locks, a StripedLock keyed
+by user id) for the whole change, so writes to different users run in
+parallel. Readers take snapshot(): an immutable copy of one profile, cached
+until the next write to that user replaces it, so reading a profile costs a
+dict lookup and never sees a half-applied write. Adding rows and compacting
+histories move shared arrays; add() takes every stripe when it has to
+reallocate, so callers must not hold a stripe while adding.
+"""
+from collections import namedtuple
+from contextlib import contextmanager
+import sys
+import threading
+
+import numpy as np
+
+from array_utils import concat_ranges, grow
+from concurrency import StripedLock
+
+# Profile snapshots kept for readers before the cache is emptied
+SNAPSHOT_CACHE_SIZE = 100000
+
+# Immutable copy of one profile: features (float32) and preferences
+# (float64) are read-only arrays indexed by category id, history a tuple of
+# gig ids, categories the category names the arrays are laid out for
+ProfileSnapshot = namedtuple(
+    'ProfileSnapshot', ('user_id', 'row', 'version', 'name', 'features', 'preferences', 'history', 'categories'))
+
+# Profiles laid out for a new category list by remap_categories, to be
+# switched to by set_categories: the first len(versions) rows, the versions
+# they were read at, and the function computing their feature vectors
+CategoryRemap = namedtuple(
+    'CategoryRemap', ('category_names', 'versions', 'preferences', 'features', 'compute_features'))
+
+
+class ProfileStore:
+    def __init__(self, category_names=()):
+        """
+        Create an empty store
+
+        Parameters:
+        - category_names: Category name for each category id (feature column)
+        """
+        self._category_names = list(category_names)
+        self._category_ids = {name: i for i, name in enumerate(self._category_names)}
+        self._layout = tuple(self._category_names)  # Category names of the current snapshots
+        n_categories = len(self._category_names)
+
+        self._rows = {}  # User id -> row
+        self.user_ids = []  # Row -> user id
+        self._names = []  # Row -> display name
+        self._n_rows = 0
+
+        self._features = np.zeros((0, n_categories), dtype=np.float32)
+        self._preferences = np.zeros((0, n_categories), dtype=np.float64)
+        self._versions = np.zeros(0, dtype=np.int64)
+
+        # History: rows own [start, end) of _history_codes; replaced rows
+        # leave their old range behind until compaction
+        self._history_start = np.zeros(0, dtype=np.int64)
+        self._history_end = np.zeros(0, dtype=np.int64)
+        self._history_codes = np.zeros(0, dtype=np.int64)
+        self._history_used = 0
+        self._history_garbage = 0
+
+        # Gig ids interned to integer codes, so histories hold any id type
+        self._gig_codes = {}
+        self._gig_ids = []
+
+        self.locks = StripedLock()  # Held by writers, per user id
+        self._structure_lock = threading.Lock()  # Serializes adding rows
+        self._history_lock = threading.RLock()  # Guards the shared history arrays
+        self._snapshots = {}  # User id -> ProfileSnapshot, dropped on write
+
+    def __len__(self):
+        return self._n_rows
+
+    def __contains__(self, user_id):
+        return user_id in self._rows
+
+    def __iter__(self):
+        return iter(self.user_ids)
+
+    def __getitem__(self, user_id):
+        """Return a profile as a plain dict (a copy; edits are not stored)"""
+        snapshot = self.snapshot(user_id)
+        if snapshot is None:
+            raise KeyError(user_id)
+        return {
+            'name': snapshot.name,
+            'preferences': {snapshot.categories[i]: float(snapshot.preferences[i])
+                            for i in np.flatnonzero(snapshot.preferences)},
+            'history': list(snapshot.history),
+            'feature_vector': snapshot.features.copy()
+        }
+
+    def snapshot(self, user_id):
+        """
+        Return an immutable copy of a user's profile, or None if there is none
+
+        Served from the cache without locking; a cache miss copies the
+        profile under the user's stripe, so it never sees a write half done.
+        """
+        snapshot = self._snapshots.get(user_id)
+        if snapshot is not None:
+            return snapshot
+        row = self._rows.get(user_id)
+        if row is None:
+            return None
+
+        with self.locks.hold(user_id):
+            snapshot = self._snapshots.get(user_id)
+            if snapshot is None:
+                features = self._features[row].copy()
+                preferences = self._preferences[row].copy()
+                features.flags.writeable = preferences.flags.writeable = False
+                snapshot = ProfileSnapshot(user_id, row, int(self._versions[row]), self._names[row],
+                                           features, preferences, tuple(self.history(row)), self._layout)
+                if len(self._snapshots) >= SNAPSHOT_CACHE_SIZE:
+                    self._snapshots.clear()
+                self._snapshots[user_id] = snapshot
+        return snapshot
+
+    @contextmanager
+    def frozen(self):
+        """Hold off every writer (adds, all stripes and histories), e.g. to copy the whole store"""
+        with self._structure_lock, self.locks.hold_all(), self._history_lock:
+            yield
+
+    def state(self):
+        """
+        Return the store as (arrays, scalars) for snapshotting
+
+        Arrays are trimmed to their used length; id and name lists are
+        included as Python lists. Call it inside frozen() when writers may
+        be running.
+        """
+        n_rows = self._n_rows
+        arrays = {
+            'features': self._features[:n_rows],
+            'preferences': self._preferences[:n_rows],
+            'versions': self._versions[:n_rows],
+            'history_start': self._history_start[:n_rows],
+            'history_end': self._history_end[:n_rows],
+            'history_codes': self._history_codes[:self._history_used],
+            'user_ids': self.user_ids,
+            'names': self._names,
+            'gig_ids': self._gig_ids,
+        }
+        scalars = {
+            'category_names': self._category_names,
+            'history_garbage': self._history_garbage,
+        }
+        return arrays, scalars
+
+    @classmethod
+    def from_state(cls, arrays, scalars):
+        """Rebuild a store from state(); arrays may be memory-mapped"""
+        store = cls(scalars['category_names'])
+        store.user_ids = list(arrays['user_ids'])
+        store._names = list(arrays['names'])
+        store._rows = {user_id: row for row, user_id in enumerate(store.user_ids)}
+        store._n_rows = len(store.user_ids)
+        store._features = arrays['features']
+        store._preferences = arrays['preferences']
+        store._versions = arrays['versions']
+        store._history_start = arrays['history_start']
+        store._history_end = arrays['history_end']
+        store._history_codes = arrays['history_codes']
+        store._history_used = len(store._history_codes)
+        store._history_garbage = scalars['history_garbage']
+        store._gig_ids = list(arrays['gig_ids'])
+        store._gig_codes = {gig_id: code for code, gig_id in enumerate(store._gig_ids)}
+        return store
+
+    def get(self, user_id, default=None):
+        return self[user_id] if user_id in self._rows else default
+
+    def keys(self):
+        return list(self.user_ids)
+
+    def items(self):
+        return [(user_id, self[user_id]) for user_id in self.user_ids]
+
+    @property
+    def features(self):
+        """users x categories float32 feature matrix (a view)"""
+        return self._features[:self._n_rows]
+
+    @property
+    def versions(self):
+        """Profile version per row (a view)"""
+        return self._versions[:self._n_rows]
+
+    @property
+    def category_names(self):
+        return list(self._category_names)
+
+    def row(self, user_id):
+        """Return the row of a user, or None if there is no profile"""
+        return self._rows.get(user_id)
+
+    def rows(self, user_ids):
+        """Return the rows of users that all have profiles"""
+        return np.fromiter((self._rows[user_id] for user_id in user_ids), dtype=np.intp, count=len(user_ids))
+
+    def add(self, user_id, name):
+        """
+        Return the row of a user, creating an empty profile if needed
+
+        Must not be called while holding a stripe: growing the arrays waits
+        for every writer.
+        """
+        row = self._rows.get(user_id)
+        if row is not None:
+            return row
+
+        with self._structure_lock:
+            row = self._rows.get(user_id)
+            if row is not None:
+                return row
+
+            row = self._n_rows
+            size = row + 1
+            if any(size > len(array) for array in (self._features, self._preferences, self._versions,
+                                                   self._history_start, self._history_end)):
+                # Reallocating moves every row, so no writer may be mid-write
+                with self.locks.hold_all():
+                    self._features = grow(self._features, size)
+                    self._preferences = grow(self._preferences, size)
+                    self._versions = grow(self._versions, size)
+                    self._history_start = grow(self._history_start, size)
+                    self._history_end = grow(self._history_end, size)
+
+            # grow() leaves new rows uninitialized; the row is not visible yet
+            self._features[row] = 0
+            self._preferences[row] = 0
+            self._versions[row] = 0
+            with self._history_lock:
+                self._history_start[row] = self._history_end[row] = self._history_used
+
+            self.user_ids.append(user_id)
+            self._names.append(name)
+            self._n_rows = size
+            self._rows[user_id] = row
+        return row
+
+    def name(self, row):
+        return self._names[row]
+
+    def version(self, user_id):
+        """Return the profile version of a user (0 if there is no profile)"""
+        row = self._rows.get(user_id)
+        return 0 if row is None else int(self._versions[row])
+
+    def preferences(self, row):
+        """Return a row's non-zero preferences as {category name: weight}"""
+        weights = self._preferences[row]
+        return {self._category_names[i]: float(weights[i]) for i in np.flatnonzero(weights)}
+
+    def preference(self, row, category_id):
+        return float(self._preferences[row, category_id])
+
+    def set_preferences(self, row, preferences):
+        """Replace a row's preferences; unknown category names are ignored"""
+        self._snapshots.pop(self.user_ids[row], None)
+        self._preferences[row] = 0
+        for category, weight in preferences.items():
+            category_id = self._category_ids.get(category)
+            if category_id is not None:
+                self._preferences[row, category_id] = weight
+
+    def add_preference(self, row, category_id, weight):
+        self._snapshots.pop(self.user_ids[row], None)
+        self._preferences[row, category_id] += weight
+
+    def history(self, row):
+        """Return a row's history as a list of gig ids"""
+        with self._history_lock:
+            codes = self._history_codes[self._history_start[row]:self._history_end[row]]
+            return [self._gig_ids[code] for code in codes.tolist()]
+
+    def history_lengths(self, rows):
+        return self._history_end[rows] - self._history_start[rows]
+
+    def set_history(self, row, history):
+        """Replace a row's history with a list of gig ids"""
+        self._snapshots.pop(self.user_ids[row], None)
+        with self._history_lock:
+            self._set_history(row, history)
+
+    def _set_history(self, row, history):
+        codes = np.fromiter((self._gig_code(gig_id) for gig_id in history), dtype=np.int64, count=len(history))
+        start, end = self._history_start[row], self._history_end[row]
+
+        if len(codes) <= end - start:
+            # Fits in the old range
+            self._history_codes[start:start + len(codes)] = codes
+            self._history_garbage += int(end - start) - len(codes)
+            self._history_end[row] = start + len(codes)
+            return
+
+        self._history_garbage += int(end - start)
+        size = self._history_used + len(codes)
+        self._history_codes = grow(self._history_codes, size)
+        self._history_codes[self._history_used:size] = codes
+        self._history_start[row] = self._history_used
+        self._history_end[row] = size
+        self._history_used = size
+
+        if self._history_garbage > self._history_used // 2:
+            self._compact_history()
+
+    def history_matrix(self, rows):
+        """
+        Return (owners, gig_ids) for the histories of rows
+
+        owners[i] is the position in rows whose history contains gig_ids[i].
+        """
+        with self._history_lock:
+            starts, ends = self._history_start[rows], self._history_end[rows]
+            owners = np.repeat(np.arange(len(rows)), ends - starts)
+            codes = self._history_codes[concat_ranges(starts, ends)]
+            return owners, [self._gig_ids[code] for code in codes.tolist()]
+
+    def rows_with_history(self, gig_ids):
+        """Return the rows whose history contains any of gig_ids"""
+        with self._history_lock:
+            codes = [self._gig_codes[gig_id] for gig_id in gig_ids if gig_id in self._gig_codes]
+            # Most gigs are in no history: scan the buffer before finding owners
+            if not codes or not np.isin(self._history_codes[:self._history_used], codes).any():
+                return np.empty(0, dtype=np.intp)
+            starts, ends = self._history_start[:self._n_rows], self._history_end[:self._n_rows]
+            owners = np.repeat(np.arange(self._n_rows), ends - starts)
+            held = np.isin(self._history_codes[concat_ranges(starts, ends)], codes)
+            return np.unique(owners[held])
+
+    def preference_matrix(self, rows):
+        """Return a copy of the preference rows (float64, users x categories)"""
+        return self._preferences[rows]
+
+    def set_features(self, rows, features):
+        """Store new feature vectors for rows and bump their versions"""
+        self._features[rows] = features
+        self._versions[rows] += 1
+        rows = np.asarray(rows).tolist()
+        if len(rows) > len(self._snapshots):
+            self._snapshots.clear()
+        else:
+            for row in rows:
+                self._snapshots.pop(self.user_ids[row], None)
+
+    def remap_categories(self, category_names, compute_features):
+        """
+        Lay every profile out for a new category list without locking
+
+        Preferences are remapped by name. Writers keep running meanwhile; a
+        row they change is copied at a newer version, and set_categories
+        redoes it.
+
+        Parameters:
+        - category_names: The new category list
+        - compute_features: Function (rows, remapped preference rows) ->
+          feature vectors in the new layout
+
+        Returns:
+        - CategoryRemap to pass to set_categories
+        """
+        category_names = list(category_names)
+        n_rows = self._n_rows
+        # Versions are read first: a write racing the copy bumps its row's
+        # version after changing it, so set_categories sees it as changed
+        versions = self._versions[:n_rows].copy()
+        preferences = self._remap_preferences(self._preferences[:n_rows], category_names)
+        if n_rows:
+            features = compute_features(np.arange(n_rows), preferences)
+        else:
+            features = np.zeros((0, len(category_names)))
+        return CategoryRemap(category_names, versions, preferences, features, compute_features)
+
+    def set_categories(self, remap):
+        """
+        Switch to the category list of a remap_categories() result
+
+        Rows changed or added since the remap are remapped again, and every
+        row's version is bumped. Call it inside frozen() when writers may be
+        running.
+        """
+        category_names = remap.category_names
+        n_remapped = len(remap.versions)
+        n_rows = self._n_rows
+        redo = np.concatenate([np.flatnonzero(self._versions[:n_remapped] != remap.versions),
+                               np.arange(n_remapped, n_rows)])
+
+        preferences = np.zeros((len(self._preferences), len(category_names)), dtype=np.float64)
+        features = np.zeros((len(self._features), len(category_names)), dtype=np.float32)
+        preferences[:n_remapped] = remap.preferences
+        features[:n_remapped] = remap.features
+        if len(redo):
+            preferences[redo] = self._remap_preferences(self._preferences[redo], category_names)
+            features[redo] = remap.compute_features(redo, preferences[redo])
+
+        self._category_names = category_names
+        self._category_ids = {name: i for i, name in enumerate(category_names)}
+        self._layout = tuple(category_names)
+        self._preferences = preferences
+        self._features = features
+        self._versions[:n_rows] += 1
+        self._snapshots.clear()
+
+    def _remap_preferences(self, preferences, category_names):
+        """Return preference rows laid out for another category list, matched by name"""
+        remapped = np.zeros((len(preferences), len(category_names)), dtype=np.float64)
+        for new_id, category in enumerate(category_names):
+            old_id = self._category_ids.get(category)
+            if old_id is not None:
+                remapped[:, new_id] = preferences[:, old_id]
+        return remapped
+
+    def memory_usage(self):
+        """
+        Report memory held by the store
+
+        Returns:
+        - Dict with users, array bytes, index bytes (id map, id and name
+          lists, without the id/name objects themselves), total bytes
+          and bytes_per_user
+        """
+        array_bytes = sum(array.nbytes for array in (
+            self._features, self._preferences, self._versions,
+            self._history_start, self._history_end, self._history_codes))
+        index_bytes = (sys.getsizeof(self._rows) + sys.getsizeof(self.user_ids) + sys.getsizeof(self._names)
+                       + sys.getsizeof(self._gig_codes) + sys.getsizeof(self._gig_ids))
+        total = array_bytes + index_bytes
+        return {
+            'users': self._n_rows,
+            'array_bytes': array_bytes,
+            'index_bytes': index_bytes,
+            'bytes': total,
+            'bytes_per_user': total / self._n_rows if self._n_rows else 0.0
+        }
+
+    def _gig_code(self, gig_id):
+        code = self._gig_codes.get(gig_id)
+        if code is None:
+            code = len(self._gig_ids)
+            self._gig_codes[gig_id] = code
+            self._gig_ids.append(gig_id)
+        return code
+
+    def _compact_history(self):
+        """Copy live history ranges into a fresh array, dropping replaced ones"""
+        starts = self._history_start[:self._n_rows]
+        ends = self._history_end[:self._n_rows]
+        lengths = ends - starts
+        codes = self._history_codes[concat_ranges(starts, ends)]
+
+        self._history_codes = codes
+        self._history_start[:self._n_rows] = np.cumsum(lengths) - lengths
+        self._history_end[:self._n_rows] = self._history_start[:self._n_rows] + lengths
+        self._history_used = len(codes)
+        self._history_garbage = 0
@@ -0,0 +1,172 @@
+"""
+Recommendation result cache
+
+Caches serialized recommendation responses keyed by request parameters and
+validated against the user's profile version, so repeat page loads skip
+scoring and serialization entirely. Entries are evicted least recently used
+first once the entry or byte cap is reached, and expire after a TTL.
+
+Callers read the profile version and catalog_generation before computing a
+response and store it under those, so a response computed while the
+profile or catalog changed is never cached as current.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+
+class RecommendationCache:
+    def __init__(self, max_entries=50000, max_bytes=32 * 1024 * 1024, ttl=300, clock=time.monotonic):
+        """
+        Initialize an empty cache
+
+        Parameters:
+        - max_entries: Maximum number of cached responses
+        - max_bytes: Maximum total size of cached response bodies
+        - ttl: Seconds an entry stays valid
+        - clock: Function returning the current time in seconds
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        # key -> (version, expires_at, body, gig_ids); oldest use first
+        self._entries = OrderedDict()
+        self._user_keys = {}  # user_id -> keys cached for that user
+        self._gig_keys = {}  # gig_id -> keys whose response contains the gig
+        self._bytes = 0
+        self.catalog_generation = 0  # Bumped by every invalidate_gigs call
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, version):
+        """
+        Return the cached body for key, or None
+
+        Parameters:
+        - key: Tuple starting with the user id, e.g. (user_id, n, price_sensitivity, include_history)
+        - version: Current profile version of the user; older entries miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            cached_version, expires_at, body, _ = entry
+            if cached_version != version:
+                self._remove(key)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            if expires_at <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, version, body, gig_ids=(), catalog_generation=None):
+        """
+        Cache a response body
+
+        Parameters:
+        - key: Cache key, starting with the user id
+        - version: Profile version read before the response was computed
+        - body: Serialized response (str or bytes)
+        - gig_ids: Gigs contained in the response, for invalidate_gigs
+        - catalog_generation: catalog_generation read before the response
+          was computed; the body is dropped if the catalog changed since
+        """
+        if len(body) > self.max_bytes:
+            return
+
+        with self._lock:
+            if catalog_generation is not None and catalog_generation != self.catalog_generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+
+            gig_ids = tuple(gig_ids)
+            self._entries[key] = (version, self._clock() + self.ttl, body, gig_ids)
+            self._bytes += len(body)
+            self._user_keys.setdefault(key[0], set()).add(key)
+            for gig_id in gig_ids:
+                self._gig_keys.setdefault(gig_id, set()).add(key)
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        """Drop every entry cached for a user"""
+        with self._lock:
+            for key in list(self._user_keys.get(user_id, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def invalidate_gigs(self, gig_ids=None):
+        """
+        Drop entries affected by catalog changes
+
+        Parameters:
+        - gig_ids: Gigs whose change only affects responses containing
+          them, or None when every response may be affected
+        """
+        with self._lock:
+            self.catalog_generation += 1
+            if gig_ids is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self._user_keys.clear()
+                self._gig_keys.clear()
+                self._bytes = 0
+                return
+
+            for gig_id in gig_ids:
+                for key in list(self._gig_keys.get(gig_id, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
+
+    def _remove(self, key):
+        """Remove an entry and its secondary index references (lock held)"""
+        _, _, body, gig_ids = self._entries.pop(key)
+        self._bytes -= len(body)
+
+        user_keys = self._user_keys.get(key[0])
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._user_keys[key[0]]
+
+        for gig_id in gig_ids:
+            gig_keys = self._gig_keys.get(gig_id)
+            if gig_keys is not None:
+                gig_keys.discard(key)
+                if not gig_keys:
+                    del self._gig_keys[gig_id]
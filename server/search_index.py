@@ -0,0 +1,522 @@
+"""
+Full-text gig search: BM25 over a compressed inverted index
+
+Terms are the lower-cased words of a gig's text. Each term's posting list
+(the rows containing it in ascending order, with the term frequency) is cut
+into blocks of BLOCK_SIZE postings. A block records its first and last row
+and stores the gaps between consecutive rows as variable-byte integers (7
+bits per byte, the high bit set on every byte but a value's last), so a
+common term costs about one byte per posting. Term frequencies take one
+byte each. Encoding and decoding are vectorized over whole blocks.
+
+Queries are ranked by BM25 with MaxScore early termination. Every term has
+an upper bound on its score (from its largest term frequency and shortest
+document), and terms are scored from the highest bound down. Once the
+bounds of the remaining terms add up to less than the current k-th best
+score, no row that has not matched yet can enter the top k. The remaining
+terms then only score the rows already found: they decode just the blocks
+whose row range covers one of those rows, and rows that can no longer reach
+the k-th score are dropped as the remaining bound shrinks.
+
+Prefix autocomplete bisects a sorted term list and ranks the completions by
+document frequency.
+
+Rows are addressed by the caller's row positions (gig rows in
+ServiceRecommender). Added and edited rows go to an uncompressed delta that
+is merged into the blocks once it grows; until then their old postings are
+masked out. Removing a row subtracts its terms from the document
+frequencies right away, so IDF stays exact; the per-term score bounds only
+tighten at the next merge, which keeps them valid upper bounds.
+"""
+import bisect
+import heapq
+
+import numpy as np
+
+from array_utils import concat_ranges, grow, top_k
+from text_index import TOKEN_PATTERN
+
+# Postings per compressed block
+BLOCK_SIZE = 128
+
+# BM25 term frequency saturation and document length normalization
+K1 = 1.2
+B = 0.75
+
+# Largest stored term frequency (one byte)
+MAX_TF = 255
+
+# Completions the last word of a prefix query expands into
+PREFIX_EXPANSIONS = 8
+
+# Delta postings kept before a merge (or an eighth of the indexed postings, if more)
+DELTA_POSTINGS = 65536
+
+# Relative slack on score bounds, covering rounding differences between
+# summing bounds and summing scores
+BOUND_SLACK = 1e-9
+
+
+class SearchIndex:
+    def __init__(self):
+        """Initialize an empty index"""
+        self._reset()
+
+    def _reset(self):
+        # Vocabulary
+        self._term_ids = {}  # Term -> term id
+        self._terms = []  # Term id -> term
+        self._sorted_terms = []  # Terms in lexicographic order, for prefix lookups
+        self._doc_freq = np.empty(0, dtype=np.int64)
+        self._max_tf = np.empty(0, dtype=np.int64)  # Largest frequency per term, for score bounds
+        self._min_len = np.empty(0, dtype=np.int64)  # Shortest document per term, for score bounds
+
+        # Rows
+        self._doc_len = np.empty(0, dtype=np.int32)
+        self._live = np.empty(0, dtype=bool)
+        self._in_blocks = np.empty(0, dtype=bool)  # Whether the row's block postings are current
+        self._delta_serial = np.empty(0, dtype=np.int64)  # Serial of the row's current delta postings
+        self._n_rows = 0
+        self._n_docs = 0
+        self._total_len = 0
+
+        # Compressed postings; a term's blocks are [_term_blocks[t], _term_blocks[t + 1])
+        self._term_blocks = np.zeros(1, dtype=np.int64)
+        self._block_first = np.empty(0, dtype=np.int64)
+        self._block_last = np.empty(0, dtype=np.int64)
+        self._block_postings = np.zeros(1, dtype=np.int64)  # Block -> offset of its postings
+        self._block_bytes = np.zeros(1, dtype=np.int64)  # Block -> offset of its gap bytes
+        self._gaps = np.empty(0, dtype=np.uint8)
+        self._tfs = np.empty(0, dtype=np.uint8)
+
+        # Uncompressed postings of rows written since the last merge
+        self._delta_terms = np.empty(0, dtype=np.int64)
+        self._delta_rows = np.empty(0, dtype=np.int64)
+        self._delta_tfs = np.empty(0, dtype=np.int64)
+        self._delta_serials = np.empty(0, dtype=np.int64)
+        self._n_delta = 0
+        self._serial = 0
+
+    def __len__(self):
+        return self._n_docs
+
+    def state(self):
+        """
+        Return the index as (arrays, scalars) for snapshotting
+
+        Arrays are trimmed to their used length; scalars are JSON-serializable.
+        """
+        n_terms = len(self._terms)
+        n_delta = self._n_delta
+        arrays = {
+            'terms': list(self._terms),
+            'doc_freq': self._doc_freq[:n_terms],
+            'max_tf': self._max_tf[:n_terms],
+            'min_len': self._min_len[:n_terms],
+            'doc_len': self._doc_len[:self._n_rows],
+            'live': self._live[:self._n_rows],
+            'in_blocks': self._in_blocks[:self._n_rows],
+            'delta_serial': self._delta_serial[:self._n_rows],
+            'term_blocks': self._term_blocks,
+            'block_first': self._block_first,
+            'block_last': self._block_last,
+            'block_postings': self._block_postings,
+            'block_bytes': self._block_bytes,
+            'gaps': self._gaps,
+            'tfs': self._tfs,
+            'delta_terms': self._delta_terms[:n_delta],
+            'delta_rows': self._delta_rows[:n_delta],
+            'delta_tfs': self._delta_tfs[:n_delta],
+            'delta_serials': self._delta_serials[:n_delta],
+        }
+        scalars = {
+            'n_docs': self._n_docs,
+            'total_len': self._total_len,
+            'serial': self._serial,
+        }
+        return arrays, scalars
+
+    @classmethod
+    def from_state(cls, arrays, scalars):
+        """Rebuild an index from state(); arrays may be memory-mapped"""
+        index = cls()
+        index._terms = list(arrays['terms'])
+        index._term_ids = {term: term_id for term_id, term in enumerate(index._terms)}
+        index._sorted_terms = sorted(index._terms)
+        index._doc_freq = arrays['doc_freq']
+        index._max_tf = arrays['max_tf']
+        index._min_len = arrays['min_len']
+        index._doc_len = arrays['doc_len']
+        index._live = arrays['live']
+        index._in_blocks = arrays['in_blocks']
+        index._delta_serial = arrays['delta_serial']
+        index._n_rows = len(index._doc_len)
+        index._n_docs = scalars['n_docs']
+        index._total_len = scalars['total_len']
+        for name in ('term_blocks', 'block_first', 'block_last', 'block_postings', 'block_bytes', 'gaps', 'tfs'):
+            setattr(index, f"_{name}", arrays[name])
+        index._delta_terms = arrays['delta_terms']
+        index._delta_rows = arrays['delta_rows']
+        index._delta_tfs = arrays['delta_tfs']
+        index._delta_serials = arrays['delta_serials']
+        index._n_delta = len(index._delta_terms)
+        index._serial = scalars['serial']
+        return index
+
+    def fit(self, texts):
+        """Index a full list of texts; row i of the index is texts[i]"""
+        self._reset()
+        rows, terms, tfs = self._add_rows(np.arange(len(texts)), texts)
+        order = np.lexsort((rows, terms))
+        self._build_blocks(terms[order], rows[order], tfs[order])
+        self._in_blocks[:self._n_rows] = True
+
+    def add(self, texts):
+        """Append texts as new rows after the existing ones"""
+        self._write_delta(np.arange(self._n_rows, self._n_rows + len(texts)), texts)
+
+    def update(self, row, text):
+        """Replace the text of an existing row"""
+        self.remove([row])
+        self._write_delta(np.array([row]), [text])
+
+    def remove(self, rows):
+        """Drop rows from the index; their postings are masked until the next merge"""
+        rows = np.array(sorted({int(row) for row in rows if 0 <= row < self._n_rows and self._live[row]}),
+                        dtype=np.int64)
+        if not len(rows):
+            return
+        self._doc_freq[:len(self._terms)] -= np.bincount(self._row_terms(rows), minlength=len(self._terms))
+        self._live[rows] = False
+        self._in_blocks[rows] = False
+        self._delta_serial[rows] = 0
+        self._n_docs -= len(rows)
+        self._total_len -= int(self._doc_len[rows].sum())
+
+    def search(self, query, k=10, prefix=False):
+        """
+        Return the k rows that best match a query under BM25
+
+        Parameters:
+        - query: Free text; rows matching any of its words are candidates
+        - k: Number of rows to return
+        - prefix: Whether the last word is still being typed; it then also
+          matches its PREFIX_EXPANSIONS most common completions
+
+        Returns:
+        - (rows, scores) arrays, best first, ties by row
+        """
+        words = TOKEN_PATTERN.findall(query.lower())
+        if prefix and words:
+            words = words[:-1] + [term for term, _ in self.complete(words[-1], PREFIX_EXPANSIONS)]
+        terms = list(dict.fromkeys(self._term_ids[word] for word in words if word in self._term_ids))
+        terms = [term for term in terms if self._doc_freq[term] > 0]
+        if k <= 0 or not terms or not self._n_docs:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+        average_len = self._total_len / self._n_docs
+        idf = {term: self._idf(term) for term in terms}
+        bounds = {term: self._bm25(idf[term], self._max_tf[term], self._min_len[term], average_len) for term in terms}
+        terms.sort(key=lambda term: -bounds[term])
+        # remaining[i]: most that terms[i:] can add to any row
+        remaining = np.cumsum([bounds[term] for term in reversed(terms)])[::-1] * (1 + BOUND_SLACK)
+
+        rows = np.empty(0, dtype=np.int64)
+        scores = np.empty(0, dtype=np.float64)
+        threshold = -np.inf
+        position = 0
+        # Essential terms: any row may still reach the top k, so score all postings
+        while position < len(terms) and not (len(rows) >= k and remaining[position] < threshold):
+            term = terms[position]
+            term_rows, tfs = self._postings(term)
+            term_scores = self._bm25(idf[term], tfs, self._doc_len[term_rows], average_len)
+            rows, inverse = np.unique(np.concatenate([rows, term_rows]), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([scores, term_scores]), minlength=len(rows))
+            if len(rows) >= k:
+                threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+            position += 1
+
+        # Other terms only add to rows that can still reach the k-th score
+        for position in range(position, len(terms)):
+            keep = scores + remaining[position] >= threshold
+            rows, scores = rows[keep], scores[keep]
+            term = terms[position]
+            tfs = self._postings_in(term, rows)
+            matched = np.flatnonzero(tfs)
+            scores[matched] += self._bm25(idf[term], tfs[matched], self._doc_len[rows[matched]], average_len)
+            if len(scores) >= k:
+                threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+
+        # Rows are ascending, so top_k breaks ties by row
+        best = top_k(scores, k)
+        return rows[best], scores[best]
+
+    def complete(self, prefix, k=PREFIX_EXPANSIONS):
+        """
+        Return up to k indexed words starting with prefix, most documents first
+
+        Returns:
+        - List of (word, document frequency) pairs
+        """
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        end = bisect.bisect_left(self._sorted_terms, prefix + '\U0010ffff', start)
+        doc_freq = self._doc_freq
+        term_ids = self._term_ids
+        words = heapq.nlargest(k, self._sorted_terms[start:end], key=lambda word: doc_freq[term_ids[word]])
+        return [(word, int(doc_freq[term_ids[word]])) for word in words if doc_freq[term_ids[word]] > 0]
+
+    @staticmethod
+    def _bm25(idf, tfs, doc_lens, average_len):
+        return idf * tfs * (K1 + 1) / (tfs + K1 * (1 - B + B * doc_lens / average_len))
+
+    def _idf(self, term):
+        # Lucene's BM25 IDF, positive even for terms in most documents; a
+        # negative IDF would break the MaxScore bounds
+        doc_freq = self._doc_freq[term]
+        return float(np.log(1 + (max(self._n_docs - doc_freq, 0) + 0.5) / (doc_freq + 0.5)))
+
+    def _count_terms(self, texts):
+        """
+        Return (text positions, term ids, term frequencies, text lengths) of
+        texts, with one entry per distinct term of a text. New words are
+        added to the vocabulary.
+        """
+        term_ids = self._term_ids
+        ids = []
+        lengths = []
+        new_words = []
+        for text in texts:
+            words = TOKEN_PATTERN.findall(text.lower())
+            for word in words:
+                term = term_ids.get(word)
+                if term is None:
+                    term = term_ids[word] = len(self._terms)
+                    self._terms.append(word)
+                    new_words.append(word)
+                ids.append(term)
+            lengths.append(len(words))
+
+        if new_words:
+            n_terms = len(self._terms)
+            start = n_terms - len(new_words)
+            self._doc_freq = grow(self._doc_freq, n_terms)
+            self._max_tf = grow(self._max_tf, n_terms)
+            self._min_len = grow(self._min_len, n_terms)
+            self._doc_freq[start:n_terms] = 0
+            self._max_tf[start:n_terms] = 0
+            self._min_len[start:n_terms] = np.iinfo(np.int64).max
+            if len(new_words) > len(self._sorted_terms) // 16:
+                self._sorted_terms = sorted(self._terms)
+            else:
+                for word in new_words:
+                    bisect.insort(self._sorted_terms, word)
+
+        # Count (text, term) pairs; unique keys come out sorted by text
+        n_terms = max(len(self._terms), 1)
+        lengths = np.array(lengths, dtype=np.int64)
+        docs = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        keys, counts = np.unique(docs * n_terms + np.array(ids, dtype=np.int64), return_counts=True)
+        return keys // n_terms, keys % n_terms, counts, lengths
+
+    def _add_rows(self, rows, texts):
+        """Count the terms of rows (new or rewritten) into the statistics; returns their postings"""
+        docs, terms, tfs, lengths = self._count_terms(texts)
+        end = max(self._n_rows, int(rows.max()) + 1 if len(rows) else 0)
+        if end > self._n_rows:
+            for name in ('_doc_len', '_live', '_in_blocks', '_delta_serial'):
+                setattr(self, name, grow(getattr(self, name), end))
+            self._live[self._n_rows:end] = False
+            self._in_blocks[self._n_rows:end] = False
+            self._delta_serial[self._n_rows:end] = 0
+            self._n_rows = end
+
+        self._doc_len[rows] = lengths
+        self._live[rows] = True
+        self._n_docs += len(rows)
+        self._total_len += int(lengths.sum())
+
+        tfs = np.minimum(tfs, MAX_TF)
+        self._doc_freq[:len(self._terms)] += np.bincount(terms, minlength=len(self._terms))
+        np.maximum.at(self._max_tf, terms, tfs)
+        np.minimum.at(self._min_len, terms, lengths[docs])
+        return rows[docs], terms, tfs
+
+    def _write_delta(self, rows, texts):
+        """Index rows through the delta, merging it once it is large"""
+        rows, terms, tfs = self._add_rows(rows, texts)
+        self._serial += 1
+        self._delta_serial[rows] = self._serial
+
+        start = self._n_delta
+        end = start + len(rows)
+        for name in ('_delta_terms', '_delta_rows', '_delta_tfs', '_delta_serials'):
+            setattr(self, name, grow(getattr(self, name), end))
+        self._delta_terms[start:end] = terms
+        self._delta_rows[start:end] = rows
+        self._delta_tfs[start:end] = tfs
+        self._delta_serials[start:end] = self._serial
+        self._n_delta = end
+
+        if self._n_delta > max(DELTA_POSTINGS, len(self._tfs) // 8):
+            self._merge()
+
+    def _merge(self):
+        """Rebuild the blocks from their current postings plus the delta, with exact statistics"""
+        n_blocks = len(self._block_first)
+        rows, tfs = self._decode_blocks(np.arange(n_blocks))
+        terms = np.repeat(np.arange(len(self._term_blocks) - 1),
+                          np.diff(self._block_postings[self._term_blocks]))
+        current = self._in_blocks[rows]
+        terms, rows, tfs = terms[current], rows[current], tfs[current]
+
+        n_delta = self._n_delta
+        delta_rows = self._delta_rows[:n_delta]
+        current = self._delta_serial[delta_rows] == self._delta_serials[:n_delta]
+        terms = np.concatenate([terms, self._delta_terms[:n_delta][current]])
+        rows = np.concatenate([rows, delta_rows[current]])
+        tfs = np.concatenate([tfs, self._delta_tfs[:n_delta][current]])
+
+        order = np.lexsort((rows, terms))
+        terms, rows, tfs = terms[order], rows[order], tfs[order]
+        self._build_blocks(terms, rows, tfs)
+
+        n_terms = len(self._terms)
+        self._doc_freq = np.bincount(terms, minlength=n_terms).astype(np.int64)
+        self._max_tf = np.zeros(n_terms, dtype=np.int64)
+        np.maximum.at(self._max_tf, terms, tfs)
+        self._min_len = np.full(n_terms, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(self._min_len, terms, self._doc_len[rows].astype(np.int64))
+
+        self._in_blocks[:self._n_rows] = self._live[:self._n_rows]
+        self._delta_serial[:self._n_rows] = 0
+        self._n_delta = 0
+
+    def _build_blocks(self, terms, rows, tfs):
+        """Compress postings sorted by (term, row) into blocks"""
+        n_postings = len(rows)
+        term_offsets = np.searchsorted(terms, np.arange(len(self._terms) + 1))
+        counts = np.diff(term_offsets)
+        self._term_blocks = np.zeros(len(self._terms) + 1, dtype=np.int64)
+        np.cumsum(-(-counts // BLOCK_SIZE), out=self._term_blocks[1:])
+
+        # Every BLOCK_SIZE-th posting of a term starts a block, with gap 0
+        in_term = np.arange(n_postings) - np.repeat(term_offsets[:-1], counts)
+        starts = np.flatnonzero(in_term % BLOCK_SIZE == 0)
+        gaps = np.diff(rows, prepend=0)
+        gaps[starts] = 0
+        self._gaps, byte_offsets = _encode_varints(gaps)
+        self._tfs = tfs.astype(np.uint8)
+
+        self._block_postings = np.append(starts, n_postings).astype(np.int64)
+        self._block_bytes = byte_offsets[self._block_postings]
+        self._block_first = rows[starts].astype(np.int64)
+        self._block_last = rows[self._block_postings[1:] - 1].astype(np.int64)
+
+    def _decode_blocks(self, blocks):
+        """Return (rows, term frequencies) of the postings in blocks"""
+        posting_starts = self._block_postings[blocks]
+        counts = self._block_postings[blocks + 1] - posting_starts
+        gaps = _decode_varints(self._gaps[concat_ranges(self._block_bytes[blocks], self._block_bytes[blocks + 1])])
+        tfs = self._tfs[concat_ranges(posting_starts, posting_starts + counts)].astype(np.int64)
+
+        # Cumulative gaps restart at each block's first row
+        sums = np.cumsum(gaps)
+        block_offsets = np.cumsum(counts) - counts
+        rows = sums + np.repeat(self._block_first[blocks] - sums[block_offsets], counts)
+        return rows, tfs
+
+    def _term_block_range(self, term):
+        if term + 1 < len(self._term_blocks):
+            return self._term_blocks[term], self._term_blocks[term + 1]
+        return 0, 0
+
+    def _delta_postings(self, term):
+        """Return (rows, term frequencies) of a term's current delta postings"""
+        n_delta = self._n_delta
+        if not n_delta:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        matches = np.flatnonzero(self._delta_terms[:n_delta] == term)
+        rows = self._delta_rows[matches]
+        current = self._delta_serial[rows] == self._delta_serials[matches]
+        return rows[current], self._delta_tfs[matches[current]]
+
+    def _row_terms(self, rows):
+        """Return the term ids of the current postings of sorted rows, one per (row, term)"""
+        covered = (np.searchsorted(rows, self._block_last, side='right')
+                   > np.searchsorted(rows, self._block_first, side='left'))
+        blocks = np.flatnonzero(covered)
+        block_rows, _ = self._decode_blocks(blocks)
+        block_terms = np.repeat(np.searchsorted(self._term_blocks, blocks, side='right') - 1,
+                                self._block_postings[blocks + 1] - self._block_postings[blocks])
+        positions = np.minimum(np.searchsorted(rows, block_rows), len(rows) - 1)
+        current = (rows[positions] == block_rows) & self._in_blocks[block_rows]
+
+        n_delta = self._n_delta
+        delta_rows = self._delta_rows[:n_delta]
+        delta_current = (self._delta_serial[delta_rows] == self._delta_serials[:n_delta]) & np.isin(delta_rows, rows)
+        return np.concatenate([block_terms[current], self._delta_terms[:n_delta][delta_current]])
+
+    def _postings(self, term):
+        """Return (rows, term frequencies) of every current posting of a term"""
+        start, end = self._term_block_range(term)
+        rows, tfs = self._decode_blocks(np.arange(start, end))
+        current = self._in_blocks[rows]
+        delta_rows, delta_tfs = self._delta_postings(term)
+        return np.concatenate([rows[current], delta_rows]), np.concatenate([tfs[current], delta_tfs])
+
+    def _postings_in(self, term, candidates):
+        """
+        Return a term's frequency in each of the sorted candidate rows (0 if absent)
+
+        Only the blocks whose row range covers a candidate are decoded.
+        """
+        start, end = self._term_block_range(term)
+        covered = (np.searchsorted(candidates, self._block_last[start:end], side='right')
+                   > np.searchsorted(candidates, self._block_first[start:end], side='left'))
+        rows, tfs = self._decode_blocks(start + np.flatnonzero(covered))
+        current = self._in_blocks[rows]
+        delta_rows, delta_tfs = self._delta_postings(term)
+        rows = np.concatenate([rows[current], delta_rows])
+        tfs = np.concatenate([tfs[current], delta_tfs])
+
+        result = np.zeros(len(candidates), dtype=np.int64)
+        if len(candidates) and len(rows):
+            positions = np.minimum(np.searchsorted(candidates, rows), len(candidates) - 1)
+            found = candidates[positions] == rows
+            result[positions[found]] = tfs[found]
+        return result
+
+
+def _encode_varints(values):
+    """
+    Variable-byte encode non-negative integers
+
+    Returns:
+    - (uint8 bytes, byte offset of each value plus the total length)
+    """
+    values = values.astype(np.int64)
+    n_bytes = np.ones(len(values), dtype=np.int64)
+    for bits in (7, 14, 21, 28, 35, 42, 49, 56):
+        n_bytes += values >= (1 << bits)
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(n_bytes, out=offsets[1:])
+
+    owners = np.repeat(np.arange(len(values)), n_bytes)
+    shifts = 7 * (np.arange(offsets[-1]) - offsets[owners])
+    data = (values[owners] >> shifts) & 0x7f
+    # The high bit marks every byte but a value's last
+    data[np.flatnonzero(shifts < 7 * (n_bytes[owners] - 1))] |= 0x80
+    return data.astype(np.uint8), offsets
+
+
+def _decode_varints(data):
+    """Decode a concatenation of _encode_varints values"""
+    if not len(data):
+        return np.empty(0, dtype=np.int64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.empty(len(ends), dtype=np.int64)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    shifts = 7 * (np.arange(len(data)) - np.repeat(starts, ends - starts + 1))
+    return np.add.reduceat((data & 0x7f).astype(np.int64) << shifts, starts)
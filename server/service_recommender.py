@@ -1,59 +1,1003 @@
-import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import MinMaxScaler
+from collections import Counter
+from contextlib import contextmanager
+import copy
+import functools
+import heapq
 import json
+import logging
+import os
+import threading
+import time
+import zlib
+import metrics
+from array_utils import concat_ranges, grow, top_k
+from category_matcher import CategoryMatcher
+from column_table import ColumnTable, RecordList
+from concurrency import SwappableState, state_property
+from text_index import TextIndex
+from filter_index import FilterIndex
+from search_index import SearchIndex
+from profile_store import ProfileStore
+from snapshot import encode_values, read_snapshot, write_snapshot
+from precompute import RecommendationTable, table_params
+from trending import TrendingTracker
+from item_similarity import DEFAULT_N_NEIGHBORS, ItemSimilarity
+from implicit_als import DEFAULT_ALPHA, DEFAULT_FACTORS, DEFAULT_ITERATIONS, DEFAULT_REGULARIZATION, ImplicitALS
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the size of the dense score block scored at once by
+# get_recommendations_batch (users per chunk x gigs x 8 bytes)
+BATCH_SCORE_BYTES = 64 * 1024 * 1024
+
+# Relative slack below a category's cut-off price x rating factor that is
+# still ranked by get_recommendations_batch, covering float rounding in the
+# scores so the pruned ranking stays identical to scoring every gig
+RANKING_MARGIN = 1e-9
+
+# Different interactions have different weights (unknown types count as views)
+INTERACTION_WEIGHTS = {
+    'view': 0.1,
+    'click': 0.3,
+    'favorite': 0.7,
+    'purchase': 1.0
+}
+
+# Gig columns identifying the seller for exclude_sellers, first present wins
+# (seller_id from catalog_loader dumps, username from JSON rows)
+SELLER_COLUMNS = ('seller_id', 'username')
+
+# Gig text columns indexed for search, joined in this order
+SEARCH_COLUMNS = ('title', 'desc')
+
+# Gig fields add_gigs needs in every row, and update_gig checks when given
+GIG_FIELDS = ('id', 'desc', 'price', 'star')
+GIG_FIELD_TYPES = {'id': 'set', 'desc': 'a string', 'price': 'a finite number', 'star': 'a finite number'}
+
+# Snapshot arrays that writers change in place (profiles, indexes and scoring
+# columns); a model loaded with mmap_mode='r' reads them into memory
+MUTABLE_SNAPSHOT_PREFIXES = ('profiles.', 'text.', 'search.', 'scoring.')
+
+# BM25 matches re-ranked per requested result when searching for a user
+SEARCH_RERANK_DEPTH = 5
+
+# Recommendation requests answered from the precomputed table or scored live
+TABLE_LOOKUPS = metrics.REGISTRY.counter(
+    'recommendation_table_lookups_total', 'Unfiltered recommendation requests by source', ('source',))
+
+# Attributes held in the swappable state: catalog and model writers change a
+# private copy and publish it whole, so a request reads one consistent state
+# (see _staging). Profiles and interactions are shared by consecutive states
+# and changed in place under the profile store's lock stripes.
+STATE_FIELDS = (
+    'cards', 'projects', 'gigs', 'category_mapping', 'user_profiles', 'user_interactions',
+    'snapshot_metadata', 'trending', 'item_similarity', 'als', '_cf_rows', '_als_gig_factors',
+    '_gig_index', '_category_names', '_category_matcher', '_text_index', '_search_index',
+    '_price_counts', '_price_min_heap', '_price_max_heap', '_price_bounds',
+    '_gig_columns', '_n_gig_rows', '_removed_rows', '_n_removed', '_price_sum', '_gig_category_ids', '_gig_prices',
+    '_norm_price', '_star_factor', '_mean_price', '_price_factors', '_category_rankings',
+    '_filter_index', '_recommendation_table'
+)
+
+
+def _reads_state(method):
+    """Run a method against the state current when it is called, even if a writer publishes a new one meanwhile"""
+    @functools.wraps(method)
+    def reader(self, *args, **kwargs):
+        with self._pinned():
+            return method(self, *args, **kwargs)
+    return reader
+
+
+def _writes_state(method):
+    """Run a catalog or model change on a private copy of the state and publish it when the method returns"""
+    @functools.wraps(method)
+    def writer(self, *args, **kwargs):
+        with self._staging():
+            return method(self, *args, **kwargs)
+    return writer
+
 
 class ServiceRecommender:
-    def __init__(self):
-        """Initialize the recommendation system"""
-        self.cards_df = None  # Service categories
-        self.projects_df = None  # Creator projects
-        self.gigs_df = None  # Available gigs
-        self.user_profiles = {}  # Store user profiles
+    def __init__(self, clock=time.time):
+        """
+        Initialize the recommendation system
+        
+        Parameters:
+        - clock: Function returning the current time in seconds, used to
+          decay trending scores
+        """
+        # Fields listed in STATE_FIELDS live here; the attributes below are
+        # properties reading the state this thread is bound to
+        self._state = SwappableState()
+        self._local = threading.local()  # Per thread: bound state, callbacks to run once published
+        self._catalog_lock = threading.RLock()  # Serializes catalog and model writers
+        self._index_lock = threading.RLock()  # Guards the text and search indexes, changed in place
+        
+        self.cards = None  # Service categories (ColumnTable)
+        self.projects = None  # Creator projects
+        self.gigs = None  # Available gigs
+        self.user_profiles = ProfileStore()  # Columnar user profiles
         self.user_interactions = {}  # Store user interactions
+        self.snapshot_metadata = {}  # Caller metadata of the last loaded snapshot
+        self._clock = clock
+        self.trending = TrendingTracker(clock=clock)  # Time-decayed interaction scores per gig
+        self.item_similarity = ItemSimilarity()  # Item-item neighbours from user_interactions
+        self._cf_rows = np.empty(0, dtype=np.intp)  # Model column -> gig row, -1 if not loaded
+        self.als = ImplicitALS()  # User and gig embeddings from user_interactions
+        self._als_gig_factors = np.zeros((0, DEFAULT_FACTORS))  # Gig row -> embedding (zeros if untrained)
+        self._catalog_listeners = []  # Called with changed gig ids (None = all)
+        self._recommendation_table = None  # Precomputed top-N per user (see precompute.py)
+
+        # Lookup indexes, rebuilt by load_data
+        self._gig_index = {}  # Gig id -> row position in gigs
+        self._category_names = ()  # Category id -> category name
+        self._category_matcher = None  # Compiled category title matcher
+        self._text_index = None  # Description similarity index over gig rows
+        self._search_index = None  # BM25 full-text index over gig rows
+
+        # Price normalization bounds, maintained incrementally
+        self._price_counts = Counter()  # Price -> number of live gigs
+        self._price_min_heap = []  # Candidate minimum prices (lazy deletion)
+        self._price_max_heap = []  # Negated candidate maximum prices
+        self._price_bounds = (0.0, 0.0)  # (min, max) price of live gigs
+
+        # Scoring engine state, rebuilt by load_data and updated in place by
+        # add_gigs / update_gig / remove_gigs
+        self._gig_columns = {}  # Growable per-row buffers backing the views below
+        self._n_gig_rows = 0  # Rows in gigs, including removed ones
+        self._removed_rows = np.empty(0, dtype=np.intp)  # Removed rows awaiting compaction
+        self._n_removed = 0
+        self._price_sum = 0.0  # Sum of live gig prices
+        self._gig_category_ids = None  # Category id per gig row
+        self._gig_prices = None  # Raw price per gig row
+        self._norm_price = None  # Normalized price per gig row
+        self._star_factor = None  # star / 5 per gig row
+        self._mean_price = 0.0  # Mean price of live gigs
+        self._price_factors = {}  # price_sensitivity -> price factor per gig row
+        self._category_rankings = {}  # price_sensitivity -> live gigs per category, best factor first
+        self._filter_index = None  # Category, price, rating and seller index, built on first use
+
+    def _state_view(self):
+        """Return the state this thread reads and writes: the one it is bound to, else the current one"""
+        return getattr(self._local, 'state', None) or self._state
+
+    @contextmanager
+    def _pinned(self):
+        """Bind this thread to the current state for the block (nested blocks keep the outer binding)"""
+        if getattr(self._local, 'state', None) is not None:
+            yield
+            return
+        self._local.state = self._state
+        try:
+            yield
+        finally:
+            self._local.state = None
+
+    @contextmanager
+    def _staging(self):
+        """
+        Make this thread's state changes on a private copy, published on success
+        
+        Writers are serialized; readers keep the state they started with.
+        Nested calls join the outer one. Objects the staged state shares with
+        the published one and changes in place (the text and search indexes,
+        the trending tracker and the profile store) are changed only once the
+        block has returned (see _change_shared and _publish_with), and
+        catalog notifications are held back until the copy is published. If
+        the block raises, nothing is published or changed.
+        """
+        if getattr(self._local, 'after_publish', None) is not None:
+            yield
+            return
+        with self._catalog_lock:
+            staged = self._state.copy()
+            # Writers rebind entries of these dicts rather than the dicts
+            staged._gig_columns = dict(staged._gig_columns)
+            # Price bookkeeping is changed in place; it holds one entry per
+            # distinct price, so copying it is cheap
+            staged._price_counts = Counter(staged._price_counts)
+            staged._price_min_heap = list(staged._price_min_heap)
+            staged._price_max_heap = list(staged._price_max_heap)
+            bound = getattr(self._local, 'state', None)
+            self._local.state, self._local.after_publish = staged, []
+            self._local.shared_changes, self._local.publishers = [], []
+            try:
+                yield
+                for change in self._local.shared_changes:
+                    change()
+                for publish in self._local.publishers:
+                    publish()
+                self._state = staged
+                after_publish = self._local.after_publish
+            finally:
+                self._local.state, self._local.after_publish = bound, None
+                self._local.shared_changes = self._local.publishers = None
+            for callback in after_publish:
+                callback()
+
+    def _change_shared(self, change):
+        """Run an in-place change of an object shared with the published state once the staging block has returned"""
+        self._local.shared_changes.append(change)
+
+    def _change_indexes(self, change):
+        """
+        Change the text and search indexes in place once the staging block has returned
+        
+        Parameters:
+        - change: Function (text index, search index) -> None
+        """
+        text_index, search_index = self._text_index, self._search_index
+        
+        def apply():
+            # Indexes rebuilt later in the block were fit with the change
+            if self._text_index is text_index:
+                with self._index_lock:
+                    change(text_index, search_index)
+        self._change_shared(apply)
+
+    def _publish_with(self, publish):
+        """Have a function publish the staged state (holding the locks it needs) once shared objects are changed"""
+        self._local.publishers.append(publish)
+
+    def _publish(self):
+        """Publish the state being staged before the staging block ends"""
+        self._state = self._local.state
         
+    @_writes_state
     def load_data(self, cards_data, projects_data, gigs_data):
-        """Load data from JSON into pandas DataFrames"""
-        self.cards_df = pd.DataFrame(cards_data)
-        self.projects_df = pd.DataFrame(projects_data)
-        self.gigs_df = pd.DataFrame(gigs_data)
+        """Load JSON rows (lists of dicts) or columns (dicts of arrays, see catalog_loader) into column tables"""
+        self.cards = ColumnTable.from_data(cards_data)
+        self.projects = ColumnTable.from_data(projects_data)
+        self.gigs = ColumnTable.from_data(gigs_data)
         
         # Create category mapping
         self.category_mapping = {}
-        for i, category in enumerate(self.cards_df['title']):
+        for i, category in enumerate(self.cards['title'].tolist()):
             self.category_mapping[category] = i
+        self._build_category_lookups()
             
-        # Add a category ID to gigs based on their descriptions
-        self.gigs_df['category_id'] = self._assign_categories_to_gigs()
+        # Add a category ID to gigs based on their descriptions, and
+        # normalize price for better comparison
+        prices = np.asarray(self.gigs['price'], dtype=np.float64)
+        self._fit_price_bounds(prices)
+        self.gigs = self.gigs.with_columns({
+            'category_id': self._assign_categories_to_gigs(),
+            'normalized_price': self._normalize_prices(prices)
+        })
+
+        # Precompute lookup indexes and everything the scoring path needs
+        self._build_indexes()
+        self._build_scoring_engine()
         
-        # Normalize price for better comparison
-        scaler = MinMaxScaler()
-        self.gigs_df['normalized_price'] = scaler.fit_transform(self.gigs_df[['price']])
+        self._change_shared(functools.partial(self.trending.retain, self._gig_category_id))
+        self._notify_catalog_change(None)
         
-        print(f"Loaded {len(self.cards_df)} categories, {len(self.projects_df)} projects, and {len(self.gigs_df)} gigs.")
+        # Profiles created before a reload are remapped to the new categories
+        # and rescored against the new catalog while requests go on. Profile
+        # writers are held off only to switch layouts and publish the new
+        # catalog at once, so none of them mixes the two.
+        store = self.user_profiles
+        remap = store.remap_categories(self._category_names, self._feature_vectors)
+        
+        def publish():
+            with store.frozen():
+                store.set_categories(remap)
+                self._publish()
+        self._publish_with(publish)
+        
+        logger.info("Loaded %d categories, %d projects, and %d gigs.",
+                    len(self.cards), len(self.projects), len(self.gigs))
+
+    @property
+    def cards_df(self):
+        """The category cards as a pandas DataFrame, for offline tooling (see ColumnTable.to_frame)"""
+        return None if self.cards is None else self.cards.to_frame()
+
+    @property
+    def projects_df(self):
+        """The projects as a pandas DataFrame, for offline tooling"""
+        return None if self.projects is None else self.projects.to_frame()
+
+    @property
+    def gigs_df(self):
+        """The gigs as a pandas DataFrame, for offline tooling"""
+        return None if self.gigs is None else self.gigs.to_frame()
+
+    def add_catalog_listener(self, callback):
+        """
+        Register a callback for catalog changes
+        
+        The callback receives a list of changed gig ids when only results
+        containing those gigs are affected, or None when any result may be.
+        """
+        self._catalog_listeners.append(callback)
+
+    def _notify_catalog_change(self, gig_ids):
+        # Precomputed rows may hold changed or removed gigs
+        if self._recommendation_table is not None:
+            logger.info("Catalog changed; no longer answering from %s", self._recommendation_table.path)
+            self._recommendation_table = None
+            
+        after_publish = getattr(self._local, 'after_publish', None)
+        if after_publish is not None:
+            # Listeners hear about the change once requests can see it
+            after_publish.extend(functools.partial(callback, gig_ids) for callback in self._catalog_listeners)
+            return
+        for callback in self._catalog_listeners:
+            callback(gig_ids)
+
+    def profile_version(self, user_id):
+        """Return a counter that changes whenever the user's profile changes"""
+        return self.user_profiles.version(user_id)
+
+    @_reads_state
+    def scoring_fingerprint(self):
+        """
+        Return a checksum of the scoring state shared by all users
+
+        Covers the gig scoring arrays, removed rows and gig ids and the
+        collaborative filtering and embedding models: everything a user's
+        recommendations depend on besides their own profile. Results
+        computed under the same fingerprint and profile version are equal.
+        """
+        n_gigs = self._n_gig_rows
+        columns = self._gig_columns
+        parts = [columns[name][:n_gigs] for name in ('category_id', 'price', 'normalized_price', 'star_factor')]
+        parts += [
+            self._removed_rows[:self._n_removed],
+            np.array([self._price_sum, len(self.category_mapping)], dtype=np.float64),
+            self._cf_rows,
+            self.item_similarity.neighbor_data,
+            self.item_similarity.neighbor_columns,
+            self.item_similarity.neighbor_indptr,
+            self._als_gig_factors,
+            self.als.user_factors
+        ]
+        for ids in (self.gigs['id'].tolist(), self.als.user_ids):
+            parts += encode_values(ids)[1].values()
+            
+        crc = 0
+        for part in parts:
+            part = np.ascontiguousarray(part)
+            if part.size:
+                crc = zlib.crc32(part.view(np.uint8).reshape(-1), crc)
+        return crc
+
+    @_writes_state
+    def load_recommendation_table(self, path):
+        """
+        Answer unfiltered recommendation requests from a precomputed table
+        
+        The table is used only if it was built under the current
+        scoring_fingerprint(), and only until the catalog or a model
+        changes. Users whose profile version differs from the table's are
+        scored live.
+        
+        Parameters:
+        - path: Table directory written by precompute.build_table
+        
+        Returns:
+        - True if the table is in use, False if it was built for another model
+        """
+        table = RecommendationTable(path)
+        fingerprint = self.scoring_fingerprint()
+        if table.fingerprint != fingerprint:
+            logger.warning("Recommendation table %s was built for another catalog or model (fingerprint %d, "
+                           "serving %d); ignoring it and scoring live. Rebuild it with: python "
+                           "service_recommender.py precompute", path, table.fingerprint, fingerprint)
+            self._recommendation_table = None
+            return False
+        self._recommendation_table = table
+        logger.info("Answering recommendations from %s (%d users, top %d)", path, len(table), table.n)
+        return True
         
     def _assign_categories_to_gigs(self):
         """Assign category IDs to gigs based on their descriptions"""
-        categories = []
-        
-        for _, gig in self.gigs_df.iterrows():
-            desc_lower = gig['desc'].lower()
-            assigned = False
-            
-            # Map gigs to categories based on keywords in description
-            for cat_title in self.category_mapping:
-                if cat_title.lower() in desc_lower:
-                    categories.append(self.category_mapping[cat_title])
-                    assigned = True
-                    break
-            
-            # Assign to most common category if no match found
-            if not assigned:
-                # AI Art is most common based on descriptions
-                categories.append(self.category_mapping.get('AI Artists', 0))
+        return self._assign_categories(self.gigs['desc'])
+
+    def _assign_categories(self, descriptions):
+        """
+        Assign category IDs to an iterable of gig descriptions
+
+        The first category (in category order) whose title appears in the
+        description wins; gigs matching no title go to 'AI Artists'.
+        """
+        return self._category_matcher.match(descriptions)
+
+    def _build_category_lookups(self):
+        """Build the category id -> name array and the description matcher"""
+        category_names = [None] * len(self.cards)
+        for category, category_id in self.category_mapping.items():
+            category_names[category_id] = category
+        self._category_names = tuple(category_names)
+
+        # Compile the category titles once for description matching
+        self._category_matcher = CategoryMatcher(
+            list(self.category_mapping),
+            list(self.category_mapping.values()),
+            # AI Art is most common based on descriptions
+            self.category_mapping.get('AI Artists', 0)
+        )
+
+    def _build_indexes(self):
+        """Build the gig id -> row index, text index and search index"""
+        # Keep the first row for duplicated ids, matching the old boolean scans
+        self._gig_index = {}
+        for row, gig_id in enumerate(self.gigs['id'].tolist()):
+            self._gig_index.setdefault(gig_id, row)
+        self._map_cf_columns()
+        self._map_als_rows()
+
+        self._text_index = TextIndex()
+        self._text_index.fit(self.gigs['desc'].tolist())
+        self._search_index = SearchIndex()
+        self._search_index.fit(self._search_texts(self.gigs))
+
+    @staticmethod
+    def _search_texts(table):
+        """Return the searchable text of each row of a gigs table"""
+        columns = [table[column].tolist() for column in SEARCH_COLUMNS if column in table]
+        if not columns:
+            return [''] * len(table)
+        # Missing values (None, NaN) count as empty text
+        return [' '.join('' if value is None or value != value else str(value) for value in values)
+                for values in zip(*columns)]
+
+    @staticmethod
+    def _gig_error(table, fields):
+        """
+        Return why rows of a gigs table cannot be stored, or None if they can
+        
+        Parameters:
+        - table: ColumnTable of gig rows
+        - fields: Fields checked (GIG_FIELDS or a subset), all required
+        """
+        for field in fields:
+            if field not in table:
+                return f"Gig {field} is missing"
+            for position, value in enumerate(table[field].tolist()):
+                if field == 'id':
+                    valid = value is not None and value == value
+                elif field == 'desc':
+                    valid = isinstance(value, str)
+                else:
+                    valid = (isinstance(value, (int, float)) and not isinstance(value, bool)
+                             and np.isfinite(value))
+                if not valid:
+                    return f"Gig {position}: {field} must be {GIG_FIELD_TYPES[field]}, not {value!r}"
+        return None
+
+    def _gig_row(self, gig_id):
+        """Return the row position of a gig, or None if it is not loaded"""
+        return self._gig_index.get(gig_id)
+
+    def _gig_category_id(self, gig_id):
+        """Return the category id of a loaded gig, or None"""
+        row = self._gig_index.get(gig_id)
+        return None if row is None else int(self._gig_category_ids[row])
+
+    def _category_name(self, category_id):
+        """Return the category name for a category id, or None"""
+        if 0 <= category_id < len(self._category_names):
+            return self._category_names[category_id]
+        return None
+
+    def _fit_price_bounds(self, prices):
+        """Reset the price normalization bounds from an array of prices"""
+        self._price_counts = Counter(prices.tolist())
+        self._price_min_heap = list(self._price_counts)
+        self._price_max_heap = [-price for price in self._price_counts]
+        heapq.heapify(self._price_min_heap)
+        heapq.heapify(self._price_max_heap)
+        self._price_bounds = self._current_price_bounds()
+
+    def _current_price_bounds(self):
+        """Return (min, max) of live prices, dropping stale heap entries"""
+        while self._price_min_heap and not self._price_counts[self._price_min_heap[0]]:
+            heapq.heappop(self._price_min_heap)
+        while self._price_max_heap and not self._price_counts[-self._price_max_heap[0]]:
+            heapq.heappop(self._price_max_heap)
+        if not self._price_min_heap:
+            return (0.0, 0.0)
+        return (self._price_min_heap[0], -self._price_max_heap[0])
+
+    def _add_price(self, price):
+        """Count a live price; returns True if the bounds moved"""
+        if not self._price_counts[price]:
+            heapq.heappush(self._price_min_heap, price)
+            heapq.heappush(self._price_max_heap, -price)
+        self._price_counts[price] += 1
+        return self._update_price_bounds()
+
+    def _remove_price(self, price):
+        """Uncount a live price; returns True if the bounds moved"""
+        self._price_counts[price] -= 1
+        if not self._price_counts[price]:
+            del self._price_counts[price]
+        return self._update_price_bounds()
+
+    def _update_price_bounds(self):
+        bounds = self._current_price_bounds()
+        moved = bounds != self._price_bounds
+        self._price_bounds = bounds
+        return moved
+
+    def _normalize_prices(self, prices):
+        """Min-max scale prices to [0, 1] using the current bounds"""
+        # Same arithmetic as sklearn's MinMaxScaler, so incremental updates
+        # and full loads produce identical values
+        low, high = self._price_bounds
+        price_range = high - low
+        if price_range < 10 * np.finfo(np.float64).eps:
+            price_range = 1.0
+        scale = 1.0 / price_range
+        return prices * scale + (0 - low * scale)
+
+    def _build_scoring_engine(self):
+        """Build the gig feature matrix and per-gig score factors"""
+        self._gig_columns = {
+            'category_id': np.empty(0, dtype=np.int32),
+            'price': np.empty(0, dtype=np.float64),
+            'normalized_price': np.empty(0, dtype=np.float64),
+            'star_factor': np.empty(0, dtype=np.float64),
+        }
+        self._n_gig_rows = 0
+        self._removed_rows = np.empty(0, dtype=np.intp)
+        self._n_removed = 0
+
+        prices = np.asarray(self.gigs['price'], dtype=np.float64)
+        self._price_sum = float(prices.sum())
+        self._append_gig_rows(
+            self.gigs['category_id'],
+            prices,
+            np.asarray(self.gigs['normalized_price'], dtype=np.float64),
+            np.asarray(self.gigs['star'], dtype=np.float64)
+        )
+        self._refresh_gig_views()
+
+    def _append_gig_rows(self, category_ids, prices, normalized_prices, stars):
+        """Append rows to the scoring buffers, growing them geometrically"""
+        start = self._n_gig_rows
+        end = start + len(category_ids)
+        columns = self._gig_columns
+        for name in ('category_id', 'price', 'normalized_price', 'star_factor'):
+            columns[name] = grow(columns[name], end)
+
+        columns['category_id'][start:end] = category_ids
+        columns['price'][start:end] = prices
+        columns['normalized_price'][start:end] = normalized_prices
+        columns['star_factor'][start:end] = stars / 5.0
+        self._n_gig_rows = end
+
+    def _refresh_gig_views(self):
+        """Point the scoring arrays at the live part of the buffers"""
+        n_gigs = self._n_gig_rows
+        columns = self._gig_columns
+        self._gig_category_ids = columns['category_id'][:n_gigs]
+        self._gig_prices = columns['price'][:n_gigs]
+        self._norm_price = columns['normalized_price'][:n_gigs]
+        self._star_factor = columns['star_factor'][:n_gigs]
+
+        n_live = n_gigs - self._n_removed
+        self._mean_price = self._price_sum / n_live if n_live else 0.0
+        self._price_factors = {}
+        self._category_rankings = {}
+        self._filter_index = None
+
+    def _price_factor(self, price_sensitivity):
+        """Return the cached price factor array for a price sensitivity"""
+        price_factor = self._price_factors.get(price_sensitivity)
+        if price_factor is None:
+            price_factor = 1 - self._norm_price * price_sensitivity
+            # Callers usually pass a handful of distinct values; keep it bounded
+            if len(self._price_factors) >= 16:
+                self._price_factors.clear()
+            self._price_factors[price_sensitivity] = price_factor
+        return price_factor
+
+    def _category_ranking(self, price_sensitivity):
+        """
+        Return the cached (rows, offsets, negated factors) ranking for a price sensitivity
+        
+        Live gig rows grouped by category (CSR offsets per category id), in
+        descending order of their price x rating factor within a category
+        (ties by row), next to the negated factors in the same order.
+        """
+        ranking = self._category_rankings.get(price_sensitivity)
+        if ranking is None:
+            factors = self._star_factor.copy()
+            if price_sensitivity > 0:
+                factors *= self._price_factor(price_sensitivity)
+            live = np.ones(self._n_gig_rows, dtype=bool)
+            live[self._removed_rows[:self._n_removed]] = False
+            live_rows = np.flatnonzero(live)
+            categories = self._gig_category_ids[live_rows]
+            rows = live_rows[np.lexsort((live_rows, -factors[live_rows], categories))]
+            offsets = np.zeros(len(self.category_mapping) + 1, dtype=np.intp)
+            np.cumsum(np.bincount(categories, minlength=len(self.category_mapping)), out=offsets[1:])
+            ranking = (rows, offsets, -factors[rows])
+            if len(self._category_rankings) >= 4:
+                self._category_rankings.clear()
+            self._category_rankings[price_sensitivity] = ranking
+        return ranking
+
+    def _pruned_top_rows(self, feature_vector, price_sensitivity, n, history_rows):
+        """
+        Return (gig rows, scores) of a user's top n content scores, or None
+        
+        A content score is the user's weight for the gig's category times a
+        price x rating factor of the gig, so only the best n + len(history)
+        gigs of each category the user weights can make the top n. Those are
+        scored the way _score_gigs does, giving the same result as scoring
+        the whole catalog. Returns None when that does not hold (negative
+        weights, or fewer than n positive scores) and every gig has to be
+        scored.
+        """
+        if n <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        normalized = self._normalize_features(feature_vector[None, :])[0]
+        if (normalized < 0).any():
+            return None
+        rows, offsets, negated_factors = self._category_ranking(price_sensitivity)
+        categories = np.flatnonzero(normalized > 0)
+        starts, ends = offsets[categories], offsets[categories + 1]
+        depth = n + len(history_rows)
+        for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+            if end - start > depth:
+                # Gigs clearly below the depth-th best cannot outscore it
+                cutoff = negated_factors[start + depth - 1] * (1 - RANKING_MARGIN)
+                ends[i] = start + np.searchsorted(negated_factors[start:end], cutoff, side='right')
+        candidates = np.sort(rows[concat_ranges(starts, ends)])
+        
+        scores = self._score_gigs(feature_vector, price_sensitivity, candidates)
+        if len(history_rows):
+            scores[self._score_positions(history_rows, candidates)] = -np.inf
+        top = top_k(scores, n)
+        if len(top) < n or not scores[top[-1]] > 0:
+            return None
+        return candidates[top], scores[top]
+
+    def _filters(self):
+        """Return the candidate filter index, building it after catalog changes"""
+        index = self._filter_index
+        if index is None:
+            n_gigs = self._n_gig_rows
+            live = np.ones(n_gigs, dtype=bool)
+            live[self._removed_rows[:self._n_removed]] = False
+            seller_column = next((column for column in SELLER_COLUMNS if column in self.gigs), None)
+            sellers = self.gigs[seller_column] if seller_column else [None] * n_gigs
+            index = self._filter_index = FilterIndex(
+                self._gig_category_ids, len(self.category_mapping), self._gig_prices, self._star_factor, sellers, live)
+        return index
+
+    def _candidate_rows(self, categories=None, min_price=None, max_price=None, min_star=None, exclude_sellers=None):
+        """
+        Return the live gig rows passing the recommendation filters in row
+        order, or None when no filter is set
+        """
+        if categories is None and min_price is None and max_price is None and min_star is None \
+                and not exclude_sellers:
+            return None
+        category_ids = None
+        if categories is not None:
+            # Unknown category names match no gig
+            category_ids = [self.category_mapping[name] for name in categories if name in self.category_mapping]
+        return self._filters().rows(
+            category_ids,
+            min_price,
+            max_price,
+            # Ratings are indexed as star / 5, the factor scoring uses
+            None if min_star is None else min_star / 5.0,
+            exclude_sellers
+        )
+
+    def _score_gigs(self, feature_vector, price_sensitivity, rows=None):
+        """
+        Score every gig, or only the given rows, for a user feature vector
+
+        Equivalent to cosine similarity against the one-hot gig features,
+        adjusted by price sensitivity and rating.
+        """
+        if rows is None:
+            # Same code path as batch scoring so both give bit-identical scores
+            return self._score_gigs_batch(feature_vector[None, :], price_sensitivity)[0]
+
+        # Gigs have one-hot category features, so the cosine similarity is
+        # the normalized user weight of the gig's category: a gather
+        normalized = self._normalize_features(feature_vector[None, :])[0]
+        scores = normalized[self._gig_category_ids[rows]]
+        if price_sensitivity > 0:
+            scores *= self._price_factor(price_sensitivity)[rows]
+        scores *= self._star_factor[rows]
+        return scores
+
+    def _score_gigs_batch(self, feature_matrix, price_sensitivity):
+        """
+        Score every gig for each row of a users x categories matrix
+
+        Row i of the result equals _score_gigs(feature_matrix[i]).
+        """
+        normalized = self._normalize_features(feature_matrix)
+        scores = normalized[:, self._gig_category_ids]
+        return self._adjust_scores(scores, price_sensitivity)
+
+    @staticmethod
+    def _normalize_features(feature_matrix):
+        """L2-normalize the rows of a users x categories matrix (zero rows stay zero)"""
+        feature_matrix = np.asarray(feature_matrix, dtype=np.float64)
+        norms = np.sqrt(np.einsum('ij,ij->i', feature_matrix, feature_matrix))
+        safe_norms = np.where(norms > 0, norms, 1.0)
+        return feature_matrix / safe_norms[:, None]
+
+    def _adjust_scores(self, scores, price_sensitivity):
+        """Apply the price and rating adjustments to raw similarity scores in place"""
+        # Adjust scores based on price sensitivity
+        if price_sensitivity > 0:
+            scores *= self._price_factor(price_sensitivity)
+
+        # Adjust scores based on ratings
+        scores *= self._star_factor
+
+        # Removed gigs stay in the buffers until compaction
+        if self._n_removed:
+            scores[..., self._removed_rows[:self._n_removed]] = -np.inf
+        return scores
+
+    @metrics.timed('serialization')
+    def _gig_results(self, rows, scores, score_field='recommendation_score'):
+        """
+        Build the gig detail dicts for row positions and their scores
+        
+        Returns:
+        - RecordList of gig dicts with the score under score_field; its
+          to_json() writes them from the gigs table's cached JSON
+        """
+        return RecordList(self.gigs, np.asarray(rows, dtype=np.intp).tolist(),
+                          {score_field: np.asarray(scores, dtype=np.float64).tolist()})
+        
+    @_writes_state
+    def add_gigs(self, gigs_data):
+        """
+        Add gigs to the loaded catalog without a full reload
+        
+        Parameters:
+        - gigs_data: List of gig dicts with the same fields passed to load_data
+        
+        Returns:
+        - Number of gigs added
+        
+        Raises ValueError, adding none of the gigs, if a row lacks an id,
+        a string desc or a numeric price or star.
+        """
+        if not gigs_data:
+            return 0
+            
+        # Everything derived from the rows is built before any shared state
+        # changes, so a bad row leaves the catalog as it was
+        new_gigs = ColumnTable.from_data(gigs_data)
+        error = self._gig_error(new_gigs, GIG_FIELDS)
+        if error:
+            raise ValueError(error)
+        prices = np.asarray(new_gigs['price'], dtype=np.float64)
+        stars = np.asarray(new_gigs['star'], dtype=np.float64)
+        descriptions = new_gigs['desc'].tolist()
+        search_texts = self._search_texts(new_gigs)
+        category_ids = self._assign_categories(new_gigs['desc'])
+        
+        bounds_moved = False
+        for price in prices.tolist():
+            bounds_moved |= self._add_price(price)
+        self._price_sum += float(prices.sum())
+        new_gigs = new_gigs.with_columns({
+            'category_id': category_ids,
+            'normalized_price': self._normalize_prices(prices)
+        })
+        
+        start = self._n_gig_rows
+        self.gigs = self.gigs.append(new_gigs)
+        # Requests reading the previous state must not find the new ids
+        self._gig_index = dict(self._gig_index)
+        indexed = []
+        for offset, gig_id in enumerate(new_gigs['id'].tolist()):
+            if gig_id not in self._gig_index:
+                self._gig_index[gig_id] = start + offset
+                indexed.append(gig_id)
+        self._change_indexes(lambda text_index, search_index: (
+            text_index.add(descriptions), search_index.add(search_texts)))
+            
+        self._append_gig_rows(category_ids, prices, new_gigs['normalized_price'], stars)
+        
+        # Only rescale existing gigs when the new prices widened the range
+        if bounds_moved:
+            self._rescale_prices()
+        self._refresh_gig_views()
+        self._rescore_history_owners(indexed)
+        
+        # A new gig can enter anyone's top N
+        self._notify_catalog_change(None)
+        
+        return len(new_gigs)
+        
+    @_writes_state
+    def update_gig(self, gig_id, gig_data):
+        """
+        Update fields of a loaded gig in place
+        
+        Parameters:
+        - gig_id: Gig identifier
+        - gig_data: Dict of changed fields (e.g. {'price': 45, 'desc': '...'})
+        
+        Returns:
+        - True if the gig was found and updated
+        
+        Raises ValueError, changing nothing, if a given id, desc, price or
+        star has the wrong type.
+        
+        The gig's table columns and scoring columns are copied before the
+        row changes, so requests reading the previous state keep seeing the
+        old values; only the text and search index entries change in place.
+        """
+        error = self._gig_error(ColumnTable.from_data([gig_data]),
+                                [field for field in GIG_FIELDS if field in gig_data])
+        if error:
+            raise ValueError(error)
+        row = self._gig_row(gig_id)
+        if row is None:
+            return False
+            
+        columns = self._gig_columns
+        for field, name in (('desc', 'category_id'), ('star', 'star_factor'), ('price', 'price'),
+                            ('price', 'normalized_price')):
+            if field in gig_data:
+                columns[name] = columns[name].copy()
+                
+        # category_id and normalized_price are derived below
+        changes = {field: value for field, value in gig_data.items()
+                   if field not in ('category_id', 'normalized_price')}
+            
+        # Gigs whose id or category changed count differently in histories
+        rescored = []
+        if 'id' in gig_data and gig_data['id'] != gig_id:
+            self._gig_index = dict(self._gig_index)
+            del self._gig_index[gig_id]
+            self._gig_index.setdefault(gig_data['id'], row)
+            rescored += [gig_id, gig_data['id']]
+            
+        if 'desc' in gig_data:
+            category_id = self._assign_categories([gig_data['desc']])[0]
+            if category_id != columns['category_id'][row]:
+                rescored.append(gig_data.get('id', gig_id))
+            self._change_indexes(lambda text_index, search_index: text_index.update(row, gig_data['desc']))
+            columns['category_id'][row] = category_id
+            changes['category_id'] = category_id
+            self._change_shared(functools.partial(self.trending.set_category, gig_id, int(category_id)))
+            
+        if 'star' in gig_data:
+            columns['star_factor'][row] = float(gig_data['star']) / 5.0
+            
+        if 'price' in gig_data:
+            old_price = columns['price'][row]
+            new_price = float(gig_data['price'])
+            bounds_moved = self._remove_price(old_price)
+            bounds_moved |= self._add_price(new_price)
+            self._price_sum += new_price - old_price
+            columns['price'][row] = new_price
+            
+            if bounds_moved:
+                self._rescale_prices()
+            else:
+                normalized_price = self._normalize_prices(np.array([new_price]))[0]
+                columns['normalized_price'][row] = normalized_price
+                changes['normalized_price'] = normalized_price
                 
-        return categories
+        self.gigs = self.gigs.with_values(row, changes)
+        if {'title', 'desc'} & set(gig_data):
+            search_text = self._search_texts(self.gigs.take([row]))[0]
+            self._change_indexes(lambda text_index, search_index: search_index.update(row, search_text))
+        self._refresh_gig_views()
+        self._rescore_history_owners(rescored)
+        
+        # Scoring fields can move the gig into or out of any top N; other
+        # fields only change the responses that contain it
+        if {'desc', 'price', 'star'} & set(gig_data):
+            self._notify_catalog_change(None)
+        else:
+            self._notify_catalog_change([gig_id] + ([gig_data['id']] if 'id' in gig_data else []))
+        return True
+        
+    @_writes_state
+    def remove_gigs(self, gig_ids):
+        """
+        Remove gigs from the loaded catalog without a full reload
+        
+        Removed rows are masked out of scoring immediately and dropped from
+        gigs once they make up half of it.
+        
+        Parameters:
+        - gig_ids: List of gig identifiers
+        
+        Returns:
+        - Number of gigs removed
+        """
+        rows = []
+        removed = []
+        bounds_moved = False
+        for gig_id in gig_ids:
+            row = self._gig_index.pop(gig_id, None)
+            if row is None:
+                continue
+            removed.append(gig_id)
+            price = self._gig_columns['price'][row]
+            bounds_moved |= self._remove_price(price)
+            self._price_sum -= price
+            rows.append(row)
+            
+        if not rows:
+            return 0
+            
+        self._change_shared(functools.partial(self.trending.remove, gig_ids))
+        self._change_indexes(lambda text_index, search_index: (text_index.remove(rows), search_index.remove(rows)))
+        end = self._n_removed + len(rows)
+        self._removed_rows = grow(self._removed_rows, end)
+        self._removed_rows[self._n_removed:end] = rows
+        self._n_removed = end
+        
+        if 2 * self._n_removed > self._n_gig_rows:
+            self._compact_gigs()
+        else:
+            if bounds_moved:
+                self._rescale_prices()
+            self._refresh_gig_views()
+        self._rescore_history_owners(removed)
+            
+        # Removing a gig only changes the results it appeared in, unless the
+        # price bounds moved and every score was rescaled
+        self._notify_catalog_change(None if bounds_moved else list(gig_ids))
+            
+        return len(rows)
+        
+    def _rescore_history_owners(self, gig_ids):
+        """
+        Recompute the feature vectors of users whose history holds gigs that
+        were added, removed or moved to another category, as a full
+        load_data would, and publish the staged state while their lock
+        stripes are held so none of their writes mixes the two catalogs
+        """
+        if not gig_ids:
+            return
+        
+        def publish():
+            store = self.user_profiles
+            rows = store.rows_with_history(gig_ids)
+            if not len(rows):
+                return
+            with self._writing_profiles([store.user_ids[row] for row in rows.tolist()]):
+                self._update_feature_vectors(rows)
+                self._publish()
+        self._publish_with(publish)
+        
+    def _rescale_prices(self):
+        """Renormalize every gig price after the price bounds moved"""
+        normalized = self._normalize_prices(self._gig_columns['price'][:self._n_gig_rows])
+        # A new buffer: requests reading the previous state keep the old one
+        buffer = np.empty_like(self._gig_columns['normalized_price'])
+        buffer[:self._n_gig_rows] = normalized
+        self._gig_columns['normalized_price'] = buffer
+        self.gigs = self.gigs.with_columns({'normalized_price': normalized})
+        
+    def _compact_gigs(self):
+        """Drop removed rows from gigs and rebuild the derived state"""
+        live = np.ones(self._n_gig_rows, dtype=bool)
+        live[self._removed_rows[:self._n_removed]] = False
+        gigs = self.gigs.take(np.flatnonzero(live))
+        
+        # Bounds are already current; renormalize in case they moved
+        prices = np.asarray(gigs['price'], dtype=np.float64)
+        self.gigs = gigs.with_columns({'normalized_price': self._normalize_prices(prices)})
+        self._build_indexes()
+        self._build_scoring_engine()
         
     def create_user_profile(self, user_id, name, preferences=None, history=None):
         """
@@ -62,56 +1006,99 @@ class ServiceRecommender:
         Parameters:
         - user_id: Unique identifier for the user
         - name: User's name
-        - preferences: Dict of category preferences (e.g., {'AI Artists': 0.8, 'Logo Design': 0.6})
+        - preferences: Dict of category preferences (e.g., {'AI Artists': 0.8, 'Logo Design': 0.6});
+          names of categories the catalog does not have are ignored, so
+          logged profiles replay after a category is removed (the API
+          rejects them up front)
         - history: List of previously purchased gig IDs
         """
-        if user_id not in self.user_profiles:
-            self.user_profiles[user_id] = {
-                'name': name,
-                'preferences': {},
-                'history': [],
-                'feature_vector': np.zeros(len(self.category_mapping))
-            }
+        with self._writing_profiles([user_id], [(user_id, name)]) as (store, created):
+            row = self._set_user_profile(user_id, name, preferences, history)
+            
+            # Update the feature vector
+            self._update_feature_vectors(np.array([row]))
+        
+        return store[user_id]
+        
+    @contextmanager
+    def _writing_profiles(self, user_ids, new_profiles=()):
+        """
+        Hold the lock stripes of users, bound to the state current once they are held
+        
+        Parameters:
+        - user_ids: Users whose profiles or interactions are changed
+        - new_profiles: (user id, name) pairs of profiles to create first
+          (creating may grow the store, which waits for every stripe)
+        
+        Yields:
+        - (profile store, set of user ids whose profiles were created)
+        """
+        bound = getattr(self._local, 'state', None)
+        while True:
+            state = bound or self._state
+            store = state.user_profiles
+            created = {user_id for user_id, name in new_profiles if user_id not in store}
+            for user_id, name in new_profiles:
+                store.add(user_id, name)
+            with store.locks.hold_many(user_ids):
+                # A reload published meanwhile: write against the new state
+                if bound is None and self._state is not state:
+                    continue
+                self._local.state = state
+                try:
+                    yield store, created
+                finally:
+                    self._local.state = bound
+                return
+        
+    def _set_user_profile(self, user_id, name, preferences=None, history=None):
+        """Create or update a profile without recomputing its feature vector; returns its row"""
+        row = self.user_profiles.add(user_id, name)
             
         # Update profile if new data provided
         if preferences:
-            self.user_profiles[user_id]['preferences'] = preferences
+            self.user_profiles.set_preferences(row, preferences)
             
         if history:
-            self.user_profiles[user_id]['history'] = history
+            self.user_profiles.set_history(row, history)
             
-        # Update the feature vector
-        self._update_user_feature_vector(user_id)
+        return row
         
-        return self.user_profiles[user_id]
+    def _update_feature_vectors(self, rows):
+        """
+        Recompute the feature vectors of distinct profile rows in one pass
         
-    def _update_user_feature_vector(self, user_id):
-        """Update a user's feature vector based on preferences and history"""
-        profile = self.user_profiles[user_id]
-        feature_vector = np.zeros(len(self.category_mapping))
+        The caller holds the rows' lock stripes (or the whole store).
+        """
+        self.user_profiles.set_features(rows, self._feature_vectors(rows, self.user_profiles.preference_matrix(rows)))
         
+    def _feature_vectors(self, rows, preferences):
+        """Return the feature vectors of profile rows given their preference rows"""
         # Factor in explicit preferences
-        for category, weight in profile['preferences'].items():
-            if category in self.category_mapping:
-                feature_vector[self.category_mapping[category]] = weight
+        feature_matrix = preferences.astype(np.float64)
                 
         # Factor in purchase history
-        if profile['history']:
-            for gig_id in profile['history']:
-                try:
-                    gig = self.gigs_df[self.gigs_df['id'] == gig_id].iloc[0]
-                    category_id = gig['category_id']
-                    feature_vector[category_id] += 0.5  # Increase preference based on history
-                except (IndexError, KeyError):
-                    continue
+        owners, history = self.user_profiles.history_matrix(rows)
+        if history:
+            gig_index = self._gig_index
+            gig_rows = np.array([gig_index.get(gig_id, -1) for gig_id in history], dtype=np.intp)
+            loaded = gig_rows >= 0
+            # Increase preference based on history; add.at accumulates repeats
+            np.add.at(feature_matrix, (owners[loaded], self._gig_category_ids[gig_rows[loaded]]), 0.5)
                     
-        # Normalize vector
-        if np.sum(feature_vector) > 0:
-            feature_vector = feature_vector / np.sum(feature_vector)
-            
-        self.user_profiles[user_id]['feature_vector'] = feature_vector
+        # Normalize vectors
+        sums = feature_matrix.sum(axis=1)
+        positive = sums > 0
+        feature_matrix[positive] /= sums[positive, None]
+        return feature_matrix
+
+    def _history_rows(self, history):
+        """Return the row positions of the loaded gigs in a list of gig ids"""
+        gig_index = self._gig_index
+        rows = [gig_index.get(gig_id) for gig_id in history]
+        return np.array([row for row in rows if row is not None], dtype=np.intp)
         
-    def track_interaction(self, user_id, gig_id, interaction_type='view', value=1):
+    def track_interaction(self, user_id, gig_id, interaction_type='view', value=1, timestamp=None):
         """
         Track user interactions with gigs
         
@@ -120,44 +1107,117 @@ class ServiceRecommender:
         - gig_id: Gig identifier
         - interaction_type: Type of interaction ('view', 'click', 'favorite', 'purchase')
         - value: Strength of interaction (default 1)
+        - timestamp: Time of the interaction in seconds (default: now)
         """
-        if user_id not in self.user_interactions:
-            self.user_interactions[user_id] = {}
-            
-        if gig_id not in self.user_interactions[user_id]:
-            self.user_interactions[user_id][gig_id] = {}
+        with self._writing_profiles([user_id]) as (store, created):
+            staged = {}
+            row = store.row(user_id)
+            recorded = self._record_interaction(self._state_view(), user_id, gig_id, interaction_type, value,
+                                                timestamp, row, staged)
+            self.user_interactions.update(staged)
+            if recorded:
+                # Update feature vector
+                self._update_feature_vectors(np.array([row]))
             
-        self.user_interactions[user_id][gig_id][interaction_type] = value
+    @metrics.timed('interaction_fold')
+    def track_interactions(self, events):
+        """
+        Apply a batch of interaction and profile events in order
         
-        # Update profile to reflect this interaction
-        if user_id in self.user_profiles:
-            try:
-                gig = self.gigs_df[self.gigs_df['id'] == gig_id].iloc[0]
-                category_id = gig['category_id']
-                
-                # Different interactions have different weights
-                interaction_weights = {
-                    'view': 0.1,
-                    'click': 0.3,
-                    'favorite': 0.7,
-                    'purchase': 1.0
-                }
-                
-                weight = interaction_weights.get(interaction_type, 0.1) * value
+        Each touched profile's feature vector is recomputed once at the end,
+        so the result matches applying the events one by one. The stripes of
+        every user in the batch are held throughout.
+        
+        Parameters:
+        - events: List of event dicts. Interaction events have user_id, gig_id,
+          and optional interaction_type, value and timestamp. Events with type 'profile'
+          carry user_id, name, preferences and history like create_user_profile.
+        
+        Returns:
+        - Set of user ids whose profiles were created or changed
+        """
+        # Profiles are created up front (not while holding stripes); until its
+        # profile event a created user counts as having no profile
+        new_profiles = {}
+        for event in events:
+            if event.get('type') == 'profile':
+                new_profiles.setdefault(event['user_id'], event.get('name', f"User {event['user_id']}"))
                 
-                # Update the user's preference for this category
-                category_name = next((k for k, v in self.category_mapping.items() if v == category_id), None)
-                if category_name:
-                    preferences = self.user_profiles[user_id]['preferences']
-                    preferences[category_name] = preferences.get(category_name, 0) + weight
+        user_ids = {event['user_id'] for event in events}
+        with self._writing_profiles(user_ids, new_profiles.items()) as (store, pending):
+            state = self._state_view()
+            changed = {}  # User id -> profile row
+            staged = {}  # User id -> interactions, published at the end
+            for event in events:
+                user_id = event['user_id']
+                if event.get('type') == 'profile':
+                    pending.discard(user_id)
+                    changed[user_id] = self._set_user_profile(
+                        user_id,
+                        event.get('name', f"User {user_id}"),
+                        event.get('preferences'),
+                        event.get('history')
+                    )
+                elif self._record_interaction(
+                    state,
+                    user_id,
+                    event['gig_id'],
+                    event.get('interaction_type', 'view'),
+                    event.get('value', 1),
+                    event.get('timestamp'),
+                    None if user_id in pending else store.row(user_id),
+                    staged
+                ):
+                    changed[user_id] = store.row(user_id)
                     
-                # Update feature vector
-                self._update_user_feature_vector(user_id)
-                
-            except (IndexError, KeyError):
-                pass
+            self.user_interactions.update(staged)
+            if changed:
+                self._update_feature_vectors(np.fromiter(changed.values(), dtype=np.intp, count=len(changed)))
+            
+        return set(changed)
+        
+    def _record_interaction(self, state, user_id, gig_id, interaction_type, value, timestamp, profile_row, staged):
+        """
+        Store an interaction and fold it into trending and the user's preferences
+        
+        Parameters:
+        - state: The state the caller is bound to (read directly, as this
+          runs once per event)
+        - profile_row: The user's profile row, or None if they have no profile
+        - staged: User id -> private copy of the user's interactions. The
+          caller publishes it into user_interactions, so a reader never
+          iterates a dict that is being changed.
+        
+        Returns:
+        - True if the user has a profile and the gig is loaded, i.e. the
+          feature vector needs recomputing
+        """
+        interactions = staged.get(user_id)
+        if interactions is None:
+            interactions = staged[user_id] = dict(state.user_interactions.get(user_id, ()))
+        interactions[gig_id] = {**interactions.get(gig_id, {}), interaction_type: value}
         
-    def get_user_recommendations(self, user_id, n=5, include_history=False, price_sensitivity=0.5):
+        row = state._gig_index.get(gig_id)
+        if row is None:
+            return False
+            
+        category_id = state._gig_category_ids[row]
+        weight = INTERACTION_WEIGHTS.get(interaction_type, 0.1) * value
+        state.trending.record(gig_id, weight, int(category_id), timestamp)
+        
+        # Update profile to reflect this interaction
+        if profile_row is None:
+            return False
+            
+        # Update the user's preference for this category
+        state.user_profiles.add_preference(profile_row, category_id, weight)
+            
+        return True
+        
+    @_reads_state
+    def get_user_recommendations(self, user_id, n=5, include_history=False, price_sensitivity=0.5,
+                                 cf_weight=0.0, scoring='content', categories=None, min_price=None, max_price=None,
+                                 min_star=None, exclude_sellers=None):
         """
         Get personalized recommendations for a user
         
@@ -166,56 +1226,503 @@ class ServiceRecommender:
         - n: Number of recommendations to return
         - include_history: Whether to include previously purchased gigs
         - price_sensitivity: How much to factor in price (0 to 1)
+        - cf_weight: Share of the score taken from item-item collaborative
+          filtering (0 to 1; needs build_item_similarity). At 1 only the
+          neighbours of the user's interactions are scored.
+        - scoring: 'content' (category preferences, price and rating) or
+          'als' (embedding dot products; needs build_als). Users without an
+          embedding are scored by content.
+        - categories: Category names to recommend from (default: all)
+        - min_price, max_price: Inclusive price range (default: unbounded)
+        - min_star: Lowest rating recommended (default: any)
+        - exclude_sellers: Seller ids (or usernames) whose gigs are left out
+        
+        Only the gigs passing the filters are scored, so a narrow filter
+        costs less than an unfiltered request and still fills n results
+        when enough gigs pass. Unfiltered requests are answered from the
+        precomputed table (see load_recommendation_table) when it holds the
+        user's current profile version.
         
         Returns:
         - List of recommended gig IDs
         """
-        if user_id not in self.user_profiles:
-            print(f"User {user_id} not found. Creating default profile.")
-            self.create_user_profile(user_id, f"User {user_id}")
+        self._check_scoring(scoring)
+        with metrics.stage('profile_lookup'):
+            profile = self._profile(user_id)
+        
+        with metrics.stage('filtering'):
+            candidates = self._candidate_rows(categories, min_price, max_price, min_star, exclude_sellers)
+        
+        table = self._recommendation_table
+        if candidates is None and table is not None:
+            with metrics.stage('table_lookup'):
+                found = table.lookup(
+                    user_id,
+                    profile.version,
+                    n,
+                    table_params(include_history, price_sensitivity, cf_weight, scoring)
+                )
+            TABLE_LOOKUPS.inc(('table',) if found is not None else ('live',))
+            if found is not None:
+                return self._gig_results(*found)
             
-        profile = self.user_profiles[user_id]
-        feature_vector = profile['feature_vector']
+        return self._gig_results(*self._top_rows(profile, n, include_history, price_sensitivity, cf_weight, scoring,
+                                                 candidates))
+        
+    def _profile(self, user_id):
+        """
+        Return a snapshot of a user's profile (see ProfileStore.snapshot),
+        creating a default profile for unknown users
         
-        # Create gig feature vectors (one-hot encoding of categories)
-        gig_features = np.zeros((len(self.gigs_df), len(self.category_mapping)))
-        for i, (_, gig) in enumerate(self.gigs_df.iterrows()):
-            gig_features[i, gig['category_id']] = 1
+        A profile remapped by a reload that this call's state predates is
+        laid out for other categories; the call then moves on to the new
+        state.
+        """
+        while True:
+            state = self._state_view()
+            profile = self.user_profiles.snapshot(user_id)
+            if profile is None:
+                logger.debug("User %s not found. Creating default profile.", user_id)
+                self.create_user_profile(user_id, f"User {user_id}")
+            elif profile.categories == self._category_names or state is self._state:
+                return profile
+            elif getattr(self._local, 'state', None) is not None:
+                self._local.state = self._state
+        
+    def _top_rows(self, profile, n, include_history, price_sensitivity, cf_weight, scoring, candidates=None):
+        """Score one user's profile snapshot live and return (gig rows, scores) of their top n (see get_user_recommendations)"""
+        user_id = profile.user_id
+        history = [] if include_history else profile.history
+        if cf_weight >= 1:
+            result = self._cf_top_rows(user_id, n, history, candidates)
+            if result is not None:
+                return result
+            # No interactions with modelled gigs: fall back to content scoring
+            cf_weight = 0.0
             
-        # Calculate similarity scores
-        similarity_scores = cosine_similarity([feature_vector], gig_features)[0]
+        with metrics.stage('scoring'):
+            user_factor = self.als.user_factor(user_id) if scoring == 'als' else None
+            if user_factor is not None:
+                scores = self._score_gigs_als(user_factor, candidates)
+            else:
+                scores = self._score_gigs(profile.features, price_sensitivity, candidates)
+            if cf_weight > 0:
+                self._blend_cf(user_id, scores, cf_weight, candidates)
+
+            # Filter out history if requested
+            if history:
+                scores[self._score_positions(self._history_rows(history), candidates)] = -np.inf
+
+        # Partial top-N selection instead of sorting the whole catalog
+        with metrics.stage('top_k'):
+            top = top_k(scores, n)
+        top_rows = top if candidates is None else candidates[top]
+        return top_rows, scores[top]
+
+    @_reads_state
+    def get_recommendations_batch(self, user_ids, n=5, include_history=False, price_sensitivity=0.5,
+                                  chunk_size=None, cf_weight=0.0, scoring='content'):
+        """
+        Get personalized recommendations for many users at once
         
-        # Adjust scores based on price sensitivity
-        if price_sensitivity > 0:
-            price_factor = 1 - self.gigs_df['normalized_price'].values * price_sensitivity
-            similarity_scores = similarity_scores * price_factor
+        Parameters:
+        - user_ids: List of user identifiers
+        - n: Number of recommendations to return per user
+        - include_history: Whether to include previously purchased gigs
+        - price_sensitivity: How much to factor in price (0 to 1)
+        - cf_weight: Share of the score taken from collaborative filtering
+        - scoring: 'content' or 'als' (see get_user_recommendations)
+        - chunk_size: Users scored per matrix multiply (default: sized so one
+          score block stays under BATCH_SCORE_BYTES)
+        
+        Returns:
+        - List of recommendation lists, one per user id, in the same order
+          and with the same contents as get_user_recommendations
+        """
+        return [self._gig_results(top_rows, scores) for top_rows, scores in self.iter_recommendation_rows(
+            user_ids, n, include_history, price_sensitivity, chunk_size, cf_weight, scoring)]
+        
+    def iter_recommendation_rows(self, user_ids, n=5, include_history=False, price_sensitivity=0.5,
+                                 chunk_size=None, cf_weight=0.0, scoring='content'):
+        """
+        Score users live in chunks, as get_recommendations_batch does
+        
+        Parameters are those of get_recommendations_batch.
+        
+        Users are scored from profile snapshots taken up front. The
+        generator does not bind the thread to a state; run it inside one
+        request (as get_recommendations_batch does) or while nothing
+        reloads the catalog (as the offline job does).
+        
+        Returns:
+        - Generator of (gig rows, scores) of each user's top n, in user order
+        """
+        self._check_scoring(scoring)
+        profiles = [self._profile(user_id) for user_id in user_ids]
+                
+        # Pure collaborative filtering scores each user's neighbours only
+        if cf_weight >= 1:
+            for profile in profiles:
+                yield self._top_rows(profile, n, include_history, price_sensitivity, cf_weight, scoring)
+            return
             
-        # Adjust scores based on ratings
-        similarity_scores = similarity_scores * (self.gigs_df['star'].values / 5.0)
+        # Content scores rank each category by one per-gig factor, so only
+        # the head of the categories a user weights is scored
+        if scoring == 'content' and cf_weight == 0:
+            empty = np.empty(0, dtype=np.intp)
+            for profile in profiles:
+                history = () if include_history else profile.history
+                with metrics.stage('batch_scoring'):
+                    result = self._pruned_top_rows(profile.features, price_sensitivity, n,
+                                                   self._history_rows(history) if history else empty)
+                if result is None:
+                    result = self._top_rows(profile, n, include_history, price_sensitivity, cf_weight, scoring)
+                yield result
+            return
+
+        if chunk_size is None:
+            n_gigs = max(len(self.gigs), 1)
+            chunk_size = max(1, BATCH_SCORE_BYTES // (n_gigs * 8))
+
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            chunk_profiles = profiles[start:start + chunk_size]
+            feature_matrix = np.array([profile.features for profile in chunk_profiles])
+
+            with metrics.stage('batch_scoring'):
+                if scoring == 'als':
+                    factor_rows = self.als.user_rows(chunk)
+                    trained = factor_rows >= 0
+                else:
+                    trained = np.zeros(len(chunk), dtype=bool)
+                
+                if trained.any():
+                    # Users with an embedding: one matrix-vector product each, the
+                    # same operation get_user_recommendations uses
+                    chunk_scores = np.empty((len(chunk), self._n_gig_rows))
+                    for i in np.flatnonzero(trained):
+                        chunk_scores[i] = self._score_gigs_als(self.als.user_factors[factor_rows[i]])
+                    if not trained.all():
+                        chunk_scores[~trained] = self._score_gigs_batch(feature_matrix[~trained], price_sensitivity)
+                else:
+                    # One multiply for the whole chunk
+                    chunk_scores = self._score_gigs_batch(feature_matrix, price_sensitivity)
+
+            for profile, scores in zip(chunk_profiles, chunk_scores):
+                if cf_weight > 0:
+                    self._blend_cf(profile.user_id, scores, cf_weight)
+                    
+                # Filter out history if requested
+                if not include_history and profile.history:
+                    scores[self._history_rows(profile.history)] = -np.inf
+
+                with metrics.stage('top_k'):
+                    top_rows = top_k(scores, n)
+                yield top_rows, scores[top_rows]
         
-        # Create dataframe with recommendations
-        recommendations = pd.DataFrame({
-            'gig_id': self.gigs_df['id'].values,
-            'score': similarity_scores
-        })
+    @_writes_state
+    def build_item_similarity(self, n_neighbors=DEFAULT_N_NEIGHBORS, n_workers=None):
+        """
+        Build the item-item collaborative filtering model from user_interactions
+        
+        Parameters:
+        - n_neighbors: Similar gigs kept per gig
+        - n_workers: Worker processes for large inputs (default: CPU count)
         
-        # Filter out history if requested
-        if not include_history and profile['history']:
-            recommendations = recommendations[~recommendations['gig_id'].isin(profile['history'])]
+        Returns:
+        - The fitted ItemSimilarity model
+        """
+        user_ids, user_codes, gig_ids, weights = self._interaction_triples()
+        self.item_similarity = ItemSimilarity(n_neighbors).fit(user_codes, gig_ids, weights, n_workers)
+        self._map_cf_columns()
+        logger.info("Built item similarity for %d gigs from %d user-gig pairs.", len(self.item_similarity), len(gig_ids))
+        
+        # Any blended result may change
+        self._notify_catalog_change(None)
+        return self.item_similarity
+        
+    def prepare_for_serving(self):
+        """
+        Build the models a server derives from a loaded snapshot
+        
+        Item similarity is built when there are interactions but no model.
+        The server calls this after replaying its interaction log and before
+        loading a recommendation table, and the precompute job after loading
+        the snapshot, so a table scores under the fingerprint it is served
+        under.
+        
+        Returns:
+        - True if a model was built
+        """
+        if self.user_interactions and not len(self.item_similarity):
+            self.build_item_similarity()
+            return True
+        return False
+        
+    @_writes_state
+    def build_als(self, factors=DEFAULT_FACTORS, iterations=DEFAULT_ITERATIONS, regularization=DEFAULT_REGULARIZATION,
+                  alpha=DEFAULT_ALPHA, n_threads=None, checkpoint_path=None, warm_start=True):
+        """
+        Train user and gig embeddings (implicit ALS) from user_interactions
+        
+        Parameters:
+        - factors: Embedding size
+        - iterations: Epochs to run
+        - regularization: L2 penalty on the embeddings
+        - alpha: Confidence gained per unit of interaction weight
+        - n_threads: Threads solving the epochs (default: CPU count)
+        - checkpoint_path: Snapshot directory the factors are written to
+          after every epoch; training resumes from it when it exists
+        - warm_start: Start from the current embeddings when the settings match
+        
+        Returns:
+        - The fitted ImplicitALS model
+        """
+        user_ids, user_codes, gig_ids, weights = self._interaction_triples()
+        
+        # Training rebinds the factor arrays, so a shallow copy leaves the
+        # published model untouched
+        model = copy.copy(self.als)
+        if not (warm_start and len(model) and model.factors == factors):
+            model = ImplicitALS(factors, regularization, alpha, n_threads)
+        model.regularization, model.alpha = regularization, alpha
+        if n_threads:
+            model.n_threads = n_threads
+        model.fit([user_ids[code] for code in user_codes], gig_ids, weights, iterations, checkpoint_path)
+        
+        self.als = model
+        self._map_als_rows()
+        logger.info("Trained %d-factor embeddings for %d users and %d gigs (%d epochs).",
+                    factors, len(model.user_ids), len(model.gig_ids), model.epochs)
+        
+        # Every embedding-scored result may change
+        self._notify_catalog_change(None)
+        return model
+        
+    def _interaction_triples(self):
+        """
+        Return (user ids, user codes, gig ids, weights): the users in
+        user_interactions and one entry per user-gig pair
+        """
+        # Copied first: profile writers publish new users meanwhile
+        items = list(self.user_interactions.items())
+        user_ids = [user_id for user_id, gig_interactions in items]
+        user_codes = []
+        gig_ids = []
+        weights = []
+        for user_code, (user_id, gig_interactions) in enumerate(items):
+            for gig_id, interactions in gig_interactions.items():
+                user_codes.append(user_code)
+                gig_ids.append(gig_id)
+                weights.append(self._interaction_weight(interactions))
+        return user_ids, user_codes, gig_ids, weights
+        
+    @staticmethod
+    def _interaction_weight(interactions):
+        """Total weight of a user's interactions with one gig ({type: value})"""
+        return sum(INTERACTION_WEIGHTS.get(interaction_type, 0.1) * value
+                   for interaction_type, value in interactions.items())
+        
+    def _map_cf_columns(self):
+        """Point the collaborative filtering model columns at gig rows"""
+        gig_index = self._gig_index
+        self._cf_rows = np.fromiter(
+            (gig_index.get(gig_id, -1) for gig_id in self.item_similarity.gig_ids),
+            dtype=np.intp,
+            count=len(self.item_similarity)
+        )
+        
+    def _map_als_rows(self):
+        """Lay the gig embeddings out by gig row (zeros for gigs the model has not seen)"""
+        n_gigs = len(self.gigs) if self.gigs is not None else 0
+        self._als_gig_factors = np.zeros((n_gigs, self.als.factors))
+        if len(self.als.gig_ids) and n_gigs:
+            gig_index = self._gig_index
+            rows = np.fromiter(
+                (gig_index.get(gig_id, -1) for gig_id in self.als.gig_ids),
+                dtype=np.intp,
+                count=len(self.als.gig_ids)
+            )
+            loaded = rows >= 0
+            self._als_gig_factors[rows[loaded]] = self.als.item_factors[loaded]
             
-        # Sort by score and get top N
-        recommendations = recommendations.sort_values('score', ascending=False).head(n)
+    def _score_gigs_als(self, user_factor, rows=None):
+        """
+        Score every gig, or only the given rows, for a user embedding
         
-        # Get the full gig details
-        result = []
-        for _, row in recommendations.iterrows():
-            gig_id = row['gig_id']
-            gig_data = self.gigs_df[self.gigs_df['id'] == gig_id].iloc[0].to_dict()
-            gig_data['recommendation_score'] = row['score']
-            result.append(gig_data)
-            
-        return result
+        One (gigs x factors) @ factors product; removed gigs get -inf.
+        """
+        # Gigs added since the embeddings were laid out have no embedding yet
+        missing = self._n_gig_rows - len(self._als_gig_factors)
+        if missing > 0:
+            self._als_gig_factors = np.concatenate(
+                [self._als_gig_factors, np.zeros((missing, self._als_gig_factors.shape[1]))]
+            )
+            
+        if rows is not None:
+            return self._als_gig_factors[rows] @ user_factor
+            
+        scores = self._als_gig_factors @ user_factor
+        if self._n_removed:
+            scores[self._removed_rows[:self._n_removed]] = -np.inf
+        return scores
+        
+    @staticmethod
+    def _check_scoring(scoring):
+        if scoring not in ('content', 'als'):
+            raise ValueError(f"Unknown scoring mode {scoring} (expected 'content' or 'als')")
+        
+    @metrics.timed('cf_scoring')
+    def _cf_scores(self, user_id):
+        """
+        Return (rows, scores) of the gigs similar to a user's interactions
+        
+        Scores are scaled so the best candidate scores 1. Costs
+        O(interactions x n_neighbors), independent of the catalog size.
+        """
+        interactions = self.user_interactions.get(user_id)
+        if not interactions or not len(self.item_similarity):
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+            
+        history = {gig_id: self._interaction_weight(values) for gig_id, values in interactions.items()}
+        columns, scores = self.item_similarity.score(history)
+        rows = self._cf_rows[columns]
+        loaded = rows >= 0
+        rows, scores = rows[loaded], scores[loaded]
+        if len(scores):
+            scores = scores / scores.max()
+        return rows, scores
+        
+    def _blend_cf(self, user_id, scores, cf_weight, candidates=None):
+        """Mix collaborative filtering scores into a score array (full, or over candidate rows) in place"""
+        rows, cf_scores = self._cf_scores(user_id)
+        if candidates is not None:
+            kept = np.isin(rows, candidates)
+            rows, cf_scores = self._score_positions(rows[kept], candidates), cf_scores[kept]
+        scores *= 1 - cf_weight
+        # Removed gigs stay at -inf
+        scores[rows] += cf_weight * cf_scores
+        
+    @staticmethod
+    def _score_positions(rows, candidates):
+        """
+        Map gig rows to positions in a score array over candidate rows
+        
+        Returns rows unchanged when candidates is None (a full score array);
+        otherwise the positions of the rows that are candidates.
+        """
+        if candidates is None:
+            return rows
+        if not len(candidates):
+            return np.empty(0, dtype=np.intp)
+        positions = np.minimum(np.searchsorted(candidates, rows), len(candidates) - 1)
+        return positions[candidates[positions] == rows]
+        
+    def _cf_top_rows(self, user_id, n, history, candidates=None):
+        """Rank only a user's collaborative filtering candidates: (gig rows, scores), or None if there are none"""
+        rows, scores = self._cf_scores(user_id)
+        if candidates is not None:
+            kept = np.isin(rows, candidates)
+            rows, scores = rows[kept], scores[kept]
+        if not len(rows):
+            return None
+            
+        excluded = self._removed_rows[:self._n_removed]
+        if history:
+            excluded = np.concatenate([excluded, self._history_rows(history)])
+        scores = np.where(np.isin(rows, excluded), -np.inf, scores)
+        
+        # top_k breaks ties by position, so order candidates by row first
+        order = np.argsort(rows, kind='stable')
+        rows, scores = rows[order], scores[order]
+        best = top_k(scores, n)
+        return rows[best], scores[best]
     
+    @metrics.timed('similar_gigs')
+    @_reads_state
+    def similar_gigs(self, gig_id, k=5):
+        """
+        Get gigs with the most similar descriptions ("more like this")
+        
+        Parameters:
+        - gig_id: Gig identifier
+        - k: Number of similar gigs to return
+        
+        Returns:
+        - List of gig dicts with a 'similarity_score', or None if the gig
+          is not loaded
+        """
+        row = self._gig_row(gig_id)
+        if row is None:
+            return None
+            
+        with self._index_lock:
+            rows, scores = self._text_index.similar(row, k)
+        rows, scores = self._published_rows(rows, scores)
+        
+        return self._gig_results(rows, scores, 'similarity_score')
+
+    @metrics.timed('search')
+    @_reads_state
+    def search_gigs(self, query, n=10, user_id=None, personalization=0.5, prefix=True):
+        """
+        Full-text search over gig titles and descriptions, ranked by BM25
+
+        Parameters:
+        - query: Search text
+        - n: Number of gigs to return
+        - user_id: User to personalize for (optional). The best
+          n * SEARCH_RERANK_DEPTH matches are re-ranked by the user's
+          category preferences; unknown users get plain BM25.
+        - personalization: Weight of the user's preference for a gig's
+          category (score = bm25 * (1 + personalization * affinity))
+        - prefix: Whether the last word may be incomplete (search as you type)
+
+        Returns:
+        - List of gig dicts with a 'search_score', best first
+        """
+        profile = None
+        if user_id is not None and personalization > 0 and user_id in self.user_profiles:
+            profile = self._profile(user_id)
+        depth = n * SEARCH_RERANK_DEPTH if profile is not None else n
+        with self._index_lock:
+            rows, scores = self._search_index.search(query, depth, prefix)
+        rows, scores = self._published_rows(rows, scores)
+
+        if profile is not None and len(rows):
+            affinity = self._normalize_features(profile.features[None, :])[0][self._gig_category_ids[rows]]
+            scores = scores * (1 + personalization * affinity)
+            order = np.lexsort((rows, -scores))[:n]
+            rows, scores = rows[order], scores[order]
+
+        return self._gig_results(rows, scores, 'search_score')
+
+    @_reads_state
+    def autocomplete(self, prefix, k=8):
+        """
+        Suggest indexed words starting with prefix
+
+        Returns:
+        - List of {'term', 'gigs'} dicts, the words found in most gigs first
+        """
+        with self._index_lock:
+            completions = self._search_index.complete(prefix, k)
+        return [{'term': term, 'gigs': count} for term, count in completions]
+
+    def _published_rows(self, rows, scores):
+        """
+        Drop index results for gig rows this call's state does not have
+        
+        The text and search indexes are extended in place, so gigs added by
+        a writer that has not published yet can show up.
+        """
+        kept = np.asarray(rows) < self._n_gig_rows
+        if kept.all():
+            return rows, scores
+        return np.asarray(rows)[kept], np.asarray(scores)[kept]
+
+    @metrics.timed('explain')
+    @_reads_state
     def explain_recommendation(self, user_id, gig_id):
         """
         Explain why a particular gig was recommended
@@ -230,33 +1737,28 @@ class ServiceRecommender:
         if user_id not in self.user_profiles:
             return "User profile not found."
             
-        try:
-            gig = self.gigs_df[self.gigs_df['id'] == gig_id].iloc[0]
-        except IndexError:
+        row = self._gig_row(gig_id)
+        if row is None:
             return "Gig not found."
+        gig = self.gigs.record(row)
             
-        profile = self.user_profiles[user_id]
+        profile = self._profile(user_id)
+        history = profile.history
         explanations = []
         
         # Check if matching user preference
         category_id = gig['category_id']
-        category_name = next((k for k, v in self.category_mapping.items() if v == category_id), None)
+        category_name = self._category_name(category_id)
         
-        if category_name in profile['preferences'] and profile['preferences'][category_name] > 0.3:
+        if profile.preferences[category_id] > 0.3:
             explanations.append(f"This matches your interest in {category_name}.")
             
         # Check if similar to purchase history
-        if gig_id in profile['history']:
+        if gig_id in history:
             explanations.append("You've purchased this service before.")
         else:
-            similar_gigs = []
-            for hist_gig_id in profile['history']:
-                try:
-                    hist_gig = self.gigs_df[self.gigs_df['id'] == hist_gig_id].iloc[0]
-                    if hist_gig['category_id'] == category_id:
-                        similar_gigs.append(hist_gig['desc'])
-                except IndexError:
-                    continue
+            hist_rows = self._history_rows(history)
+            similar_gigs = np.any(self._gig_category_ids[hist_rows] == category_id)
                     
             if similar_gigs:
                 explanations.append(f"This is similar to services you've purchased before.")
@@ -268,7 +1770,7 @@ class ServiceRecommender:
             explanations.append(f"This service is highly rated with {gig['star']} stars.")
             
         # Price comparison
-        avg_price = self.gigs_df['price'].mean()
+        avg_price = self._mean_price
         if gig['price'] < avg_price * 0.8:
             explanations.append(f"This is more affordable than similar services.")
         
@@ -277,108 +1779,286 @@ class ServiceRecommender:
             
         return " ".join(explanations)
 
-    def get_trending_gigs(self, n=5):
-        """Get trending gigs based on interaction data"""
-        # In a real system, this would use actual trending data
-        # Here we'll simulate it with ratings and a random factor
-        
-        trending_score = self.gigs_df['star'] * np.random.uniform(0.8, 1.2, len(self.gigs_df))
+    @metrics.timed('trending')
+    @_reads_state
+    def get_trending_gigs(self, n=5, category=None):
+        """
+        Get the gigs with the highest time-decayed interaction scores
         
-        # Create dataframe with trending scores
-        trending = pd.DataFrame({
-            'gig_id': self.gigs_df['id'].values,
-            'score': trending_score
-        })
+        Parameters:
+        - n: Number of gigs to return
+        - category: Category name to restrict the list to (default: all)
         
-        # Sort by score and get top N
-        trending = trending.sort_values('score', ascending=False).head(n)
+        Returns:
+        - List of gig dicts with a 'trending_score', highest first. When
+          fewer than n gigs have interactions, the list is filled up with
+          the best rated gigs (trending_score 0).
+        """
+        category_id = None
+        if category is not None:
+            category_id = self.category_mapping.get(category)
+            if category_id is None:
+                return self._gig_results([], [], 'trending_score')
+                
+        rows = []
+        scores = []
+        for gig_id, score in self.trending.top(n, category_id):
+            row = self._gig_row(gig_id)
+            if row is not None:
+                rows.append(row)
+                scores.append(score)
+                
+        # Cold start: fill up with the best rated gigs
+        if len(rows) < n:
+            ratings = self._star_factor.copy()
+            ratings[rows] = -np.inf
+            if self._n_removed:
+                ratings[self._removed_rows[:self._n_removed]] = -np.inf
+            if category_id is not None:
+                ratings[self._gig_category_ids != category_id] = -np.inf
+            filler = top_k(ratings, n - len(rows))
+            rows.extend(filler.tolist())
+            scores.extend([0.0] * len(filler))
         
         # Get the full gig details
-        result = []
-        for _, row in trending.iterrows():
-            gig_id = row['gig_id']
-            gig_data = self.gigs_df[self.gigs_df['id'] == gig_id].iloc[0].to_dict()
-            result.append(gig_data)
-            
-        return result
+        return self._gig_results(rows, scores, 'trending_score')
     
-    def save_model(self, filename='recommender_model.json'):
-        """Save the model data to a JSON file"""
+    def save_model(self, path='recommender_model', format=None, metadata=None):
+        """
+        Save the model
+        
+        A snapshot holds the whole model (catalog, scoring arrays, text index,
+        profiles and interactions) so load_model can skip load_data. The
+        legacy JSON format holds only profiles and interactions.
+        
+        Parameters:
+        - path: Snapshot directory, or a JSON file for the legacy format
+        - format: 'snapshot' or 'json' (default: 'json' if path ends in .json)
+        - metadata: JSON-serializable dict stored with a snapshot
+        
+        Catalog writers and profile writers wait while the model is copied.
+        """
+        if format is None:
+            format = 'json' if path.endswith('.json') else 'snapshot'
+        if format not in ('json', 'snapshot'):
+            raise ValueError(f"Unknown model format {format}")
+            
+        with self._catalog_lock, self._pinned(), self.user_profiles.frozen():
+            if format == 'json':
+                self._save_json(path)
+            else:
+                if self.gigs is None:
+                    raise ValueError("Load data before saving a snapshot")
+                with metrics.stage('snapshot_save'):
+                    arrays, state = self._snapshot_state()
+                    state['metadata'] = metadata or {}
+                    write_snapshot(path, arrays, state)
+            
+        logger.info("Model saved to %s", path)
+        
+    def _save_json(self, filename):
+        """Save profiles and interactions to a JSON file"""
         model_data = {
             'category_mapping': self.category_mapping,
-            'user_profiles': self.user_profiles,
+            'user_profiles': {
+                user_id: {
+                    'name': self.user_profiles.name(row),
+                    'preferences': self.user_profiles.preferences(row),
+                    'history': self.user_profiles.history(row)
+                }
+                for row, user_id in enumerate(self.user_profiles.user_ids)
+            },
             'user_interactions': self.user_interactions
         }
         
         with open(filename, 'w') as f:
             json.dump(model_data, f)
             
-        print(f"Model saved to {filename}")
+    def _snapshot_state(self):
+        """Return (arrays, metadata) describing the whole model"""
+        arrays = {}
+        frames = {}
+        for frame_name, table in (('cards', self.cards), ('projects', self.projects), ('gigs', self.gigs)):
+            # Numeric columns as arrays, everything else as value lists
+            for i, column in enumerate(table.names):
+                values = table[column]
+                arrays[f"{frame_name}.{i}"] = values if values.dtype.kind in 'biuf' else values.tolist()
+            frames[frame_name] = {'columns': list(table.names), 'rows': len(table)}
+            
+        n_gigs = self._n_gig_rows
+        for name in ('category_id', 'price', 'normalized_price', 'star_factor'):
+            arrays[f"scoring.{name}"] = self._gig_columns[name][:n_gigs]
+        arrays['scoring.removed_rows'] = self._removed_rows[:self._n_removed]
+        arrays['gig_index.ids'] = list(self._gig_index)
+        arrays['gig_index.rows'] = np.fromiter(self._gig_index.values(), dtype=np.int64, count=len(self._gig_index))
+        
+        text_arrays, text_scalars = self._text_index.state()
+        arrays.update({f"text.{name}": array for name, array in text_arrays.items()})
+        search_arrays, search_scalars = self._search_index.state()
+        arrays.update({f"search.{name}": array for name, array in search_arrays.items()})
+        profile_arrays, profile_scalars = self.user_profiles.state()
+        arrays.update({f"profiles.{name}": array for name, array in profile_arrays.items()})
+        
+        # Interactions flattened to one entry per (user, gig, type)
+        users, gigs, types, values = [], [], [], []
+        for user_id, gig_interactions in self.user_interactions.items():
+            for gig_id, interactions in gig_interactions.items():
+                for interaction_type, value in interactions.items():
+                    users.append(user_id)
+                    gigs.append(gig_id)
+                    types.append(interaction_type)
+                    values.append(value)
+        arrays.update({'interactions.users': users, 'interactions.gigs': gigs,
+                       'interactions.types': types, 'interactions.values': values})
+        
+        trending_ids, trending_scores, trending_categories, trending_scalars = self.trending.state()
+        arrays['trending.gig_ids'] = trending_ids
+        arrays['trending.scores'] = np.array(trending_scores, dtype=np.float64)
+        arrays['trending.categories'] = np.array(trending_categories, dtype=np.int64)
+        
+        cf_arrays, cf_scalars = self.item_similarity.state()
+        arrays.update({f"cf.{name}": array for name, array in cf_arrays.items()})
+        als_arrays, als_scalars = self.als.state()
+        arrays.update({f"als.{name}": array for name, array in als_arrays.items()})
+        
+        state = {
+            'category_mapping': self.category_mapping,
+            'frames': frames,
+            'price_sum': self._price_sum,
+            'text_index': text_scalars,
+            'search_index': search_scalars,
+            'profiles': profile_scalars,
+            'trending': trending_scalars,
+            'item_similarity': cf_scalars,
+            'als': als_scalars
+        }
+        return arrays, state
         
-    def load_model(self, filename='recommender_model.json'):
-        """Load the model data from a JSON file"""
+    def load_model(self, path='recommender_model', mmap_mode='c', verify=False):
+        """
+        Load a model saved by save_model
+        
+        Parameters:
+        - path: Snapshot directory or legacy JSON file (detected automatically)
+        - mmap_mode: How snapshot arrays are mapped (see snapshot.read_snapshot);
+          with 'r', the arrays in MUTABLE_SNAPSHOT_PREFIXES are read into
+          memory so the loaded model still takes changes
+        - verify: Whether to check snapshot checksums (reads every array)
+        
+        Returns:
+        - True on success, False if the model could not be read
+        """
         try:
-            with open(filename, 'r') as f:
-                model_data = json.load(f)
+            with self._staging():
+                if os.path.isdir(path):
+                    self._load_snapshot(path, mmap_mode, verify)
+                else:
+                    self._load_json(path)
                 
-            self.category_mapping = model_data['category_mapping']
-            self.user_profiles = model_data['user_profiles']
-            self.user_interactions = model_data['user_interactions']
-            
-            print(f"Model loaded from {filename}")
+            logger.info("Model loaded from %s", path)
             return True
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            print(f"Error loading model: {e}")
+        except (FileNotFoundError, json.JSONDecodeError, ValueError, KeyError) as e:
+            logger.error("Error loading model: %s", e)
             return False
+            
+    def _load_json(self, filename):
+        """Load profiles and interactions from a legacy JSON file"""
+        with open(filename, 'r') as f:
+            model_data = json.load(f)
+            
+        self.category_mapping = model_data['category_mapping']
+        self.user_interactions = model_data['user_interactions']
+        
+        # Feature vectors are derived, so rebuild them from the saved profiles
+        self.user_profiles = ProfileStore(sorted(self.category_mapping, key=self.category_mapping.get))
+        for user_id, profile in model_data['user_profiles'].items():
+            self._set_user_profile(user_id, profile['name'], profile.get('preferences'), profile.get('history'))
+        if len(self.user_profiles) and self._gig_category_ids is not None:
+            self._update_feature_vectors(np.arange(len(self.user_profiles)))
+            
+    @metrics.timed('snapshot_load')
+    def _load_snapshot(self, path, mmap_mode, verify):
+        """Restore the whole model from a snapshot directory"""
+        manifest, arrays = read_snapshot(path, mmap_mode=mmap_mode, verify=verify)
+        state = manifest['metadata']
+        if mmap_mode == 'r':
+            arrays = {name: np.array(value) if isinstance(value, np.ndarray) and name.startswith(MUTABLE_SNAPSHOT_PREFIXES)
+                      else value for name, value in arrays.items()}
+        
+        def prefixed(prefix):
+            return {name[len(prefix):]: value for name, value in arrays.items() if name.startswith(prefix)}
+            
+        tables = []
+        for frame_name in ('cards', 'projects', 'gigs'):
+            info = state['frames'][frame_name]
+            columns = {column: arrays[f"{frame_name}.{i}"] for i, column in enumerate(info['columns'])}
+            tables.append(ColumnTable(columns, info['rows']))
+        self.cards, self.projects, self.gigs = tables
+        
+        self.category_mapping = state['category_mapping']
+        self._build_category_lookups()
+        self._gig_index = dict(zip(arrays['gig_index.ids'], arrays['gig_index.rows'].tolist()))
+        self._text_index = TextIndex.from_state(prefixed('text.'), state['text_index'])
+        self.item_similarity = ItemSimilarity.from_state(prefixed('cf.'), state['item_similarity'])
+        self._map_cf_columns()
+        # Snapshots written before embeddings existed have no 'als' entry
+        if 'als' in state:
+            self.als = ImplicitALS.from_state(prefixed('als.'), state['als'])
+        self._map_als_rows()
+        
+        self._gig_columns = prefixed('scoring.')
+        self._removed_rows = self._gig_columns.pop('removed_rows').astype(np.intp, copy=False)
+        # Snapshots written before scoring used a gather hold the one-hot matrix
+        self._gig_columns.pop('data', None)
+        self._gig_columns.pop('indptr', None)
+        self._n_removed = len(self._removed_rows)
+        # Snapshots written before search existed are indexed on load
+        if 'search_index' in state:
+            self._search_index = SearchIndex.from_state(prefixed('search.'), state['search_index'])
+        else:
+            self._search_index = SearchIndex()
+            self._search_index.fit(self._search_texts(self.gigs))
+            self._search_index.remove(self._removed_rows.tolist())
+        self._n_gig_rows = len(self._gig_columns['category_id'])
+        self._price_sum = state['price_sum']
+        live = np.ones(self._n_gig_rows, dtype=bool)
+        live[self._removed_rows] = False
+        self._fit_price_bounds(self._gig_columns['price'][live])
+        self._refresh_gig_views()
+        
+        self.user_profiles = ProfileStore.from_state(prefixed('profiles.'), state['profiles'])
+        # Built in a local: every attribute read here goes through the state
+        user_interactions = {}
+        for user_id, gig_id, interaction_type, value in zip(
+                arrays['interactions.users'], arrays['interactions.gigs'],
+                arrays['interactions.types'], arrays['interactions.values']):
+            user_interactions.setdefault(user_id, {}).setdefault(gig_id, {})[interaction_type] = value
+        self.user_interactions = user_interactions
+        self.trending = TrendingTracker.from_state(
+            arrays['trending.gig_ids'],
+            arrays['trending.scores'].tolist(),
+            arrays['trending.categories'].tolist(),
+            state['trending'],
+            clock=self._clock
+        )
+            
+        self.snapshot_metadata = state['metadata']
+        self._notify_catalog_change(None)
 
-# Example usage
-def load_from_js_exports(js_file_path):
-    """
-    Parse JavaScript export statements to extract data
-    Note: This is a simplified approach and may need adjustments 
-    for different JS file formats
-    """
-    with open(js_file_path, 'r') as f:
-        js_content = f.read()
-    
-    # Extract the data arrays (very simplified approach)
-    # In a real system, use a proper JS parser
-    data = {}
-    
-    # Extract cards array
-    cards_start = js_content.find('export const cards = [')
-    if cards_start != -1:
-        cards_end = js_content.find('];', cards_start)
-        cards_js = js_content[cards_start:cards_end+1].replace('export const cards = ', '')
-        # Convert JS to valid JSON
-        cards_json = cards_js.replace
-        cards_json = cards_json.replace
-        data['cards'] = json.loads(cards_json)
-    
-    # Extract projects array
-    projects_start = js_content.find('export const projects = [')
-    if projects_start != -1:
-        projects_end = js_content.find('];', projects_start)
-        projects_js = js_content[projects_start:projects_end+1].replace('export const projects = ', '')
-        # Convert JS to valid JSON
-        projects_json = projects_js.replace
-        projects_json = projects_json.replace
-        data['projects'] = json.loads(projects_json)
-    
-    # Extract gigs array
-    gigs_start = js_content.find('export const gigs = [')
-    if gigs_start != -1:
-        gigs_end = js_content.find('];', gigs_start)
-        gigs_js = js_content[gigs_start:gigs_end+1].replace('export const gigs = ', '')
-        # Convert JS to valid JSON
-        gigs_json = gigs_js.replace
-        gigs_json = gigs_json.replace
-        data['gigs'] = json.loads(gigs_json)
-    
-    return data
+for _name in STATE_FIELDS:
+    setattr(ServiceRecommender, _name, state_property(_name))
+del _name
 
 # Example of how to use the recommendation system
 if __name__ == "__main__":
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    
+    # Offline job: python service_recommender.py precompute --help
+    if sys.argv[1:2] == ['precompute']:
+        from precompute import main
+        sys.exit(main(sys.argv[2:]))
+    
     # Option 1: Load data directly
     cards_data = [
         {"id": 1, "title": "AI Artists", "desc": "Add talent to AI"},
@@ -404,9 +2084,9 @@ if __name__ == "__main__":
     # Option 1: Load data directly
     recommender.load_data(cards_data, projects_data, gigs_data)
     
-    # Option 2: Load from JavaScript file
-    # data = load_from_js_exports('data.js')
-    # recommender.load_data(data['cards'], data['projects'], data['gigs'])
+    # Option 2: Stream the collections from mongoexport JSONL dumps
+    # from catalog_loader import load_catalog
+    # recommender.load_data(*load_catalog('gigs.jsonl', cards_path='cards.jsonl'))
     
     # Create a user profile
     user_id = "user123"
@@ -0,0 +1,197 @@
+"""
+Binary model snapshots
+
+A snapshot is a directory holding one .npy file per array plus
+manifest.json. The manifest records the format version, the dtype, shape
+and CRC-32 of every array, and any JSON metadata (category mapping, scalar
+state). Arrays are opened with np.load(mmap_mode=...), so loading costs
+about the same no matter how large the model is, and worker processes that
+map the same snapshot share its pages through the page cache.
+
+Saving writes every array under a new generation prefix and then atomically
+replaces manifest.json (temp file + rename), so a reader sees either the
+old snapshot or the new one, never a mix. Files of older generations are
+removed afterwards; processes that still map them keep them alive until
+they exit.
+
+Python lists of ids or names are stored as typed arrays: int64 for
+integers, float64 for floats, a UTF-8 blob with offsets for strings, and a
+JSON blob for anything else.
+"""
+import json
+import os
+import time
+import zlib
+
+import numpy as np
+
+FORMAT = 'service-recommender-snapshot'
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+
+
+def is_snapshot(path):
+    """Return True if path is a snapshot directory"""
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+
+def write_snapshot(path, arrays, metadata):
+    """
+    Atomically write a snapshot
+
+    Parameters:
+    - path: Snapshot directory (created if missing; an existing snapshot is replaced)
+    - arrays: Dict of name -> NumPy array or list of ids/names
+    - metadata: JSON-serializable dict stored in the manifest
+
+    Returns:
+    - The written manifest
+    """
+    os.makedirs(path, exist_ok=True)
+    previous = read_manifest(path) if is_snapshot(path) else None
+    generation = previous['generation'] + 1 if previous else 1
+
+    entries = {}
+    for name, value in arrays.items():
+        if isinstance(value, np.ndarray):
+            entries[name] = {'kind': 'array', 'arrays': {'': _write_array(path, generation, name, value)}}
+        else:
+            kind, parts = encode_values(value)
+            entries[name] = {
+                'kind': kind,
+                'arrays': {part: _write_array(path, generation, f"{name}.{part}", array)
+                           for part, array in parts.items()}
+            }
+
+    manifest = {
+        'format': FORMAT,
+        'version': FORMAT_VERSION,
+        'generation': generation,
+        'created': time.time(),
+        'entries': entries,
+        'metadata': metadata
+    }
+    temp_path = os.path.join(path, f"{MANIFEST}.tmp")
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, os.path.join(path, MANIFEST))
+    _fsync_directory(path)
+
+    # Drop files no longer referenced by the manifest
+    keep = {MANIFEST} | {array['file'] for entry in entries.values() for array in entry['arrays'].values()}
+    for file_name in os.listdir(path):
+        if file_name not in keep and file_name.endswith(('.npy', '.npy.tmp')):
+            os.remove(os.path.join(path, file_name))
+
+    return manifest
+
+
+def read_manifest(path):
+    """Read and validate a snapshot manifest"""
+    with open(os.path.join(path, MANIFEST), 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT:
+        raise ValueError(f"{path} is not a model snapshot")
+    if manifest.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {manifest.get('version')} (expected {FORMAT_VERSION})")
+    return manifest
+
+
+def read_snapshot(path, mmap_mode='c', verify=False):
+    """
+    Open a snapshot
+
+    Parameters:
+    - path: Snapshot directory
+    - mmap_mode: np.load mmap mode; 'c' (copy-on-write) shares pages like 'r'
+      but lets the loaded model be updated in place, None reads into memory
+    - verify: Whether to check every array against its CRC-32 (reads all data)
+
+    Returns:
+    - (manifest, dict of name -> array or decoded list)
+    """
+    manifest = read_manifest(path)
+    values = {}
+    for name, entry in manifest['entries'].items():
+        parts = {part: _read_array(path, info, mmap_mode, verify) for part, info in entry['arrays'].items()}
+        values[name] = parts[''] if entry['kind'] == 'array' else decode_values(entry['kind'], parts)
+    return manifest, values
+
+
+def encode_values(values):
+    """Return (kind, dict of arrays) for a list of ids or names"""
+    values = list(values)
+    if all(type(value) is int for value in values):
+        return 'int', {'values': np.array(values, dtype=np.int64)}
+    if all(type(value) is float for value in values):
+        return 'float', {'values': np.array(values, dtype=np.float64)}
+    if all(type(value) is str for value in values):
+        encoded = [value.encode('utf-8') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+        return 'str', {'data': np.frombuffer(b''.join(encoded), dtype=np.uint8), 'offsets': offsets}
+    data = json.dumps(values, default=_json_default).encode('utf-8')
+    return 'json', {'data': np.frombuffer(data, dtype=np.uint8)}
+
+
+def decode_values(kind, parts):
+    """Inverse of encode_values"""
+    if kind in ('int', 'float'):
+        return parts['values'].tolist()
+    if kind == 'str':
+        data = parts['data'].tobytes()
+        offsets = parts['offsets'].tolist()
+        return [data[start:end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+    if kind == 'json':
+        return json.loads(parts['data'].tobytes().decode('utf-8'))
+    raise ValueError(f"Unknown value encoding {kind}")
+
+
+def _json_default(value):
+    # NumPy scalars inside object columns
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot snapshot value of type {type(value).__name__}")
+
+
+def _write_array(path, generation, name, array):
+    """Write one array durably and return its manifest entry"""
+    array = np.ascontiguousarray(array)
+    file_name = f"{generation:06d}-{name}.npy"
+    temp_path = os.path.join(path, file_name + '.tmp')
+    with open(temp_path, 'wb') as f:
+        np.save(f, array, allow_pickle=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, os.path.join(path, file_name))
+    return {
+        'file': file_name,
+        'dtype': array.dtype.str,
+        'shape': list(array.shape),
+        'crc32': zlib.crc32(array.view(np.uint8).reshape(-1)) if array.size else 0
+    }
+
+
+def _read_array(path, info, mmap_mode, verify):
+    file_path = os.path.join(path, info['file'])
+    # Empty arrays cannot be memory-mapped
+    array = np.load(file_path, mmap_mode=mmap_mode if np.prod(info['shape']) else None, allow_pickle=False)
+    if array.dtype.str != info['dtype'] or list(array.shape) != info['shape']:
+        raise ValueError(f"Snapshot array {info['file']} does not match the manifest")
+    if verify and array.size and zlib.crc32(np.ascontiguousarray(array).view(np.uint8).reshape(-1)) != info['crc32']:
+        raise ValueError(f"Checksum mismatch in snapshot array {info['file']}")
+    return array
+
+
+def _fsync_directory(path):
+    """Persist a rename in a directory (no-op where directories cannot be opened)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
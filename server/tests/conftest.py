@@ -0,0 +1,80 @@
+"""
+Shared fixtures
+
+The server modules are imported as top-level modules (as app.py and the
+benchmarks do), so the server directory is put on sys.path.
+"""
+import importlib
+import os
+import sys
+
+import numpy as np
+import pytest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+from benchmarks import synthetic  # noqa: E402
+from service_recommender import ServiceRecommender  # noqa: E402
+
+# Size of the synthetic catalog most tests run on
+N_GIGS = 300
+N_CATEGORIES = 8
+N_USERS = 40
+
+# Server settings cleared before app.py is imported, so tests get the mock catalog
+APP_ENVIRONMENT = ('MODEL_SNAPSHOT_DIR', 'RECOMMENDATION_TABLE_DIR', 'PREFORK', 'PROFILER_ENABLED', 'ADMIN_TOKEN')
+
+
+def make_recommender(n_gigs=N_GIGS, n_users=N_USERS, seed=0, clock=lambda: 1700000000.0):
+    """Return a recommender loaded with a synthetic catalog and user profiles"""
+    recommender = ServiceRecommender(clock=clock)
+    recommender.load_data(*synthetic.make_catalog(n_gigs, N_CATEGORIES, seed))
+    for profile in synthetic.make_profiles(n_users, n_gigs, N_CATEGORIES, seed):
+        recommender.create_user_profile(**profile)
+    return recommender
+
+
+def assert_same_profile(actual, expected):
+    """Compare two profile dicts (as returned by ProfileStore[user_id])"""
+    assert {key: actual[key] for key in ('name', 'preferences', 'history')} == \
+        {key: expected[key] for key in ('name', 'preferences', 'history')}
+    np.testing.assert_allclose(actual['feature_vector'], expected['feature_vector'])
+
+
+@pytest.fixture
+def recommender():
+    return make_recommender()
+
+
+@pytest.fixture
+def load_app(tmp_path, monkeypatch):
+    """
+    Return a function importing a fresh app.py, as a server (re)start does
+
+    Every import shares one interaction log directory under tmp_path, so a
+    second call replays what the first one logged. Extra keyword arguments
+    are set as environment variables.
+    """
+    for name in APP_ENVIRONMENT:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('INTERACTION_LOG_DIR', str(tmp_path / 'interactions'))
+    monkeypatch.setenv('LOG_LEVEL', 'WARNING')
+    loaded = []
+
+    def load(**environment):
+        for name, value in environment.items():
+            monkeypatch.setenv(name, value)
+        for module in loaded:
+            module.ingestor.stop()
+            module.interaction_log.close()
+        sys.modules.pop('app', None)
+        module = importlib.import_module('app')
+        loaded.append(module)
+        return module
+
+    yield load
+    for module in loaded:
+        module.ingestor.stop()
+    sys.modules.pop('app', None)
@@ -0,0 +1,41 @@
+import pytest
+
+ADMIN_ROUTES = ['/api/model/snapshot', '/api/model/item_similarity', '/api/model/als',
+                '/api/model/recommendation_table', '/api/metrics/profiler']
+
+
+@pytest.mark.parametrize("route", ADMIN_ROUTES)
+def test_admin_routes_are_off_without_a_token(load_app, route):
+    client = load_app().app.test_client()
+    assert client.post(route, json={}).status_code == 404
+
+
+@pytest.mark.parametrize("route", ADMIN_ROUTES)
+def test_admin_routes_need_the_token(load_app, route):
+    client = load_app(ADMIN_TOKEN='secret').app.test_client()
+    assert client.post(route, json={}).status_code == 401
+    assert client.post(route, json={}, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+
+
+def test_admin_token_opens_admin_routes(load_app):
+    app = load_app(ADMIN_TOKEN='secret')
+    client = app.app.test_client()
+    headers = {'Authorization': 'Bearer secret'}
+
+    response = client.post('/api/metrics/profiler', json={"enabled": True}, headers=headers)
+    assert response.status_code == 200 and response.get_json()['running']
+    response = client.post('/api/metrics/profiler', json={"enabled": False}, headers=headers)
+    assert response.status_code == 200 and not response.get_json()['running']
+    # Unconfigured rather than unauthorized
+    assert client.post('/api/model/snapshot', headers=headers).status_code == 400
+
+
+def test_admin_routes_get_no_cors_headers(load_app):
+    client = load_app(ADMIN_TOKEN='secret').app.test_client()
+    origin = {'Origin': 'https://example.com'}
+
+    assert 'Access-Control-Allow-Origin' in client.get('/api/health', headers=origin).headers
+    for route in ADMIN_ROUTES:
+        preflight = client.options(route, headers={**origin, 'Access-Control-Request-Method': 'POST',
+                                                   'Access-Control-Request-Headers': 'Authorization'})
+        assert 'Access-Control-Allow-Origin' not in preflight.headers
@@ -0,0 +1,23 @@
+import pytest
+
+
+@pytest.mark.parametrize("n", [0, -1])
+def test_batch_with_no_recommendations_per_user(load_app, n):
+    client = load_app().app.test_client()
+    response = client.post('/api/recommendations/batch', json={"user_ids": ["user1", "user2"], "n": n})
+    assert response.status_code == 200
+    assert [user['recommendations'] for user in response.get_json()['recommendations']] == [[], []]
+
+
+@pytest.mark.parametrize("body", [
+    ["user1", "user2"],
+    {"user_ids": ["user1"], "n": "x"},
+    {"user_ids": ["user1"], "n": True},
+    {"user_ids": ["user1"], "price_sensitivity": "high"},
+    {"user_ids": ["user1"], "cf_weight": None},
+])
+def test_malformed_batch_request_is_rejected(load_app, body):
+    client = load_app().app.test_client()
+    response = client.post('/api/recommendations/batch', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
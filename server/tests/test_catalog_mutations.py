@@ -0,0 +1,149 @@
+import random
+
+import numpy as np
+import pytest
+
+from benchmarks import synthetic
+from conftest import N_CATEGORIES, N_GIGS, N_USERS, make_recommender
+
+
+def mutate(recommender, gigs, rng, steps):
+    """Apply random add/update/remove calls to a recommender and mirror them in a gig list"""
+    next_id = max(gig['id'] for gig in gigs) + 1
+    extra = synthetic.make_gigs(steps, N_CATEGORIES, seed=7)
+    for step in range(steps):
+        action = rng.random()
+        if action < 0.3:
+            added = [dict(extra[(step + i) % len(extra)], id=next_id + i) for i in range(rng.randint(1, 3))]
+            # Prices beyond the loaded range rescale every gig
+            if rng.random() < 0.2:
+                added[0]['price'] = rng.choice((1, 2000))
+            next_id += len(added)
+            recommender.add_gigs(added)
+            gigs.extend(added)
+        elif action < 0.7:
+            index = rng.randrange(len(gigs))
+            change = rng.choice([
+                {'price': rng.choice(synthetic.PRICES + [1, 3000])},
+                {'star': rng.choice(synthetic.STARS)},
+                {'desc': extra[rng.randrange(len(extra))]['desc']},
+                {'price': rng.choice(synthetic.PRICES), 'star': 4.5, 'desc': 'I will design a logo for you'},
+            ])
+            assert recommender.update_gig(gigs[index]['id'], change)
+            gigs[index] = dict(gigs[index], **change)
+        else:
+            removed = rng.sample(range(len(gigs)), min(len(gigs) - 1, rng.randint(1, 4)))
+            assert recommender.remove_gigs([gigs[index]['id'] for index in removed]) == len(removed)
+            for index in sorted(removed, reverse=True):
+                del gigs[index]
+
+
+def rebuilt(gigs):
+    """The same profiles after a full load_data of the mutated catalog, which the mutations replace"""
+    cards, projects, _ = synthetic.make_catalog(N_GIGS, N_CATEGORIES)
+    fresh = make_recommender()
+    fresh.load_data(cards, projects, gigs)
+    return fresh
+
+
+def ranked(results):
+    return [(result['id'], pytest.approx(result['recommendation_score'])) for result in results]
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_mutations_match_a_full_rebuild(seed):
+    recommender = make_recommender()
+    gigs = synthetic.make_gigs(N_GIGS, N_CATEGORIES)
+    mutate(recommender, gigs, random.Random(seed), 60)
+    fresh = rebuilt(gigs)
+
+    assert sorted(recommender._gig_index) == sorted(fresh._gig_index)
+    assert recommender._price_sum == pytest.approx(fresh._price_sum)
+    for gig in gigs:
+        assert recommender._gig_category_id(gig['id']) == fresh._gig_category_id(gig['id'])
+    for user_id in recommender.user_profiles.user_ids:
+        np.testing.assert_allclose(recommender.user_profiles[user_id]['feature_vector'],
+                                   fresh.user_profiles[user_id]['feature_vector'])
+        assert ranked(recommender.get_user_recommendations(user_id, n=20)) == \
+            ranked(fresh.get_user_recommendations(user_id, n=20))
+        assert ranked(recommender.get_user_recommendations(user_id, n=10, categories=['Logo Design'],
+                                                           max_price=100)) == \
+            ranked(fresh.get_user_recommendations(user_id, n=10, categories=['Logo Design'], max_price=100))
+
+
+def test_removing_most_gigs_compacts_and_keeps_serving():
+    recommender = make_recommender()
+    gigs = synthetic.make_gigs(N_GIGS, N_CATEGORIES)
+    removed, kept = gigs[:200], gigs[200:]
+    assert recommender.remove_gigs([gig['id'] for gig in removed]) == len(removed)
+
+    assert len(recommender.gigs) == len(kept)
+    assert recommender.remove_gigs([gig['id'] for gig in removed]) == 0
+    assert not recommender.update_gig(removed[0]['id'], {'price': 10})
+    fresh = rebuilt(kept)
+    for user_id in recommender.user_profiles.user_ids:
+        results = recommender.get_user_recommendations(user_id, n=20)
+        assert {result['id'] for result in results} <= {gig['id'] for gig in kept}
+        assert ranked(results) == ranked(fresh.get_user_recommendations(user_id, n=20))
+    assert all(result['id'] > 200 for result in recommender.search_gigs('logo design'))
+
+
+def catalog_state(recommender):
+    """Copies of the catalog, price bookkeeping and index contents of a recommender"""
+    def values(state):
+        arrays, scalars = state
+        return {name: np.asarray(array).tolist() for name, array in arrays.items()}, scalars
+
+    return {
+        'gigs': recommender.gigs.to_json(range(len(recommender.gigs))),
+        'gig_index': dict(recommender._gig_index),
+        'scoring': {name: column[:recommender._n_gig_rows].tolist()
+                    for name, column in recommender._gig_columns.items()},
+        'price_counts': dict(recommender._price_counts),
+        'price_heaps': (list(recommender._price_min_heap), list(recommender._price_max_heap)),
+        'price_bounds': recommender._price_bounds,
+        'price_sum': recommender._price_sum,
+        'text_index': values(recommender._text_index.state()),
+        'search_index': values(recommender._search_index.state()),
+        'trending': recommender.trending.state(),
+        'similar': [recommender.similar_gigs(gig_id) for gig_id in (1, 2, 3)],
+        'search': [recommender.search_gigs(query) for query in ('logo design', 'seo blog')],
+    }
+
+
+@pytest.mark.parametrize("bad", [
+    {"id": 1000, "desc": "I will design a logo", "price": 5000},
+    {"id": 1000, "desc": None, "price": 5000, "star": 5},
+    {"id": 1000, "desc": "I will design a logo", "price": "cheap", "star": 5},
+])
+def test_bad_gig_row_changes_nothing(bad):
+    recommender = make_recommender()
+    before = catalog_state(recommender)
+    good = {"id": 999, "desc": "I will write seo blog posts", "price": 1, "star": 5}
+    with pytest.raises(ValueError):
+        recommender.add_gigs([good, bad])
+    with pytest.raises(ValueError):
+        recommender.update_gig(1, {"price": 1, "desc": None})
+
+    assert catalog_state(recommender) == before
+
+
+
+def test_raising_while_staging_changes_nothing():
+    recommender = make_recommender()
+    for events in synthetic.interaction_batches(500, N_USERS, N_GIGS, batch_size=250):
+        recommender.track_interactions(events)
+    before = catalog_state(recommender)
+    features = recommender.user_profiles.state()[0]['features'].copy()
+
+    with pytest.raises(RuntimeError):
+        with recommender._staging():
+            # Every kind of in-place change: new prices moving the bounds,
+            # index and trending updates, removals and rescored histories
+            recommender.add_gigs([{"id": 1000, "desc": "I will design a logo", "price": 1, "star": 5}])
+            recommender.update_gig(1, {"price": 5000, "desc": "I will write seo blog posts"})
+            recommender.remove_gigs([2, 3, 1000])
+            raise RuntimeError
+
+    assert catalog_state(recommender) == before
+    np.testing.assert_array_equal(recommender.user_profiles.state()[0]['features'], features)
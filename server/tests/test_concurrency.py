@@ -0,0 +1,160 @@
+import random
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+from benchmarks import stress
+from benchmarks.run import _build_model
+from concurrency import DEFAULT_STRIPES, StripedLock
+from conftest import assert_same_profile, make_recommender
+from event_log import EventLog, InteractionIngestor
+
+# Model and operation list the concurrent runs are checked on
+CONFIG = {'gigs': 300, 'users': 60, 'events': 3000, 'seed': 0}
+OPERATIONS = 3000
+
+
+@pytest.fixture(autouse=True)
+def frequent_thread_switches():
+    # Switch threads far more often than the default 5 ms, so races show up in short runs
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    yield
+    sys.setswitchinterval(interval)
+
+
+@pytest.fixture(scope='module')
+def stress_setup(tmp_path_factory):
+    """Snapshot of a small model, a fixed operation list and the state its writes give serially"""
+    snapshot_dir = str(tmp_path_factory.mktemp('stress') / 'snapshot')
+    _build_model(CONFIG).save_model(snapshot_dir)
+    operations = stress.make_operations(CONFIG, OPERATIONS, random.Random(CONFIG['seed']))
+    expected = stress.final_state(stress.replay_writes(snapshot_dir, operations))
+    return snapshot_dir, operations, expected
+
+
+@pytest.mark.parametrize("threads", [2, 4])
+@pytest.mark.parametrize("catalog_writer", [False, True])
+def test_concurrent_writers_match_serial_writes(stress_setup, threads, catalog_writer):
+    snapshot_dir, operations, expected = stress_setup
+    result = stress.run_threads(snapshot_dir, operations, threads, CONFIG, catalog_writer, expected)
+
+    correctness = result['correctness']
+    assert correctness['errors'] == 0
+    assert correctness['invalid_results'] == 0
+    assert correctness['snapshot_checks'] > 0
+    assert correctness['snapshot_mismatches'] == 0
+    assert correctness['state_mismatches'] == 0
+    if catalog_writer:
+        assert correctness['catalog_changes'] > 0
+
+
+def test_writes_to_one_user_are_not_lost():
+    # Preference weights add up, so a lost or doubled write changes them
+    concurrent, serial = make_recommender(), make_recommender()
+    gig_ids = concurrent.gigs['id'].tolist()[:50]
+    for recommender in (concurrent, serial):
+        recommender.create_user_profile("hot", "Hot")
+
+    def write(recommender, thread):
+        for i, gig_id in enumerate(gig_ids):
+            if i % 2:
+                recommender.track_interaction("hot", gig_id, 'click', timestamp=1700000000.0 + thread)
+            else:
+                recommender.track_interactions([{"user_id": "hot", "gig_id": gig_id, "interaction_type": "view",
+                                                 "timestamp": 1700000000.0 + thread}])
+
+    threads = [threading.Thread(target=write, args=(concurrent, thread)) for thread in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for thread in range(4):
+        write(serial, thread)
+
+    actual, expected = concurrent.user_profiles.snapshot("hot"), serial.user_profiles.snapshot("hot")
+    np.testing.assert_allclose(actual.preferences, expected.preferences)
+    np.testing.assert_allclose(actual.features, expected.features)
+    assert stress.snapshot_consistent(concurrent, "hot")
+    assert concurrent.user_interactions["hot"] == serial.user_interactions["hot"]
+
+
+def test_striped_lock_orders_stripes():
+    locks = StripedLock(8)
+    keys = [f"user{i}" for i in range(100)]
+    assert sorted({locks.stripe(key) for key in keys}) == list(range(8))
+
+    # Overlapping multi-key holds from many threads, in opposite key orders
+    counter = np.zeros(1, dtype=np.int64)
+
+    def hold(reverse):
+        for _ in range(200):
+            with locks.hold_many(keys[::-1] if reverse else keys):
+                counter[0] += 1
+
+    threads = [threading.Thread(target=hold, args=(i % 2,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert not any(thread.is_alive() for thread in threads)
+    assert counter[0] == 800
+
+
+def test_ingestor_folds_other_users_while_one_fold_runs(tmp_path):
+    recommender = make_recommender()
+    ingestor = InteractionIngestor(recommender, EventLog(str(tmp_path)))
+    user_ids = recommender.user_profiles.user_ids
+    held = user_ids[0]
+    other = next(user_id for user_id in user_ids if hash(user_id) % DEFAULT_STRIPES != hash(held) % DEFAULT_STRIPES)
+    entered, release = threading.Event(), threading.Event()
+    track_interactions = recommender.track_interactions
+
+    def slow_for_held_user(events):
+        if events[0]['user_id'] == held:
+            entered.set()
+            release.wait(10)
+        return track_interactions(events)
+
+    recommender.track_interactions = slow_for_held_user
+    blocked = threading.Thread(target=ingestor.apply, args=([{"user_id": held, "gig_id": 3}],))
+    blocked.start()
+    assert entered.wait(10)
+    # Neither the append nor the fold waits for the other user's fold
+    ingestor.apply([{"user_id": other, "gig_id": 4, "interaction_type": "click"}])
+    assert recommender.user_interactions[other][4] == {"click": 1}
+    assert 3 not in recommender.user_interactions.get(held, {})
+    release.set()
+    blocked.join(timeout=10)
+    assert recommender.user_interactions[held][3] == {"view": 1}
+
+
+def test_concurrent_applies_fold_in_log_order(tmp_path):
+    recommender = make_recommender()
+    ingestor = InteractionIngestor(recommender, EventLog(str(tmp_path)))
+    user_ids = recommender.user_profiles.user_ids[:6]
+
+    def write(thread):
+        rng = random.Random(thread)
+        for i in range(100):
+            user_id = rng.choice(user_ids)
+            if i % 10 == 0:
+                # Profile events replace preferences, so their order matters
+                ingestor.apply([{"type": "profile", "user_id": user_id, "preferences": {"Logo Design": thread + 1}}])
+            else:
+                # Later values overwrite earlier ones for a gig and type
+                ingestor.apply([{"user_id": user_id, "gig_id": rng.randrange(1, 20), "value": thread + 1}])
+
+    threads = [threading.Thread(target=write, args=(thread,)) for thread in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    replayed = make_recommender()
+    InteractionIngestor(replayed, EventLog(str(tmp_path))).replay()
+    for user_id in user_ids:
+        assert_same_profile(recommender.user_profiles[user_id], replayed.user_profiles[user_id])
+        assert recommender.user_interactions[user_id] == replayed.user_interactions[user_id]
@@ -0,0 +1,112 @@
+import math
+
+import pytest
+
+from event_log import EventLog, InteractionIngestor, event_error
+from conftest import assert_same_profile, make_recommender
+
+
+def test_event_error_accepts_valid_events():
+    assert event_error({"user_id": "u1", "gig_id": 3}) is None
+    assert event_error({"user_id": 7, "gig_id": "g", "interaction_type": "click", "value": 2.5,
+                        "timestamp": 1700000000.0}) is None
+    assert event_error({"type": "profile", "user_id": "u1", "name": "U", "preferences": {"SEO": 1},
+                        "history": [1, "2"]}) is None
+
+
+@pytest.mark.parametrize("event", [
+    ["u1", 3],
+    {"gig_id": 3},
+    {"user_id": None, "gig_id": 3},
+    {"user_id": True, "gig_id": 3},
+    {"user_id": "u1"},
+    {"user_id": "u1", "gig_id": [3]},
+    {"user_id": "u1", "gig_id": 3, "value": "x"},
+    {"user_id": "u1", "gig_id": 3, "value": math.nan},
+    {"user_id": "u1", "gig_id": 3, "value": -5},
+    {"user_id": "u1", "gig_id": 3, "interaction_type": 1},
+    {"user_id": "u1", "gig_id": 3, "timestamp": "now"},
+    {"user_id": "u1", "gig_id": 3, "type": "purchase"},
+    {"type": "profile", "user_id": "u1", "name": 5},
+    {"type": "profile", "user_id": "u1", "preferences": {"SEO": "high"}},
+    {"type": "profile", "user_id": "u1", "preferences": ["SEO"]},
+    {"type": "profile", "user_id": "u1", "history": [{"id": 1}]},
+])
+def test_event_error_rejects_invalid_events(event):
+    assert event_error(event) is not None
+
+
+def test_invalid_events_are_not_logged(tmp_path):
+    recommender = make_recommender()
+    event_log = EventLog(str(tmp_path))
+    ingestor = InteractionIngestor(recommender, event_log)
+
+    with pytest.raises(ValueError):
+        ingestor.apply([{"user_id": "user1", "gig_id": 3}, {"user_id": "user1", "gig_id": 3, "value": "x"}])
+    with pytest.raises(ValueError):
+        ingestor.submit([{"type": "profile", "user_id": "user1", "preferences": {"SEO": "high"}}])
+
+    assert list(event_log.replay()) == []
+    assert ingestor.pending() == 0
+
+
+def test_replay_skips_invalid_events(tmp_path):
+    # A log written before events were checked
+    event_log = EventLog(str(tmp_path))
+    event_log.append([
+        {"type": "profile", "user_id": "new", "name": "New", "preferences": {"SEO": 0.5}},
+        {"user_id": "new", "gig_id": 3, "value": "x"},
+        {"type": "profile", "user_id": "bad", "preferences": {"SEO": "high"}},
+        {"user_id": "new", "gig_id": 3, "interaction_type": "purchase", "timestamp": 1700000000.0}
+    ])
+    event_log.close()
+
+    # Restart: every valid event is folded, in order
+    recommender = make_recommender()
+    expected = make_recommender()
+    expected.create_user_profile("new", "New", {"SEO": 0.5})
+    expected.track_interaction("new", 3, "purchase", timestamp=1700000000.0)
+
+    ingestor = InteractionIngestor(recommender, EventLog(str(tmp_path)))
+    assert ingestor.replay() == 4
+    assert "bad" not in recommender.user_profiles
+    assert_same_profile(recommender.user_profiles["new"], expected.user_profiles["new"])
+    assert recommender.user_interactions["new"] == {3: {"purchase": 1}}
+
+
+def test_background_worker_folds_valid_events_of_a_batch(tmp_path):
+    recommender = make_recommender()
+    event_log = EventLog(str(tmp_path))
+    ingestor = InteractionIngestor(recommender, event_log)
+    event_log.append([{"user_id": "user1", "gig_id": 3, "value": "x"}])
+    ingestor._pending.append({"user_id": "user1", "gig_id": 3, "value": "x"})
+    ingestor.submit([{"user_id": "user1", "gig_id": 4, "interaction_type": "click"}])
+    ingestor.flush()
+
+    assert recommender.user_interactions["user1"][4] == {"click": 1}
+    assert 3 not in recommender.user_interactions["user1"]
+
+
+def test_routes_reject_bad_events_and_restart_replays(load_app):
+    app = load_app()
+    client = app.app.test_client()
+
+    response = client.post('/api/track_interaction', json={"user_id": "u2", "gig_id": 3, "value": "x"})
+    assert response.status_code == 400
+    response = client.post('/api/user_profile', json={"user_id": "u2", "preferences": {"Logo Design": "high"}})
+    assert response.status_code == 400
+    response = client.post('/api/track_interaction/bulk', json={"events": [
+        {"user_id": "u2", "gig_id": 3}, {"user_id": "u2", "gig_id": 3, "value": float("inf")}]})
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Event 1:")
+
+    response = client.post('/api/user_profile', json={"user_id": "u2", "preferences": {"AI Artists": 0.7}})
+    assert response.status_code == 200
+    response = client.post('/api/track_interaction', json={"user_id": "u2", "gig_id": 3, "value": 2})
+    assert response.status_code == 200
+    profile = app.recommender.user_profiles["u2"]
+
+    restarted = load_app()
+    assert restarted.recommender is not app.recommender
+    assert_same_profile(restarted.recommender.user_profiles["u2"], profile)
+    assert restarted.recommender.user_interactions["u2"] == {3: {"view": 2}}
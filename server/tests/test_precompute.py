@@ -0,0 +1,81 @@
+import logging
+
+import numpy as np
+
+import precompute
+from benchmarks import synthetic
+from conftest import N_GIGS, N_USERS, make_recommender
+
+
+def make_snapshot(path):
+    """Save a recommender with interactions but no item similarity model, as a server would"""
+    recommender = make_recommender()
+    for events in synthetic.interaction_batches(2000, N_USERS, N_GIGS, batch_size=500):
+        recommender.track_interactions(events)
+    assert not len(recommender.item_similarity)
+    recommender.save_model(str(path))
+    return recommender
+
+
+def live_recommendations(recommender, user_ids, **params):
+    table, recommender._recommendation_table = recommender._recommendation_table, None
+    try:
+        return [recommender.get_user_recommendations(user_id, n=10, **params) for user_id in user_ids]
+    finally:
+        recommender._recommendation_table = table
+
+
+def test_table_matches_live_scoring(recommender, tmp_path):
+    precompute.build_table(recommender, str(tmp_path / 'table'), n=10, n_workers=1)
+    assert recommender.load_recommendation_table(str(tmp_path / 'table'))
+
+    user_ids = list(recommender.user_profiles.user_ids)
+    table = recommender._recommendation_table
+    params = precompute.table_params()
+    for user_id in user_ids:
+        assert table.lookup(user_id, recommender.user_profiles.snapshot(user_id).version, 10, params) is not None
+    served = [recommender.get_user_recommendations(user_id, n=10) for user_id in user_ids]
+    assert served == live_recommendations(recommender, user_ids)
+
+
+def test_table_from_cli_is_served_after_startup(tmp_path, load_app):
+    make_snapshot(tmp_path / 'model')
+    assert precompute.main(['--snapshot', str(tmp_path / 'model'), '--output', str(tmp_path / 'table'),
+                            '--n', '10', '--cf-weight', '0.3', '--workers', '1']) == 0
+
+    app = load_app(MODEL_SNAPSHOT_DIR=str(tmp_path / 'model'), RECOMMENDATION_TABLE_DIR=str(tmp_path / 'table'))
+    recommender = app.recommender
+    # The server built item similarity at startup, and the table was scored with it
+    assert len(recommender.item_similarity)
+    assert recommender._recommendation_table is not None
+
+    user_ids = list(recommender.user_profiles.user_ids)
+    served = [recommender.get_user_recommendations(user_id, n=10, cf_weight=0.3) for user_id in user_ids]
+    assert served == live_recommendations(recommender, user_ids, cf_weight=0.3)
+
+
+def test_mismatched_table_is_rejected_with_a_warning(recommender, tmp_path, caplog):
+    precompute.build_table(recommender, str(tmp_path / 'table'), n=10, n_workers=1)
+    recommender.update_gig(1, {"price": 12345})
+
+    with caplog.at_level(logging.WARNING, logger='service_recommender'):
+        assert not recommender.load_recommendation_table(str(tmp_path / 'table'))
+    assert recommender._recommendation_table is None
+    assert any('fingerprint' in record.getMessage() for record in caplog.records)
+
+
+def test_incremental_build_recomputes_changed_users(recommender, tmp_path):
+    path = str(tmp_path / 'table')
+    precompute.build_table(recommender, path, n=10, n_workers=1)
+    user_id = list(recommender.user_profiles.user_ids)[0]
+    recommender.track_interactions([{"user_id": user_id, "gig_id": 5, "interaction_type": "purchase"}])
+
+    stats = precompute.build_table(recommender, path, n=10, incremental=True, n_workers=1)
+    assert stats['computed'] == 1
+    table = precompute.RecommendationTable(path)
+    rows, scores = table.lookup(user_id, recommender.user_profiles.snapshot(user_id).version, 10,
+                                precompute.table_params())
+    live_rows, live_scores = recommender._top_rows(recommender.user_profiles.snapshot(user_id), 10,
+                                                   False, 0.5, 0.0, 'content')
+    np.testing.assert_array_equal(rows, live_rows)
+    np.testing.assert_allclose(scores, live_scores)
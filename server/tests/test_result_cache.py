@@ -0,0 +1,13 @@
+from result_cache import RecommendationCache
+
+
+def test_response_computed_across_a_catalog_change_is_not_cached():
+    cache = RecommendationCache()
+    generation = cache.catalog_generation
+    cache.invalidate_gigs([3])
+    cache.put(("user1", 5), 1, "stale", gig_ids=[3], catalog_generation=generation)
+    assert cache.get(("user1", 5), 1) is None
+
+    cache.put(("user1", 5), 1, "fresh", gig_ids=[3], catalog_generation=cache.catalog_generation)
+    assert cache.get(("user1", 5), 1) == "fresh"
+    assert cache.get(("user1", 5), 2) is None
@@ -0,0 +1,109 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+import search_index
+from search_index import B, K1, MAX_TF, SearchIndex
+from text_index import TOKEN_PATTERN
+from benchmarks import synthetic
+from service_recommender import ServiceRecommender
+
+QUERIES = ['logo design', 'wordpress ai logo design', 'custom video', 'professional seo audit', 'ai', 'zzz']
+
+
+def brute_force_scores(texts, query):
+    """BM25 of every live text (None: removed) against a query, computed directly"""
+    docs = {row: TOKEN_PATTERN.findall(text.lower()) for row, text in enumerate(texts) if text is not None}
+    average_len = sum(map(len, docs.values())) / len(docs)
+    scores = {}
+    for term in dict.fromkeys(TOKEN_PATTERN.findall(query.lower())):
+        matching = {row: words.count(term) for row, words in docs.items() if term in words}
+        idf = math.log(1 + (len(docs) - len(matching) + 0.5) / (len(matching) + 0.5))
+        for row, tf in matching.items():
+            tf = min(tf, MAX_TF)
+            norm = tf + K1 * (1 - B + B * len(docs[row]) / average_len)
+            scores[row] = scores.get(row, 0.0) + idf * tf * (K1 + 1) / norm
+    return scores
+
+
+def assert_matches_brute_force(index, texts, k=5):
+    for query in QUERIES:
+        expected = brute_force_scores(texts, query)
+        rows, scores = index.search(query, k)
+        best = sorted(expected.values(), reverse=True)[:k]
+        assert len(rows) == len(best), query
+        np.testing.assert_allclose(scores, best, rtol=1e-9, err_msg=query)
+        for row, score in zip(rows.tolist(), scores.tolist()):
+            assert math.isclose(expected[row], score, rel_tol=1e-9), query
+
+
+@pytest.mark.parametrize("delta_postings", [search_index.DELTA_POSTINGS, 50])
+def test_search_matches_brute_force_after_updates_and_removes(monkeypatch, delta_postings):
+    # A small delta merges several times along the way
+    monkeypatch.setattr(search_index, 'DELTA_POSTINGS', delta_postings)
+    texts = [gig['desc'] for gig in synthetic.make_gigs(400, 8)]
+    index = SearchIndex()
+    index.fit(texts)
+    assert_matches_brute_force(index, texts)
+
+    rng = random.Random(0)
+    replacements = [gig['desc'] for gig in synthetic.make_gigs(200, 8, seed=1)]
+    for step in range(120):
+        live = [row for row, text in enumerate(texts) if text is not None]
+        action = rng.random()
+        if action < 0.5:
+            row = rng.choice(live)
+            texts[row] = rng.choice(replacements)
+            index.update(row, texts[row])
+        elif action < 0.8:
+            rows = rng.sample(live, 3)
+            for row in rows:
+                texts[row] = None
+            index.remove(rows)
+        else:
+            added = rng.sample(replacements, 2)
+            texts.extend(added)
+            index.add(added)
+        if step % 20 == 19:
+            assert_matches_brute_force(index, texts)
+
+    assert len(index) == sum(text is not None for text in texts)
+    assert_matches_brute_force(index, texts)
+
+
+def test_document_frequency_stays_exact_after_updates():
+    index = SearchIndex()
+    index.fit(['ai logo design', 'ai art', 'wordpress site'])
+    for _ in range(5):
+        index.update(0, 'ai logo design')
+        index.update(1, 'ai art')
+    index.remove([2])
+    index.remove([2])
+
+    assert len(index) == 2
+    assert dict(index.complete('ai')) == {'ai': 2}
+    assert index.complete('wordpress') == []
+    assert (index.search('ai', 2)[1] > 0).all()
+
+
+def test_recommender_search_after_gig_updates():
+    cards = [{"id": 1, "title": "AI Artists"}, {"id": 2, "title": "Logo Design"}, {"id": 3, "title": "WordPress"}]
+    descriptions = ["I will create ai art character", "I will create ai logo design", "I will build a wordpress site",
+                    "I will design a logo design for ai", "I will do wordpress ai logo design", "custom art",
+                    "ai ai art", "logo design for brands", "wordpress theme", "ai design"]
+    recommender = ServiceRecommender()
+    recommender.load_data(cards, [], [{"id": i, "desc": desc, "price": 10 * i, "star": 4}
+                                      for i, desc in enumerate(descriptions, 1)])
+    # Repeated updates used to count each gig's words again, until IDF went negative
+    for _ in range(4):
+        for gig_id in (5, 2, 10):
+            recommender.update_gig(gig_id, {"desc": descriptions[gig_id - 1]})
+    recommender.remove_gigs([3])
+    descriptions[2] = None
+
+    results = recommender.search_gigs("wordpress ai logo design", 3, prefix=False)
+    expected = brute_force_scores(descriptions, "wordpress ai logo design")
+    best = sorted(expected, key=lambda row: (-expected[row], row))[:3]
+    assert [result["id"] for result in results] == [row + 1 for row in best]
@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from conftest import SERVER_DIR
+
+
+def test_batch_scores_match_single_user_scores(recommender):
+    user_ids = recommender.user_profiles.user_ids[:10]
+    features = np.stack([recommender.user_profiles[user_id]['feature_vector'] for user_id in user_ids])
+    batch = recommender._score_gigs_batch(features, 0.5)
+    rows = np.arange(recommender._n_gig_rows)
+    for scores, vector in zip(batch, features):
+        np.testing.assert_array_equal(scores, recommender._score_gigs(vector, 0.5))
+        np.testing.assert_array_equal(scores, recommender._score_gigs(vector, 0.5, rows=rows))
+
+
+def test_serving_from_a_snapshot_does_not_import_scipy(recommender, tmp_path):
+    recommender.track_interactions([{"user_id": f"user{i % 7}", "gig_id": i % 50 + 1} for i in range(200)])
+    recommender.build_item_similarity(n_workers=1)
+    recommender.build_als(factors=4, iterations=1)
+    recommender.save_model(str(tmp_path / 'snapshot'))
+
+    script = """
+import json, sys
+from service_recommender import ServiceRecommender
+recommender = ServiceRecommender()
+assert recommender.load_model(sys.argv[1])
+recommender.get_user_recommendations('user1', cf_weight=0.5)
+recommender.get_user_recommendations('user2', scoring='als')
+recommender.get_recommendations_batch(['user1', 'user3'])
+recommender.similar_gigs(3)
+recommender.search_gigs('logo design')
+recommender.update_gig(3, {'desc': 'I will design a modern logo'})
+recommender.add_gigs([{'id': 100000, 'desc': 'I will write a blog post', 'price': 20, 'star': 5}])
+recommender.similar_gigs(100000)
+print(json.dumps(sorted(name for name in ('scipy', 'pandas', 'sklearn') if name in sys.modules)))
+"""
+    result = subprocess.run([sys.executable, '-c', script, str(tmp_path / 'snapshot')], cwd=SERVER_DIR,
+                            env=dict(os.environ, PYTHONPATH=SERVER_DIR), capture_output=True, text=True, check=True)
+    assert json.loads(result.stdout.splitlines()[-1]) == []
@@ -0,0 +1,119 @@
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks import synthetic
+from conftest import N_GIGS, N_USERS, assert_same_profile
+from service_recommender import ServiceRecommender
+from snapshot import read_snapshot, write_snapshot
+
+
+@pytest.fixture
+def trained(recommender):
+    """A recommender with interactions, both collaborative models and incremental catalog changes"""
+    for events in synthetic.interaction_batches(2000, N_USERS, N_GIGS, batch_size=500):
+        recommender.track_interactions(events)
+    recommender.add_gigs([{"id": 1000, "desc": "I will design a modern logo for your brand", "price": 40,
+                           "star": 5, "username": "seller1"}])
+    recommender.update_gig(5, {"price": 99, "desc": "I will write search engine optimized blog posts"})
+    recommender.remove_gigs([7, 8])
+    recommender.build_item_similarity(n_workers=1)
+    recommender.build_als(factors=4, iterations=2)
+    return recommender
+
+
+def served(recommender):
+    """Everything the server answers from a loaded model"""
+    user_ids = list(recommender.user_profiles.user_ids)
+    return {
+        'content': [recommender.get_user_recommendations(user_id, n=10) for user_id in user_ids],
+        'blended': [recommender.get_user_recommendations(user_id, n=10, cf_weight=0.5) for user_id in user_ids],
+        'als': [recommender.get_user_recommendations(user_id, n=10, scoring='als') for user_id in user_ids],
+        'batch': recommender.get_recommendations_batch(user_ids[:10], n=10),
+        'filtered': recommender.get_user_recommendations(user_ids[0], n=10, categories=['Logo Design'], max_price=50),
+        'similar': [recommender.similar_gigs(gig_id) for gig_id in (1, 5, 1000)],
+        'search': [recommender.search_gigs(query) for query in ('logo design', 'seo blog', 'wordp')],
+        'trending': recommender.get_trending_gigs(n=10),
+    }
+
+
+@pytest.mark.parametrize("mmap_mode", ['c', 'r', None])
+def test_snapshot_round_trip(trained, tmp_path, mmap_mode):
+    trained.save_model(str(tmp_path / 'snapshot'), metadata={"event_log_position": 42})
+    restored = ServiceRecommender(clock=trained._clock)
+    assert restored.load_model(str(tmp_path / 'snapshot'), mmap_mode=mmap_mode, verify=True)
+
+    assert restored.snapshot_metadata['event_log_position'] == 42
+    assert restored.scoring_fingerprint() == trained.scoring_fingerprint()
+    assert restored.gigs_df.equals(trained.gigs_df)
+    assert restored.user_interactions == trained.user_interactions
+    for user_id in trained.user_profiles.user_ids:
+        assert_same_profile(restored.user_profiles[user_id], trained.user_profiles[user_id])
+    assert served(restored) == served(trained)
+
+
+@pytest.mark.parametrize("mmap_mode", ['c', 'r', None])
+def test_restored_model_takes_changes(trained, tmp_path, mmap_mode):
+    trained.save_model(str(tmp_path / 'snapshot'))
+    restored = ServiceRecommender(clock=trained._clock)
+    assert restored.load_model(str(tmp_path / 'snapshot'), mmap_mode=mmap_mode)
+    fingerprint = restored.scoring_fingerprint()
+
+    # Changes stay in memory, whichever way the snapshot was mapped
+    for model in (trained, restored):
+        model.track_interactions([{"user_id": "user1", "gig_id": 3, "interaction_type": "purchase"}])
+        model.track_interaction("user2", 4, 'click')
+        model.create_user_profile("new", "New", {"Logo Design": 0.9})
+        model.add_gigs([{"id": 1001, "desc": "I will build your wordpress site", "price": 25, "star": 4}])
+        model.update_gig(1000, {"price": 10, "desc": "I will design a minimal logo"})
+        model.remove_gigs([1])
+    assert restored.scoring_fingerprint() == trained.scoring_fingerprint()
+    assert served(restored) == served(trained)
+    unchanged = ServiceRecommender()
+    assert unchanged.load_model(str(tmp_path / 'snapshot'))
+    assert unchanged.scoring_fingerprint() == fingerprint
+
+    # And a snapshot of the changed model round-trips too
+    restored.save_model(str(tmp_path / 'snapshot'))
+    again = ServiceRecommender(clock=trained._clock)
+    assert again.load_model(str(tmp_path / 'snapshot'))
+    assert served(again) == served(trained)
+
+
+def test_corrupt_snapshot_is_refused(trained, tmp_path):
+    path = str(tmp_path / 'snapshot')
+    trained.save_model(path)
+    manifest, _ = read_snapshot(path)
+    name = manifest['entries']['scoring.price']['arrays']['']['file']
+    with open(os.path.join(path, name), 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+
+    assert not ServiceRecommender().load_model(path, verify=True)
+
+
+def test_write_snapshot_round_trips_values(tmp_path):
+    arrays = {
+        'floats': np.linspace(0, 1, 7, dtype=np.float32).reshape(7, 1),
+        'ints': [3, 1, 2],
+        'strings': ["logo", "", "café"],
+        'mixed': [1, "a", None],
+        'empty': np.empty(0, dtype=np.int64),
+    }
+    write_snapshot(str(tmp_path), arrays, {"version": 1})
+    # Rewriting replaces the previous generation
+    write_snapshot(str(tmp_path), arrays, {"version": 2})
+
+    manifest, values = read_snapshot(str(tmp_path), verify=True)
+    assert manifest['metadata'] == {"version": 2}
+    np.testing.assert_array_equal(values['floats'], arrays['floats'])
+    assert values['floats'].dtype == np.float32
+    for name in ('ints', 'strings', 'mixed'):
+        assert list(values[name]) == arrays[name]
+    assert len(values['empty']) == 0
+    assert sorted(os.listdir(tmp_path)) == sorted(['manifest.json'] + [
+        entry['file'] for value in manifest['entries'].values() for entry in value['arrays'].values()
+    ])
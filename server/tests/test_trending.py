@@ -0,0 +1,25 @@
+import pytest
+
+from trending import TrendingTracker
+
+
+def test_top_lists_keep_the_highest_scores():
+    tracker = TrendingTracker(capacity=2, clock=lambda: 1000.0)
+    for gig_id, weight, category_id in (('a', 1.0, 0), ('b', 4.0, 1), ('c', 2.0, 0), ('a', 2.5, 0), ('d', 0.5, 0)):
+        tracker.record(gig_id, weight, category_id)
+
+    assert tracker.top(2) == [('b', pytest.approx(4.0)), ('a', pytest.approx(3.5))]
+    assert tracker.top(2, category_id=0) == [('a', pytest.approx(3.5)), ('c', pytest.approx(2.0))]
+    # Longer than the kept lists: every tracked gig is ranked
+    assert [gig_id for gig_id, _ in tracker.top(4)] == ['b', 'a', 'c', 'd']
+
+
+def test_lowered_score_leaves_the_top_lists():
+    tracker = TrendingTracker(capacity=2, clock=lambda: 1000.0)
+    for gig_id, weight in (('a', 1.0), ('b', 4.0), ('c', 3.0)):
+        tracker.record(gig_id, weight, 0)
+    tracker.record('b', -6.0, 0)
+
+    assert [gig_id for gig_id, _ in tracker.top(2)] == ['c', 'a']
+    assert [gig_id for gig_id, _ in tracker.top(2, category_id=0)] == ['c', 'a']
+
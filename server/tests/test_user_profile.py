@@ -0,0 +1,30 @@
+def test_profile_with_known_categories_is_stored(load_app):
+    client = load_app().app.test_client()
+    response = client.post('/api/user_profile', json={
+        "user_id": "u1", "name": "U", "preferences": {"AI Artists": 0.8, "Logo Design": 0.5}
+    })
+    assert response.status_code == 200
+    assert response.get_json()['profile']['preferences'] == {"AI Artists": 0.8, "Logo Design": 0.5}
+
+
+def test_profile_with_unknown_categories_is_rejected(load_app):
+    app = load_app()
+    client = app.app.test_client()
+    response = client.post('/api/user_profile', json={
+        "user_id": "u1", "preferences": {"AI Artists": 0.8, "Knitting": 0.5, "Pottery": 0.1}
+    })
+    assert response.status_code == 400
+    assert response.get_json()['categories'] == ["Knitting", "Pottery"]
+    assert "u1" not in app.recommender.user_profiles
+    assert list(app.interaction_log.replay()) == []
+
+
+def test_profile_with_malformed_preferences_is_rejected(load_app):
+    app = load_app()
+    client = app.app.test_client()
+    for preferences in (None, ["AI Artists"], "AI Artists"):
+        response = client.post('/api/user_profile', json={"user_id": "u1", "preferences": preferences})
+        assert response.status_code == 400
+        assert response.get_json()['error'] == "preferences must map category names to numbers"
+    assert client.post('/api/user_profile', json=["u1"]).status_code == 400
+    assert "u1" not in app.recommender.user_profiles
@@ -0,0 +1,491 @@
+"""
+Text similarity index over gig descriptions
+
+Descriptions become L2-normalized TF-IDF vectors over hashed word unigrams
+and bigrams, so there is no vocabulary to store and no external model. An
+IVF (inverted file) index sits on top for approximate nearest neighbour
+search: spherical k-means over the vectors gives about sqrt(n) cells, each
+centroid kept sparse by truncating it to its heaviest terms, and a query
+scans only the members of its n_probe closest cells. Those candidates are
+re-ranked by exact cosine similarity.
+
+Rows are addressed by the caller's row positions (gig rows in
+ServiceRecommender). Added and edited rows are assigned to their nearest
+cell and kept in a small delta that is folded into the cell lists once it
+grows; the whole index is refitted (IDF, cells, storage) when the row count
+doubles.
+
+Queries and incremental writes use NumPy only: centroids are held as CSR
+arrays plus their transpose (each term's cells), so a row is compared with
+every cell by gathering the cell lists of its terms. Fitting multiplies
+whole sparse matrices and imports scipy on first use.
+"""
+import re
+import zlib
+
+import numpy as np
+
+from array_utils import concat_ranges, grow
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+DEFAULT_N_FEATURES = 2 ** 16
+
+# Terms kept per (sparse) cell centroid
+CENTROID_TERMS = 256
+
+# Cells scanned per query
+DEFAULT_N_PROBE = 16
+
+# k-means is trained on at most this many rows per cell
+KMEANS_SAMPLE_PER_CELL = 64
+KMEANS_ITERATIONS = 10
+
+# Rows assigned to cells at once
+ASSIGN_CHUNK_ROWS = 8192
+
+# Token -> feature cache entries kept before the cache is reset
+TOKEN_CACHE_SIZE = 1 << 20
+
+
+class TextIndex:
+    def __init__(self, n_features=DEFAULT_N_FEATURES, n_probe=DEFAULT_N_PROBE, seed=0):
+        """
+        Initialize an empty index
+
+        Parameters:
+        - n_features: Size of the hashed feature space
+        - n_probe: Cells scanned per query (more cells, higher recall)
+        - seed: Seed for the k-means initialization
+        """
+        self.n_features = n_features
+        self.n_probe = n_probe
+        self.seed = seed
+        self._token_features = {}  # Token -> hashed feature index
+        self._reset()
+
+    def _reset(self):
+        # Term storage; a row's terms live in [_row_start[row], _row_end[row])
+        self._indices = np.empty(0, dtype=np.int32)
+        self._counts = np.empty(0, dtype=np.float32)
+        self._weights = np.empty(0, dtype=np.float32)
+        self._nnz = 0
+        self._row_start = np.empty(0, dtype=np.int64)
+        self._row_end = np.empty(0, dtype=np.int64)
+        self._live = np.empty(0, dtype=bool)
+        self._cell = np.empty(0, dtype=np.int32)  # Cell of each row, -1 if not indexed
+        self._n_rows = 0
+
+        # Document frequencies over live rows
+        self._doc_freq = np.zeros(self.n_features, dtype=np.int64)
+        self._n_docs = 0
+
+        # IVF cells: rows grouped by cell, plus rows not yet folded in
+        self._set_centroids(np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int32), np.zeros(1, dtype=np.int32))
+        self._cell_offsets = np.zeros(1, dtype=np.int64)
+        self._cell_rows = np.empty(0, dtype=np.int64)
+        self._delta_rows = np.empty(0, dtype=np.int64)
+        self._n_delta = 0
+        self._fitted_rows = 0
+
+    def __len__(self):
+        return self._n_rows
+
+    def state(self):
+        """
+        Return the index as (arrays, scalars) for snapshotting
+
+        Arrays are trimmed to their used length; scalars are JSON-serializable.
+        """
+        arrays = {
+            'indices': self._indices[:self._nnz],
+            'counts': self._counts[:self._nnz],
+            'weights': self._weights[:self._nnz],
+            'row_start': self._row_start[:self._n_rows],
+            'row_end': self._row_end[:self._n_rows],
+            'live': self._live[:self._n_rows],
+            'cell': self._cell[:self._n_rows],
+            'doc_freq': self._doc_freq,
+            'centroid_data': self._centroid_data,
+            'centroid_indices': self._centroid_indices,
+            'centroid_indptr': self._centroid_indptr,
+            'cell_offsets': self._cell_offsets,
+            'cell_rows': self._cell_rows,
+            'delta_rows': self._delta_rows[:self._n_delta],
+        }
+        scalars = {
+            'n_features': self.n_features,
+            'n_probe': self.n_probe,
+            'seed': self.seed,
+            'n_docs': self._n_docs,
+            'n_cells': self._n_cells,
+            'fitted_rows': self._fitted_rows,
+        }
+        return arrays, scalars
+
+    @classmethod
+    def from_state(cls, arrays, scalars):
+        """Rebuild an index from state(); arrays may be memory-mapped"""
+        index = cls(scalars['n_features'], scalars['n_probe'], scalars['seed'])
+        index._indices = arrays['indices']
+        index._counts = arrays['counts']
+        index._weights = arrays['weights']
+        index._nnz = len(index._indices)
+        index._row_start = arrays['row_start']
+        index._row_end = arrays['row_end']
+        index._live = arrays['live']
+        index._cell = arrays['cell']
+        index._n_rows = len(index._row_start)
+        index._doc_freq = arrays['doc_freq']
+        index._n_docs = scalars['n_docs']
+        index._set_centroids(arrays['centroid_data'], arrays['centroid_indices'], arrays['centroid_indptr'])
+        index._cell_offsets = arrays['cell_offsets']
+        index._cell_rows = arrays['cell_rows']
+        index._delta_rows = arrays['delta_rows']
+        index._n_delta = len(index._delta_rows)
+        index._fitted_rows = scalars['fitted_rows']
+        return index
+
+    def fit(self, texts):
+        """Index a full list of texts; row i of the index is texts[i]"""
+        self._reset()
+        self._append(texts)
+        self._refit()
+
+    def add(self, texts):
+        """Append texts as new rows after the existing ones"""
+        start = self._n_rows
+        self._append(texts)
+        if self._n_rows > 2 * self._fitted_rows:
+            self._refit()
+            return
+        rows = np.arange(start, self._n_rows)
+        self._weigh(rows)
+        self._index(rows)
+
+    def update(self, row, text):
+        """Replace the text of an existing row"""
+        self.remove([row])
+        indices, counts, lengths = self._vectorize([text])
+        self._store_terms(np.array([row]), indices, counts, lengths)
+        self._live[row] = True
+        rows = np.array([row])
+        self._weigh(rows)
+        self._index(rows)
+
+    def remove(self, rows):
+        """Drop rows from the index; stale cell entries are filtered at query time"""
+        for row in rows:
+            if row < self._n_rows and self._live[row]:
+                terms = self._indices[self._row_start[row]:self._row_end[row]]
+                np.subtract.at(self._doc_freq, terms, 1)
+                self._n_docs -= 1
+                self._live[row] = False
+
+    def similar(self, row, k=5, n_probe=None):
+        """
+        Return the approximate k most similar rows to a row
+
+        Parameters:
+        - row: Row to find neighbours for
+        - k: Number of neighbours
+        - n_probe: Cells to scan (default: the index's n_probe)
+
+        Returns:
+        - (rows, scores) arrays, best first; the query row is excluded
+        """
+        if row >= self._n_rows or not self._live[row] or self._cell[row] < 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        n_probe = min(n_probe or self.n_probe, self._n_cells)
+        cell_scores = self._cell_similarities(np.array([row]))[0]
+        cells = np.argpartition(-cell_scores, n_probe - 1)[:n_probe]
+
+        candidates = self._cell_rows[concat_ranges(self._cell_offsets[cells], self._cell_offsets[cells + 1])]
+        delta = self._delta_rows[:self._n_delta]
+        if len(delta):
+            candidates = np.unique(np.concatenate([candidates, delta[np.isin(self._cell[delta], cells)]]))
+
+        candidates = candidates[self._live[candidates] & (candidates != row)]
+        return self._rank(row, candidates, k)
+
+    def similar_exact(self, row, k=5):
+        """Brute-force version of similar, scoring every live row"""
+        if row >= self._n_rows or not self._live[row]:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        candidates = np.flatnonzero(self._live[:self._n_rows])
+        return self._rank(row, candidates[candidates != row], k)
+
+    def _rank(self, row, candidates, k):
+        """Score candidates by exact cosine similarity and keep the top k"""
+        query = self._dense_row(row)
+        starts = self._row_start[candidates]
+        lengths = self._row_end[candidates] - starts
+        positions = concat_ranges(starts, starts + lengths)
+        segments = np.repeat(np.arange(len(candidates)), lengths)
+        scores = np.bincount(
+            segments,
+            weights=self._weights[positions] * query[self._indices[positions]],
+            minlength=len(candidates)
+        ).astype(np.float32)
+
+        # Best score first, ties by row
+        order = np.lexsort((candidates, -scores))[:k]
+        return candidates[order], scores[order]
+
+    def _dense_row(self, row):
+        """Return the TF-IDF vector of a row as a dense array"""
+        vector = np.zeros(self.n_features, dtype=np.float32)
+        terms = slice(self._row_start[row], self._row_end[row])
+        vector[self._indices[terms]] = self._weights[terms]
+        return vector
+
+    def _tokens(self, text):
+        words = TOKEN_PATTERN.findall(text.lower())
+        return words + [first + ' ' + second for first, second in zip(words, words[1:])]
+
+    def _vectorize(self, texts):
+        """Return hashed term indices, counts and per-text term counts"""
+        if len(self._token_features) > TOKEN_CACHE_SIZE:
+            self._token_features.clear()
+        token_features = self._token_features
+
+        features = []
+        lengths = []
+        for text in texts:
+            tokens = self._tokens(text)
+            for token in tokens:
+                feature = token_features.get(token)
+                if feature is None:
+                    feature = zlib.crc32(token.encode('utf-8')) % self.n_features
+                    token_features[token] = feature
+                features.append(feature)
+            lengths.append(len(tokens))
+
+        # Count (text, feature) pairs; unique keys come out sorted by text
+        docs = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        keys = docs * self.n_features + np.array(features, dtype=np.int64)
+        keys, counts = np.unique(keys, return_counts=True)
+        indices = (keys % self.n_features).astype(np.int32)
+        nnz = np.bincount(keys // self.n_features, minlength=len(lengths))
+        return indices, counts.astype(np.float32), nnz
+
+    def _append(self, texts):
+        """Store the terms of new rows and count their document frequencies"""
+        indices, counts, lengths = self._vectorize(texts)
+        start = self._n_rows
+        end = start + len(lengths)
+        self._row_start = grow(self._row_start, end)
+        self._row_end = grow(self._row_end, end)
+        self._live = grow(self._live, end)
+        self._cell = grow(self._cell, end)
+        self._n_rows = end
+        self._live[start:end] = True
+        self._cell[start:end] = -1
+        self._store_terms(np.arange(start, end), indices, counts, lengths)
+
+    def _store_terms(self, rows, indices, counts, lengths):
+        """Write term segments for rows at the end of the term storage"""
+        start = self._nnz
+        end = start + len(indices)
+        self._indices = grow(self._indices, end)
+        self._counts = grow(self._counts, end)
+        self._weights = grow(self._weights, end)
+        self._indices[start:end] = indices
+        self._counts[start:end] = counts
+        self._nnz = end
+
+        row_end = start + np.cumsum(lengths)
+        self._row_start[rows] = row_end - lengths
+        self._row_end[rows] = row_end
+
+        self._doc_freq += np.bincount(indices, minlength=self.n_features)
+        self._n_docs += len(rows)
+
+    def _idf(self, indices):
+        # Smoothed IDF, as in sklearn's TfidfTransformer
+        return (np.log((1 + self._n_docs) / (1 + self._doc_freq[indices])) + 1).astype(np.float32)
+
+    def _weigh(self, rows):
+        """Recompute the L2-normalized TF-IDF weights of rows"""
+        starts = self._row_start[rows]
+        lengths = self._row_end[rows] - starts
+        positions = concat_ranges(starts, starts + lengths)
+        weights = self._counts[positions] * self._idf(self._indices[positions])
+
+        segments = np.repeat(np.arange(len(rows)), lengths)
+        norms = np.sqrt(np.bincount(segments, weights=weights * weights, minlength=len(rows)))
+        norms[norms == 0] = 1.0
+        self._weights[positions] = weights / norms[segments].astype(np.float32)
+
+    def _set_centroids(self, data, indices, indptr):
+        """Store the centroids (CSR arrays, one row per cell) and their term -> cells lists"""
+        self._centroid_data = data
+        self._centroid_indices = indices
+        self._centroid_indptr = indptr
+        self._n_cells = len(indptr) - 1
+
+        # A term's cells are [_term_offsets[t], _term_offsets[t + 1]) of _term_cells
+        order = np.argsort(indices, kind='stable')
+        self._term_cells = np.repeat(np.arange(self._n_cells, dtype=np.int64), np.diff(indptr))[order]
+        self._term_cell_weights = data[order]
+        self._term_offsets = np.zeros(self.n_features + 1, dtype=np.int64)
+        np.cumsum(np.bincount(indices, minlength=self.n_features), out=self._term_offsets[1:])
+
+    def _cell_similarities(self, rows):
+        """Return the rows x cells similarities of rows to the centroids, from the term -> cells lists"""
+        starts = self._row_start[rows]
+        lengths = self._row_end[rows] - starts
+        positions = concat_ranges(starts, starts + lengths)
+        term_starts = self._term_offsets[self._indices[positions]]
+        counts = self._term_offsets[self._indices[positions] + 1] - term_starts
+        entries = concat_ranges(term_starts, term_starts + counts)
+
+        owners = np.repeat(np.repeat(np.arange(len(rows)), lengths), counts)
+        weights = np.repeat(self._weights[positions], counts) * self._term_cell_weights[entries]
+        similarities = np.bincount(owners * self._n_cells + self._term_cells[entries], weights=weights,
+                                   minlength=len(rows) * self._n_cells)
+        return similarities.reshape(len(rows), self._n_cells)
+
+    def _row_matrix(self, rows):
+        """Return the TF-IDF vectors of rows as a CSR matrix"""
+        from scipy import sparse
+
+        starts = self._row_start[rows]
+        lengths = self._row_end[rows] - starts
+        positions = concat_ranges(starts, starts + lengths)
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        return sparse.csr_matrix(
+            (self._weights[positions], self._indices[positions], indptr),
+            shape=(len(rows), self.n_features)
+        )
+
+    def _nearest(self, rows):
+        """Return the index of the most similar centroid for each of a few rows (NumPy only)"""
+        nearest = np.empty(len(rows), dtype=np.int32)
+        for start in range(0, len(rows), ASSIGN_CHUNK_ROWS):
+            chunk = rows[start:start + ASSIGN_CHUNK_ROWS]
+            nearest[start:start + len(chunk)] = np.argmax(self._cell_similarities(chunk), axis=1)
+        return nearest
+
+    def _nearest_bulk(self, rows, centroid_terms):
+        """
+        Return the index of the most similar centroid for each row, with
+        sparse matrix products (faster than _nearest for many rows)
+
+        centroid_terms is the centroid matrix transposed to terms x cells.
+        """
+        nearest = np.empty(len(rows), dtype=np.int32)
+        for start in range(0, len(rows), ASSIGN_CHUNK_ROWS):
+            chunk = rows[start:start + ASSIGN_CHUNK_ROWS]
+            similarities = (self._row_matrix(chunk) @ centroid_terms).toarray()
+            nearest[start:start + len(chunk)] = np.argmax(similarities, axis=1)
+        return nearest
+
+    def _kmeans(self, sample, n_cells, rng):
+        """Spherical k-means over sample rows; returns sparse unit-norm centroids"""
+        from scipy import sparse
+
+        vectors = self._row_matrix(sample)
+        centroids = vectors[rng.choice(len(sample), n_cells, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = self._nearest_bulk(sample, centroids.T.tocsr())
+            membership = sparse.csr_matrix(
+                (np.ones(len(sample), dtype=np.float32), (assignment, np.arange(len(sample)))),
+                shape=(n_cells, len(sample))
+            )
+            sums = (membership @ vectors).tocsr()
+
+            # Reseed empty cells from random samples
+            empty = np.flatnonzero(np.diff(sums.indptr) == 0)
+            if len(empty):
+                sums = sparse.vstack([sums, vectors[rng.choice(len(sample), len(empty))]]).tocsr()
+                keep = np.setdiff1d(np.arange(n_cells), empty)
+                order = np.empty(n_cells, dtype=np.intp)
+                order[keep] = np.arange(len(keep))
+                order[empty] = n_cells + np.arange(len(empty))
+                sums = sums[order]
+
+            centroids = self._truncate_rows(sums)
+        return centroids
+
+    def _truncate_rows(self, matrix):
+        """Keep the CENTROID_TERMS heaviest terms of each row and L2-normalize"""
+        from scipy import sparse
+
+        data, indices, indptr = [], [], [0]
+        for row in range(matrix.shape[0]):
+            row_data = matrix.data[matrix.indptr[row]:matrix.indptr[row + 1]]
+            row_indices = matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]
+            if len(row_data) > CENTROID_TERMS:
+                top = np.argpartition(-row_data, CENTROID_TERMS - 1)[:CENTROID_TERMS]
+                row_data, row_indices = row_data[top], row_indices[top]
+            norm = np.sqrt(np.dot(row_data, row_data))
+            data.append(row_data / (norm if norm else 1.0))
+            indices.append(row_indices)
+            indptr.append(indptr[-1] + len(row_data))
+        return sparse.csr_matrix(
+            (np.concatenate(data).astype(np.float32), np.concatenate(indices), indptr),
+            shape=matrix.shape
+        )
+
+    def _index(self, rows):
+        """Assign rows to their nearest cell and queue them in the delta"""
+        if not self._n_cells:
+            self._refit()
+            return
+        rows = rows[self._row_end[rows] > self._row_start[rows]]
+        self._cell[rows] = self._nearest(rows)
+
+        end = self._n_delta + len(rows)
+        self._delta_rows = grow(self._delta_rows, end)
+        self._delta_rows[self._n_delta:end] = rows
+        self._n_delta = end
+
+        if self._n_delta > max(1024, 4 * int(np.sqrt(self._n_rows))):
+            self._build_cells()
+
+    def _build_cells(self):
+        """Group the indexed live rows by cell, folding in the delta"""
+        rows = np.flatnonzero((self._cell[:self._n_rows] >= 0) & self._live[:self._n_rows])
+        cells = self._cell[rows]
+        self._cell_rows = rows[np.argsort(cells, kind='stable')]
+        self._cell_offsets = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=self._n_cells))])
+        self._n_delta = 0
+
+    def _refit(self):
+        """Recompute IDF weights, cells and storage from the live rows"""
+        rows = np.flatnonzero(self._live[:self._n_rows])
+
+        # Compact the term storage into row order, dropping dead segments
+        starts = self._row_start[rows]
+        lengths = self._row_end[rows] - starts
+        positions = concat_ranges(starts, starts + lengths)
+        n_terms = len(positions)
+        self._indices = self._indices[positions]
+        self._counts = self._counts[positions]
+        self._weights = np.empty(n_terms, dtype=np.float32)
+        self._nnz = n_terms
+        self._row_start[:self._n_rows] = 0
+        self._row_end[:self._n_rows] = 0
+        self._row_end[rows] = np.cumsum(lengths)
+        self._row_start[rows] = self._row_end[rows] - lengths
+        self._weigh(rows)
+
+        # About sqrt(n) cells, trained on a sample of the non-empty rows
+        rows = rows[lengths > 0]
+        self._cell[:self._n_rows] = -1
+        rng = np.random.default_rng(self.seed)
+        n_cells = int(round(np.sqrt(len(rows))))
+        if n_cells:
+            sample_size = min(len(rows), n_cells * KMEANS_SAMPLE_PER_CELL)
+            sample = np.sort(rng.choice(rows, sample_size, replace=False))
+            centroids = self._kmeans(sample, n_cells, rng)
+            self._set_centroids(centroids.data, centroids.indices, centroids.indptr)
+            self._cell[rows] = self._nearest_bulk(rows, centroids.T.tocsr())
+        else:
+            self._set_centroids(np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int32),
+                                np.zeros(1, dtype=np.int32))
+
+        self._build_cells()
+        self._fitted_rows = self._n_rows
@@ -0,0 +1,272 @@
+"""
+Time-decayed trending scores
+
+Every interaction adds its weight to the gig's score, and scores decay
+exponentially with a configurable half-life. Decay is applied lazily: a
+score is stored as weight * exp(rate * (t - origin)) against a shared time
+origin, so recording an event never touches other gigs, and stored scores
+rank gigs the same way as their decayed values at any later time. The
+origin is moved forward (rescaling every stored score once) before the
+exponent could overflow. Every public method holds one lock, so recording
+and querying can happen on different threads.
+
+Because stored scores only ever grow, the top `capacity` gigs of each scope
+(all gigs, and each category) are kept in a small member set with a
+min-heap over it. A gig outside the set can never outrank its smallest
+member, so queries for up to `capacity` gigs read only the set. The server
+refuses negative interaction values; a negative weight recorded anyway
+rebuilds the lists of the gig's scopes.
+"""
+import heapq
+import itertools
+import math
+import threading
+import time
+
+# Default half-life of a trending score, in seconds
+DEFAULT_HALF_LIFE = 24 * 60 * 60
+
+# Gigs kept per trending list
+DEFAULT_CAPACITY = 100
+
+# Largest exponent allowed before the time origin is moved forward
+MAX_EXPONENT = 300.0
+
+
+class TrendingTracker:
+    def __init__(self, half_life=DEFAULT_HALF_LIFE, capacity=DEFAULT_CAPACITY, clock=time.time):
+        """
+        Initialize an empty tracker
+
+        Parameters:
+        - half_life: Seconds after which an event counts half as much
+        - capacity: Gigs kept per trending list (global and per category)
+        - clock: Function returning the current time in seconds
+        """
+        self.half_life = half_life
+        self.capacity = capacity
+        self._clock = clock
+        self._rate = math.log(2) / half_life
+        self._origin = None  # Time origin of the stored scores
+
+        self._scores = {}  # Gig id -> stored (undecayed) score
+        self._categories = {}  # Gig id -> category id
+        self._lists = {}  # Scope (None or category id) -> _TopList
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._scores)
+
+    def record(self, gig_id, weight, category_id=None, timestamp=None):
+        """
+        Add an interaction to a gig's score
+
+        Parameters:
+        - gig_id: Gig identifier
+        - weight: Interaction weight at the time of the event
+        - category_id: Category of the gig (for per-category lists)
+        - timestamp: Event time in seconds (default: now)
+        """
+        with self._lock:
+            if timestamp is None:
+                timestamp = self._clock()
+            if self._origin is None:
+                self._origin = timestamp
+            exponent = self._rate * (timestamp - self._origin)
+            if exponent > MAX_EXPONENT:
+                self._rebase(timestamp)
+                exponent = 0.0
+
+            if category_id is not None and self._categories.get(gig_id, category_id) != category_id:
+                self.set_category(gig_id, category_id)
+            score = self._scores.get(gig_id, 0.0) + weight * math.exp(exponent)
+            self._scores[gig_id] = score
+            if category_id is not None:
+                self._categories[gig_id] = category_id
+
+            category_id = self._categories.get(gig_id)
+            scopes = [None] if category_id is None else [None, category_id]
+            if weight < 0:
+                # A lowered score can fall below gigs left out of the lists
+                self._rebuild(scopes)
+            else:
+                for scope in scopes:
+                    self._list(scope).offer(gig_id, score)
+
+    def score(self, gig_id, now=None):
+        """Return a gig's decayed score at time now (default: the clock)"""
+        with self._lock:
+            stored = self._scores.get(gig_id)
+            if stored is None:
+                return 0.0
+            return stored * self._decay(now)
+
+    def top(self, n, category_id=None, now=None):
+        """
+        Return up to n (gig_id, decayed score) pairs, highest first
+
+        Parameters:
+        - n: Number of gigs
+        - category_id: Restrict to one category (default: all gigs)
+        - now: Time the scores are decayed to (default: the clock)
+        """
+        with self._lock:
+            if n <= self.capacity:
+                trending_list = self._lists.get(category_id)
+                ranked = trending_list.ranked() if trending_list else []
+            else:
+                # Longer than the kept lists: rank the whole scope
+                ranked = sorted(
+                    ((score, gig_id) for gig_id, score in self._scores.items()
+                     if category_id is None or self._categories.get(gig_id) == category_id),
+                    key=lambda entry: -entry[0]
+                )
+            decay = self._decay(now)
+            return [(gig_id, score * decay) for score, gig_id in ranked[:n]]
+
+    def remove(self, gig_ids):
+        """Forget gigs, e.g. ones removed from the catalog"""
+        with self._lock:
+            scopes = set()
+            for gig_id in gig_ids:
+                if self._scores.pop(gig_id, None) is not None:
+                    scopes.add(None)
+                category_id = self._categories.pop(gig_id, None)
+                if category_id is not None:
+                    scopes.add(category_id)
+            self._rebuild(scopes)
+
+    def set_category(self, gig_id, category_id):
+        """Move a gig to another category"""
+        with self._lock:
+            old_category_id = self._categories.get(gig_id)
+            if old_category_id == category_id or gig_id not in self._scores:
+                return
+            self._categories[gig_id] = category_id
+            self._rebuild({old_category_id, category_id} - {None})
+
+    def retain(self, category_of):
+        """
+        Re-map every tracked gig after a catalog reload
+
+        Parameters:
+        - category_of: Function returning a gig's category id, or None to drop it
+        """
+        with self._lock:
+            for gig_id in list(self._scores):
+                category_id = category_of(gig_id)
+                if category_id is None:
+                    del self._scores[gig_id]
+                    self._categories.pop(gig_id, None)
+                else:
+                    self._categories[gig_id] = category_id
+            self._lists = {}
+            self._rebuild({None} | set(self._categories.values()))
+
+    def state(self):
+        """Return (gig_ids, stored scores, category ids or -1, scalars) for snapshotting"""
+        with self._lock:
+            gig_ids = list(self._scores)
+            scores = [self._scores[gig_id] for gig_id in gig_ids]
+            categories = [self._categories.get(gig_id, -1) for gig_id in gig_ids]
+            scalars = {'half_life': self.half_life, 'capacity': self.capacity, 'origin': self._origin}
+            return gig_ids, scores, categories, scalars
+
+    @classmethod
+    def from_state(cls, gig_ids, scores, categories, scalars, clock=time.time):
+        """Rebuild a tracker from state()"""
+        tracker = cls(scalars['half_life'], scalars['capacity'], clock)
+        tracker._origin = scalars['origin']
+        tracker._scores = dict(zip(gig_ids, scores))
+        tracker._categories = {gig_id: category_id for gig_id, category_id in zip(gig_ids, categories)
+                               if category_id >= 0}
+        tracker._rebuild({None} | set(tracker._categories.values()))
+        return tracker
+
+    def _decay(self, now):
+        if self._origin is None:
+            return 1.0
+        if now is None:
+            now = self._clock()
+        return math.exp(-self._rate * (now - self._origin))
+
+    def _rebase(self, timestamp):
+        """Move the time origin to timestamp, rescaling every stored score"""
+        factor = math.exp(-self._rate * (timestamp - self._origin))
+        for gig_id in self._scores:
+            self._scores[gig_id] *= factor
+        for trending_list in self._lists.values():
+            trending_list.scale(factor)
+        self._origin = timestamp
+
+    def _list(self, scope):
+        trending_list = self._lists.get(scope)
+        if trending_list is None:
+            trending_list = self._lists[scope] = _TopList(self.capacity)
+        return trending_list
+
+    def _rebuild(self, scopes):
+        """Refill the lists of scopes from the stored scores"""
+        for scope in scopes:
+            members = ((gig_id, score) for gig_id, score in self._scores.items()
+                       if scope is None or self._categories.get(gig_id) == scope)
+            self._lists[scope] = _TopList.from_scores(self.capacity, members)
+
+
+class _TopList:
+    """The capacity highest-scored gigs of one scope, for scores that only grow"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._members = {}  # Gig id -> score
+        # (score, sequence, gig id), with stale entries for updated members;
+        # the sequence number keeps gig ids of mixed types from being compared
+        self._heap = []
+        self._sequence = itertools.count()
+
+    @classmethod
+    def from_scores(cls, capacity, scores):
+        top_list = cls(capacity)
+        top = heapq.nlargest(capacity, scores, key=lambda entry: entry[1])
+        top_list._members = dict(top)
+        top_list._reheap()
+        return top_list
+
+    def offer(self, gig_id, score):
+        """Record a gig's new (higher) score"""
+        if gig_id in self._members:
+            self._members[gig_id] = score
+        elif len(self._members) < self.capacity:
+            self._members[gig_id] = score
+        else:
+            self._drop_stale()
+            if score <= self._heap[0][0]:
+                return
+            _, _, evicted = heapq.heappop(self._heap)
+            del self._members[evicted]
+            self._members[gig_id] = score
+        heapq.heappush(self._heap, (score, next(self._sequence), gig_id))
+
+        # Old entries of updated members pile up; rebuild now and then
+        if len(self._heap) > 4 * self.capacity:
+            self._reheap()
+
+    def ranked(self):
+        """Return (score, gig id) for every member, highest first"""
+        return sorted(((score, gig_id) for gig_id, score in self._members.items()), key=lambda entry: -entry[0])
+
+    def scale(self, factor):
+        self._members = {gig_id: score * factor for gig_id, score in self._members.items()}
+        self._reheap()
+
+    def _reheap(self):
+        self._heap = [(score, next(self._sequence), gig_id) for gig_id, score in self._members.items()]
+        heapq.heapify(self._heap)
+
+    def _drop_stale(self):
+        """Pop heap entries that no longer match a member's score"""
+        while self._heap:
+            score, _, gig_id = self._heap[0]
+            if self._members.get(gig_id) == score:
+                return
+            heapq.heappop(self._heap)
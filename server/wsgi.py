@@ -0,0 +1,25 @@
+"""
+WSGI entry point for prefork servers
+
+    gunicorn -c gunicorn.conf.py
+
+Importing this module builds the recommender (memory-mapped from
+MODEL_SNAPSHOT_DIR when set) and replays the interaction log. With
+preload_app the gunicorn master does that once and forks the workers from
+it, so the gig matrices, text index and id lookups are shared copy-on-write
+instead of being loaded once per worker.
+"""
+import gc
+import os
+
+# Tells app.py to share the interaction log and leave threads to start_worker()
+os.environ.setdefault('PREFORK', 'true')
+
+from app import app  # noqa: E402,F401
+
+# Move every object loaded so far to the permanent generation. Garbage
+# collections in the workers then never write to their GC headers, which
+# would copy the pages holding them into every worker. (Reference count
+# updates still copy the pages of objects a worker touches; the NumPy
+# buffers holding the bulk of the model are not affected by either.)
+gc.freeze()